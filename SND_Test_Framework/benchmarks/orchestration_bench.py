@@ -0,0 +1,390 @@
+"""
+Orchestration benchmark against simulated DUTs and remotes.
+
+Puts stand-ins for ssh, scp and attenuator_cli (see sim_remote.py) first on
+PATH and runs main.per_dut_worker with every tests/*.run_test for groups of
+1, 8, 64 and 256 DUTs. Each (test, DUT count) case runs in a fresh
+interpreter, so module state and resource peaks do not leak between cases.
+
+Reported per case:
+  wall_s              group start to last DUT finished (archives excluded)
+  archive_wait_s      time spent waiting for the background archives after that
+  dut_s               per-DUT worker wall time (mean/p50/p95/max)
+  overhead_per_dut_s  worker wall time minus the simulated remote latency
+                      spent by that DUT's own commands, averaged over DUTs
+  marginal_per_dut_s  (wall_s - wall_s at 1 DUT) / (N - 1), per test
+  peaks               threads, child processes and open fds (sampled)
+  calls               ssh/scp/attenuator invocations, ssh masters opened,
+                      failures injected
+Results are written as JSON. With --baseline, cases whose wall time or
+overhead grew by more than --tolerance are reported and the exit code is 1.
+
+    python benchmarks/orchestration_bench.py --duts 1,8,64 --tests tcp,join
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAMEWORK_DIR = os.path.dirname(BENCH_DIR)
+RESULT_MARKER = "@@BENCH_RESULT"
+TOOLS = ("ssh", "scp", "attenuator_cli")
+DEFAULT_DUTS = "1,8,64,256"
+
+
+def make_fake_bin(bin_dir: str):
+    """Writes ssh/scp/attenuator_cli wrappers that start sim_remote with a minimal interpreter."""
+    os.makedirs(bin_dir, exist_ok=True)
+    for tool in TOOLS:
+        path = os.path.join(bin_dir, tool)
+        with open(path, "w") as f:
+            f.write(f"#!{sys.executable} -S\n"
+                    f"import sys\nsys.path.insert(0, {BENCH_DIR!r})\nimport sim_remote\nsim_remote.main()\n")
+        os.chmod(path, 0o755)
+
+
+def sim_env(args, sim_dir: str, bin_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "PATH": bin_dir + os.pathsep + env.get("PATH", ""),
+        "SND_SIM_DIR": sim_dir,
+        "SND_SIM_LATENCY_MS": str(args.latency_ms),
+        "SND_SIM_JITTER": str(args.jitter),
+        "SND_SIM_FAIL_RATE": str(args.fail_rate),
+        "SND_SIM_OUTPUT_BYTES": str(args.output_bytes),
+        "SND_SIM_SCP_BYTES": str(args.scp_bytes),
+        "SND_SIM_TIME_SCALE": str(args.time_scale),
+    })
+    return env
+
+
+# ---- inside the case process ---------------------------------------------------------
+
+class ResourceSampler:
+    """Samples thread, child process and fd counts of this process every interval_s."""
+
+    def __init__(self, interval_s: float = 0.05):
+        self.interval_s = interval_s
+        self.peaks = {"threads": 0, "children": None, "fds": None}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-sampler", daemon=True)
+
+    @staticmethod
+    def _children() -> int:
+        me = str(os.getpid())
+        count = 0
+        for pid in os.listdir("/proc"):
+            if pid.isdigit():
+                try:
+                    with open(f"/proc/{pid}/stat") as f:
+                        # ppid is the 2nd field after the parenthesised command name
+                        if f.read().rsplit(")", 1)[1].split()[1] == me:
+                            count += 1
+                except (OSError, IndexError):
+                    continue
+        return count
+
+    def sample(self):
+        self.peaks["threads"] = max(self.peaks["threads"], threading.active_count())
+        fd_dir = "/proc/self/fd" if os.path.isdir("/proc/self/fd") else "/dev/fd"
+        try:
+            self.peaks["fds"] = max(self.peaks["fds"] or 0, len(os.listdir(fd_dir)))
+        except OSError:
+            pass
+        if os.path.isdir("/proc"):
+            self.peaks["children"] = max(self.peaks["children"] or 0, self._children())
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.sample()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def case_params(traffic_type: str, duts: list, remote: str) -> dict:
+    return {
+        "Test_Type": f"bench_{traffic_type}",
+        "TrafficType": traffic_type,
+        "dut": ",".join(duts),
+        "controller_ip": remote,
+        "Skipped_Execution": "",
+        "User": "root",
+        "ap_wifi_ssid": "bench",
+        "ap_wifi_pwd": "benchpass",
+        "ap_wifi_sec": "wpa2",
+        "TrafficDirection": "DL",
+        "test_cycle_count": 1,
+        "join_attempts": 2,
+        "join_timeout": 5,
+        "start_attn_1": 0,
+        "stop_attn_1": 2,
+        "attn_step_dB": 1,
+        "sniffer_channels": "",
+    }
+
+
+def run_case(traffic_type: str, n_duts: int, mode: str, log_root: str, trace: bool = False) -> dict:
+    """Runs one group of n_duts through per_dut_worker in this process; returns the case metrics."""
+    sys.path.insert(0, FRAMEWORK_DIR)
+    import logging
+    import logger_config
+    import main as framework
+    from utils import archive_utils, ssh_session, tracing
+
+    logger_config.setup_logging(os.path.join(log_root, "testExecOutput.log"), level=logging.INFO, queued=True)
+    ssh_session.configure(enabled=True, idle_timeout_s=300)
+    archive_utils.get_archiver(codec="gzip")
+    tracing.enable(trace)
+
+    duts = [f"10.{100 + i // 250}.{i // 250 % 250}.{i % 250 + 1}" for i in range(n_duts)]
+    remote = "10.250.0.1"
+    params = case_params(traffic_type, duts, remote)
+    global_flags = {
+        "test_log_folder": log_root,
+        "enable_attenuator": True,
+        "enable_tcpdump": True,
+        "enable_sniffer": False,
+        "ssh_multiplexing": True,
+    }
+    dut_s = {}
+    errors = []
+
+    def worker(dut, barrier):
+        t0 = time.perf_counter()
+        try:
+            framework.per_dut_worker(dut, [remote], params, global_flags, [], {}, barrier)
+        except Exception as e:
+            errors.append(f"{dut}: {e!r}")
+        dut_s[dut] = time.perf_counter() - t0
+
+    with ResourceSampler() as sampler:
+        t0 = time.perf_counter()
+        if mode == "async":
+            from utils import async_engine
+            group = {"name": params["Test_Type"], "duts": duts, "remotes": [remote], "params": params}
+
+            def timed_worker(dut, remotes, p, flags, sniffers, sniffer_params, barrier):
+                worker(dut, barrier)
+
+            engine = async_engine.AsyncEngine(async_engine.DEFAULT_MAX_CONCURRENCY, async_engine.DEFAULT_MAX_COMMANDS,
+                                              async_engine.DEFAULT_PER_HOST_LIMIT)
+            engine.run([group], timed_worker, (global_flags, [], {}))
+        else:
+            barrier = threading.Barrier(n_duts)
+            threads = [threading.Thread(target=worker, args=(d, barrier), name=f"dut-{d}") for d in duts]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        wall = time.perf_counter() - t0
+        archives = archive_utils.shutdown_archiver()
+        archive_wait = time.perf_counter() - t0 - wall
+        sampler.sample()
+
+    pool = ssh_session.get_pool()
+    pool_stats = pool.stats()
+    pool.close_all()
+    logger_config.shutdown_logging()
+    durations = sorted(dut_s.values())
+    slowest_steps = {}
+    if trace:
+        steps = tracing.summary()["steps"]
+        slowest_steps = dict(sorted(steps.items(), key=lambda kv: -kv[1]["total_s"])[:10])
+    return {
+        "wall_s": round(wall, 3),
+        "archive_wait_s": round(archive_wait, 3),
+        "archives": len(archives),
+        "dut_s": {
+            "mean": round(statistics.mean(durations), 3),
+            "p50": round(durations[len(durations) // 2], 3),
+            "p95": round(durations[min(len(durations) - 1, int(0.95 * len(durations)))], 3),
+            "max": round(durations[-1], 3),
+        },
+        "dut_durations": {d: round(s, 4) for d, s in dut_s.items()},
+        "peaks": sampler.peaks,
+        "pool": pool_stats,
+        "errors": errors,
+        "slowest_steps": slowest_steps,
+    }
+
+
+def case_main(argv: list):
+    traffic_type, n_duts, mode, log_root, trace = argv[0], int(argv[1]), argv[2], argv[3], argv[4] == "1"
+    os.chdir(log_root)
+    result = run_case(traffic_type, n_duts, mode, log_root, trace)
+    sys.stdout.write(f"\n{RESULT_MARKER} {json.dumps(result)}\n")
+    sys.stdout.flush()
+
+
+# ---- parent --------------------------------------------------------------------------
+
+def read_calls(sim_dir: str) -> list:
+    path = os.path.join(sim_dir, "calls.log")
+    calls = []
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 5:
+                    calls.append((float(parts[0]), parts[1], parts[2], float(parts[3]), int(parts[4])))
+    return calls
+
+
+def summarize_calls(calls: list) -> dict:
+    counts = {}
+    for _, tool, _, _, rc in calls:
+        counts[tool] = counts.get(tool, 0) + 1
+    return {
+        "ssh": counts.get("ssh", 0),
+        "scp": counts.get("scp", 0),
+        "attenuator_cli": counts.get("attenuator_cli", 0),
+        "ssh_masters": counts.get("ssh-master", 0),
+        "failed": sum(1 for c in calls if c[4] not in (0, 1) and c[1] in ("ssh", "scp")),
+    }
+
+
+def run_one(args, traffic_type: str, n_duts: int, bin_dir: str) -> dict:
+    with tempfile.TemporaryDirectory(prefix="snd_bench_") as work:
+        sim_dir = os.path.join(work, "sim")
+        log_root = os.path.join(work, "logs")
+        os.makedirs(sim_dir)
+        os.makedirs(log_root)
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--_case", traffic_type, str(n_duts), args.mode, log_root,
+             "1" if args.trace else "0"],
+            env=sim_env(args, sim_dir, bin_dir), capture_output=True, text=True, timeout=args.case_timeout
+        )
+        total = time.perf_counter() - t0
+        result = None
+        for line in reversed(proc.stdout.splitlines()):
+            if line.startswith(RESULT_MARKER):
+                result = json.loads(line[len(RESULT_MARKER):])
+                break
+        if result is None:
+            return {"test": traffic_type, "duts": n_duts, "ok": False, "returncode": proc.returncode,
+                    "stderr": proc.stderr.strip()[-1000:]}
+        calls = read_calls(sim_dir)
+        # Simulated latency each DUT spent in its own remote calls (collectors may overlap)
+        remote_s = {}
+        for _, tool, host, slept, _ in calls:
+            remote_s[host] = remote_s.get(host, 0.0) + slept
+        durations = result.pop("dut_durations")
+        overheads = [max(0.0, s - remote_s.get(d, 0.0)) for d, s in durations.items()]
+        result.update({
+            "test": traffic_type,
+            "duts": n_duts,
+            "ok": proc.returncode == 0 and not result["errors"],
+            "process_s": round(total, 3),
+            "calls": summarize_calls(calls),
+            "overhead_per_dut_s": round(statistics.mean(overheads), 3) if overheads else 0.0,
+        })
+        return result
+
+
+def add_marginals(results: list):
+    single = {r["test"]: r["wall_s"] for r in results if r.get("duts") == 1 and "wall_s" in r}
+    for r in results:
+        if "wall_s" in r and r["duts"] > 1 and r["test"] in single:
+            r["marginal_per_dut_s"] = round((r["wall_s"] - single[r["test"]]) / (r["duts"] - 1), 4)
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """Returns regression messages for cases slower than the baseline by more than tolerance."""
+    with open(baseline_path) as f:
+        baseline = {(r["test"], r["duts"]): r for r in json.load(f)["results"] if "wall_s" in r}
+    regressions = []
+    for r in results:
+        base = baseline.get((r["test"], r["duts"]))
+        if not base or "wall_s" not in r:
+            continue
+        for key in ("wall_s", "overhead_per_dut_s"):
+            old, new = base.get(key), r.get(key)
+            if old and new is not None and new > old * (1 + tolerance) and new - old > 0.05:
+                regressions.append(f"{r['test']} x{r['duts']}: {key} {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100:.0f}%)")
+        for key in ("ssh", "scp"):
+            old, new = base.get("calls", {}).get(key), r.get("calls", {}).get(key)
+            if old is not None and new is not None and new > old * (1 + tolerance):
+                regressions.append(f"{r['test']} x{r['duts']}: {key} calls {old} -> {new}")
+    return regressions
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--_case":
+        return case_main(sys.argv[2:])
+
+    sys.path.insert(0, FRAMEWORK_DIR)
+    import tests
+
+    parser = argparse.ArgumentParser(description="Benchmark framework orchestration against simulated DUTs")
+    parser.add_argument("--duts", default=DEFAULT_DUTS, help=f"Comma-separated group sizes (default {DEFAULT_DUTS})")
+    parser.add_argument("--tests", default="all", help="Comma-separated TrafficTypes, or 'all' (default)")
+    parser.add_argument("--mode", choices=["threads", "async"], default="threads")
+    parser.add_argument("--latency_ms", type=float, default=20, help="Mean simulated command latency")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Lognormal sigma of the latency")
+    parser.add_argument("--fail_rate", type=float, default=0.0, help="Fraction of ssh/scp calls that fail")
+    parser.add_argument("--output_bytes", type=int, default=256, help="Stdout size of generic commands")
+    parser.add_argument("--scp_bytes", type=int, default=64 * 1024, help="Size of pulled files and captures")
+    parser.add_argument("--time_scale", type=float, default=0.01, help="Scale of on-device durations (iperf -t)")
+    parser.add_argument("--trace", action="store_true", help="Record spans and report each case's slowest steps")
+    parser.add_argument("--case_timeout", type=float, default=1800)
+    parser.add_argument("--output", default="orchestration_bench.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", default=None, help="Earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown vs baseline")
+    args = parser.parse_args()
+
+    traffic_types = sorted(tests.discover()) if args.tests == "all" else [t.strip() for t in args.tests.split(",")]
+    sizes = [int(n) for n in args.duts.split(",") if n.strip()]
+
+    bin_dir = tempfile.mkdtemp(prefix="snd_bench_bin_")
+    make_fake_bin(bin_dir)
+    results = []
+    try:
+        for traffic_type in traffic_types:
+            for n in sizes:
+                r = run_one(args, traffic_type, n, bin_dir)
+                results.append(r)
+                if "wall_s" in r:
+                    print(f"{'OK  ' if r['ok'] else 'FAIL'} {traffic_type:<9} x{n:<4} wall {r['wall_s']:7.2f}s  "
+                          f"dut p95 {r['dut_s']['p95']:6.2f}s  overhead/DUT {r['overhead_per_dut_s']:.3f}s  "
+                          f"ssh {r['calls']['ssh']:6d}  threads {r['peaks']['threads']:4d}  "
+                          f"children {r['peaks']['children']}  fds {r['peaks']['fds']}")
+                    for key, st in r["slowest_steps"].items():
+                        print(f"     {key:<40} {st['count']:5d}x  total {st['total_s']:8.2f}s  max {st['max_s']:.2f}s")
+                    for err in r["errors"][:3]:
+                        print(f"     {err}")
+                else:
+                    print(f"FAIL {traffic_type:<9} x{n:<4} exited {r['returncode']}: {r['stderr'][-300:]}")
+    finally:
+        shutil.rmtree(bin_dir, ignore_errors=True)
+    add_marginals(results)
+
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}
+    with open(args.output, "w") as f:
+        json.dump({"python": sys.version.split()[0], "cpus": os.cpu_count(), "config": config,
+                   "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    failed = [r for r in results if not r["ok"]]
+    regressions = compare(results, args.baseline, args.tolerance) if args.baseline else []
+    for msg in regressions:
+        print(f"REGRESSION {msg}")
+    sys.exit(1 if failed or regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+Local stand-ins for ssh, scp and attenuator_cli, used by orchestration_bench.
+
+Nothing is ever executed: each remote command is matched against the few
+shapes the framework sends (RemoteBatch scripts, iperf3 clients, capture
+streams, background loops, pgrep/lsof checks, ...) and answered with output
+the framework can parse, after a simulated latency. Every other command
+succeeds with --output_bytes of filler.
+
+iperf3 servers (-D) and running clients are kept in a per-host process table
+under SND_SIM_DIR/procs, so pgrep/pkill -f and listening checks answer the
+way a real host would, including pgrep's pattern matching the `sh -c` that
+runs it.
+
+Behaviour comes from the environment set by the harness:
+  SND_SIM_DIR          state folder (call log, open ssh masters)
+  SND_SIM_LATENCY_MS   mean per-command latency
+  SND_SIM_JITTER       relative latency spread (lognormal sigma)
+  SND_SIM_FAIL_RATE    probability a command fails like a dropped connection
+  SND_SIM_OUTPUT_BYTES filler stdout size of generic commands
+  SND_SIM_SCP_BYTES    size of files pulled by scp or streamed captures
+  SND_SIM_TIME_SCALE   factor applied to on-device durations (iperf -t)
+
+One interpreter starts per simulated command, so only cheap modules are
+imported up front; the rest load in the handlers that need them.
+"""
+import math
+import os
+import random
+import sys
+import time
+
+STEP_MARKER = "@@SND_STEP"
+META_MARKER = "@@SND_META"
+
+
+def _env(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+SIM_DIR = os.environ.get("SND_SIM_DIR", "/tmp/snd_sim")
+LATENCY_S = _env("SND_SIM_LATENCY_MS", 20) / 1000
+JITTER = _env("SND_SIM_JITTER", 0.3)
+FAIL_RATE = _env("SND_SIM_FAIL_RATE", 0.0)
+OUTPUT_BYTES = int(_env("SND_SIM_OUTPUT_BYTES", 256))
+SCP_BYTES = int(_env("SND_SIM_SCP_BYTES", 64 * 1024))
+TIME_SCALE = _env("SND_SIM_TIME_SCALE", 0.01)
+
+
+def _log_call(tool: str, host: str, slept_s: float, rc: int):
+    """One line per invocation; O_APPEND keeps concurrent writers from interleaving."""
+    line = f"{time.time():.6f} {tool} {host} {slept_s:.6f} {rc}\n".encode()
+    os.makedirs(SIM_DIR, exist_ok=True)
+    fd = os.open(os.path.join(SIM_DIR, "calls.log"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def _latency() -> float:
+    if LATENCY_S <= 0:
+        return 0.0
+    return LATENCY_S * math.exp(random.gauss(0, JITTER) - JITTER ** 2 / 2)
+
+
+def _filler(n: int) -> str:
+    line = "simulated output line\n"
+    return (line * (n // len(line) + 1))[:n]
+
+
+# ---- process table ---------------------------------------------------------------------
+
+def _procs_dir(host: str) -> str:
+    return os.path.join(SIM_DIR, "procs", host)
+
+
+def _spawn(host: str, cmdline: str, owner: int = 0) -> str:
+    """Registers a simulated process; owner is the sim PID that ends it (0: a daemon, until pkill)."""
+    path = os.path.join(_procs_dir(host), f"{os.getpid()}_{time.time_ns()}")
+    os.makedirs(_procs_dir(host), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(f"{owner}\n{cmdline}")
+    return path
+
+
+def _reap(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _processes(host: str) -> list:
+    """[(path, owner, cmdline)] of live simulated processes on host."""
+    live = []
+    try:
+        names = os.listdir(_procs_dir(host))
+    except OSError:
+        return live
+    for name in names:
+        path = os.path.join(_procs_dir(host), name)
+        try:
+            with open(path) as f:
+                owner, _, cmdline = f.read().partition("\n")
+        except OSError:
+            continue
+        owner = int(owner or 0)
+        if owner:
+            try:
+                os.kill(owner, 0)
+            except OSError:                         # its sim process is gone
+                _reap(path)
+                continue
+        live.append((path, owner, cmdline))
+    return live
+
+
+def _pattern(command: str) -> str:
+    import shlex
+    words = shlex.split(command.split(">")[0])
+    return words[words.index("-f") + 1] if "-f" in words[:-1] else words[-1]
+
+
+def _pgrep(host: str, command: str) -> int:
+    """Like pgrep -f: the pattern is matched against live processes and the shell running it."""
+    import re
+    pattern = re.compile(_pattern(command))
+    cmdlines = [c for _, _, c in _processes(host)] + [f"sh -c {command}"]
+    return 0 if any(pattern.search(c) for c in cmdlines) else 1
+
+
+def _pkill(host: str, command: str) -> int:
+    import re
+    import signal
+    pattern = re.compile(_pattern(command))
+    killed = 0
+    for path, owner, cmdline in _processes(host):
+        if pattern.search(cmdline):
+            if owner:
+                try:
+                    os.kill(owner, signal.SIGTERM)
+                except OSError:
+                    pass
+            _reap(path)
+            killed += 1
+    return 0 if killed else 1
+
+
+def _listening(host: str, command: str) -> int:
+    port = command.split("-iTCP:")[1].split()[0]
+    servers = [c for _, _, c in _processes(host) if " -s " in f" {c} " and f"-p {port} " in f"{c} "]
+    return 0 if servers else 1
+
+
+# ---- iperf3 ------------------------------------------------------------------------
+
+def _iperf_args(command: str) -> dict:
+    words = command.split()
+
+    def value(flag, default):
+        i = words.index(flag) if flag in words else -1
+        return int(words[i + 1]) if 0 <= i < len(words) - 1 and words[i + 1].isdigit() else default
+
+    return {
+        "duration": value("-t", 10),
+        "udp": "-u" in words,
+        "bidir": "--bidir" in words,
+        "parallel": value("-P", 1),
+    }
+
+
+def _iperf_interval(i: int, a: dict) -> dict:
+    bps = random.uniform(300e6, 600e6)
+    s = {"start": float(i), "end": float(i + 1), "seconds": 1.0, "bytes": int(bps / 8), "bits_per_second": bps}
+    if a["udp"]:
+        s.update(jitter_ms=random.uniform(0.01, 0.5), lost_packets=0, packets=int(bps / 8 / 1448))
+    else:
+        s["retransmits"] = random.randint(0, 3)
+    streams = [dict(s, socket=5 + n, snd_cwnd=random.randint(100000, 900000), sender=True)
+               for n in range(a["parallel"])]
+    iv = {"streams": streams, "sum": s}
+    if a["bidir"]:
+        iv["sum_bidir_reverse"] = dict(s)
+        iv["streams"] += [dict(st, sender=False) for st in streams]
+    return iv
+
+
+def _iperf_doc(a: dict) -> dict:
+    intervals = [_iperf_interval(i, a) for i in range(a["duration"])]
+    bps = sum(iv["sum"]["bits_per_second"] for iv in intervals) / max(1, len(intervals))
+    total = {"seconds": float(a["duration"]), "bytes": int(bps / 8 * a["duration"]), "bits_per_second": bps}
+    end = {"sum_sent": dict(total, retransmits=2), "sum_received": dict(total),
+           "streams": [{"sender": {"max_snd_cwnd": 800000}}]}
+    if a["udp"]:
+        end["sum"] = dict(total, jitter_ms=0.1, lost_packets=0, packets=1000, lost_percent=0.0)
+    if a["bidir"]:
+        end["sum_sent_bidir_reverse"] = dict(total)
+        end["sum_received_bidir_reverse"] = dict(total)
+    return {"start": {"test_start": {"protocol": "UDP" if a["udp"] else "TCP", "duration": a["duration"]}},
+            "intervals": intervals, "end": end}
+
+
+def _iperf_client(command: str, out, host: str = "?"):
+    proc = _spawn(host, command.strip(), owner=os.getpid())
+    try:
+        return _run_iperf_client(command, out)
+    finally:
+        _reap(proc)
+
+
+def _run_iperf_client(command: str, out):
+    import json
+    a = _iperf_args(command)
+    doc = _iperf_doc(a)
+    step = a["duration"] * TIME_SCALE / max(1, len(doc["intervals"]))
+    if "--json-stream" in command:
+        out.write(json.dumps({"event": "start", "data": doc["start"]}) + "\n")
+        for iv in doc["intervals"]:
+            time.sleep(step)
+            out.write(json.dumps({"event": "interval", "data": iv}) + "\n")
+            out.flush()
+        out.write(json.dumps({"event": "end", "data": doc["end"]}) + "\n")
+    else:
+        time.sleep(step * len(doc["intervals"]))
+        out.write(json.dumps(doc) + "\n")
+    return 0
+
+
+# ---- other command shapes ------------------------------------------------------------
+
+def _batch(command: str, out) -> int:
+    """Answers a RemoteBatch script: BEGIN/END markers per step, all succeeding."""
+    steps = command.count(') 2>"$__snd_e"')
+    for i in range(steps):
+        t = time.time()
+        out.write(f"\n{STEP_MARKER} {i} BEGIN {t:.6f}\n")
+        out.write(f"\n{STEP_MARKER} {i} END 0 {t + 0.001:.6f}\n")
+    return 0
+
+
+def _stream_capture(out) -> int:
+    """Answers capture_transfer's compress-and-stream command with a gzip payload and its metadata."""
+    import gzip
+    import hashlib
+    data = os.urandom(min(SCP_BYTES, 4096)) * max(1, SCP_BYTES // 4096)
+    sys.stderr.write(f"{META_MARKER} {len(data)} {hashlib.sha256(data).hexdigest()}\n")
+    out.flush()
+    sys.stdout.buffer.write(gzip.compress(data, compresslevel=1))
+    return 0
+
+
+def _status_tail(out) -> int:
+    """Answers the wlan_status follower with a few timestamped `airport -I` blocks."""
+    now = int(time.time())
+    for t in range(now - 2, now + 1):
+        out.write(f"@@TS {t}\n     agrCtlRSSI: -{random.randint(40, 70)}\n     agrCtlNoise: -92\n"
+                  f"     lastTxRate: {random.randint(200, 1200)}\n     maxRate: 1200\n"
+                  f"     BSSID: aa:bb:cc:dd:ee:ff\n     channel: 36,80\n     MCS: 9\n     NSS: 2\n\n")
+    return 0
+
+
+def respond(command: str, out, host: str = "?") -> int:
+    stripped = command.lstrip()
+    if STEP_MARKER in command:
+        return _batch(command, out)
+    if META_MARKER in command:
+        return _stream_capture(out)
+    if stripped.startswith("pgrep"):
+        return _pgrep(host, command)
+    if stripped.startswith("pkill -f ") and ";" not in command:
+        return _pkill(host, command)
+    if stripped.startswith("lsof -nP -iTCP:"):
+        return _listening(host, command)
+    if "iperf3 -c " in command:
+        return _iperf_client(command, out, host)
+    if stripped.startswith("iperf3 ") and " -s " in command and command.rstrip().endswith("-D"):
+        _spawn(host, " ".join(stripped.split()))
+        return 0
+    if command.startswith("tail -c +"):
+        return _status_tail(out)
+    if "Time::HiRes" in command:
+        out.write(f"{time.time():.6f}\n")
+        return 0
+    if command.rstrip().endswith("echo $!"):
+        out.write(f"{random.randint(1000, 60000)}\n")
+        return 0
+    if "iw reg get" in command:
+        out.write("US\n")
+        return 0
+    out.write(_filler(OUTPUT_BYTES))
+    return 0
+
+
+# ---- entry points ----------------------------------------------------------------------
+
+def _ssh(argv: list) -> int:
+    args, target, i = [], None, 0
+    control = None
+    while i < len(argv):
+        a = argv[i]
+        if a in ("-o", "-p", "-i", "-l", "-F", "-O"):
+            if a == "-O":
+                control = argv[i + 1]
+            i += 2
+            continue
+        if a.startswith("-"):
+            i += 1
+            continue
+        target = a
+        args = argv[i + 1:]
+        break
+    host = (target or "?").split("@")[-1]
+    masters = os.path.join(SIM_DIR, "masters")
+    if control is not None:
+        # ssh -O check / -O exit against a simulated master connection
+        path = os.path.join(masters, host)
+        if control == "exit" and os.path.exists(path):
+            os.remove(path)
+            return 0
+        return 0 if os.path.exists(path) else 255
+    if "-M" in argv:
+        os.makedirs(masters, exist_ok=True)
+        open(os.path.join(masters, host), "w").close()
+        time.sleep(_latency() * 3)                  # a handshake costs a few round trips
+        _log_call("ssh-master", host, 0, 0)
+        return 0
+
+    slept = _latency()
+    time.sleep(slept)
+    if random.random() < FAIL_RATE:
+        sys.stderr.write(f"ssh: connect to host {host} port 22: Connection timed out\n")
+        _log_call("ssh", host, slept, 255)
+        return 255
+    rc = respond(" ".join(args), sys.stdout, host)
+    sys.stdout.flush()
+    _log_call("ssh", host, slept, rc)
+    return rc
+
+
+def _scp(argv: list) -> int:
+    paths = [a for a in argv if not a.startswith("-")]
+    # Drop the values of options that take one
+    for opt in ("-o", "-P", "-i", "-F"):
+        while opt in argv:
+            j = argv.index(opt)
+            if j + 1 < len(argv) and argv[j + 1] in paths:
+                paths.remove(argv[j + 1])
+            argv = argv[:j] + argv[j + 2:]
+    src, dest = paths[-2], paths[-1]
+    host, _, remote_path = src.partition(":")
+    host = host.split("@")[-1]
+    slept = _latency()
+    time.sleep(slept)
+    if random.random() < FAIL_RATE:
+        sys.stderr.write(f"ssh: connect to host {host} port 22: Connection timed out\n")
+        _log_call("scp", host, slept, 1)
+        return 1
+    if dest.endswith("/") or os.path.isdir(dest):
+        dest = os.path.join(dest, os.path.basename(remote_path).replace("*", "sim"))
+    with open(dest, "wb") as f:
+        f.write(b"\0" * SCP_BYTES)
+    _log_call("scp", host, slept, 0)
+    return 0
+
+
+def _attenuator(argv: list) -> int:
+    slept = _latency()
+    time.sleep(slept)
+    _log_call("attenuator_cli", "attenuator", slept, 0)
+    return 0
+
+
+def main():
+    tool = os.path.basename(sys.argv[0])
+    handler = {"ssh": _ssh, "scp": _scp, "attenuator_cli": _attenuator}.get(tool)
+    if handler is None:
+        sys.stderr.write(f"sim_remote: unknown tool {tool}\n")
+        sys.exit(127)
+    sys.exit(handler(sys.argv[1:]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Startup-time benchmark for the CLI.
+
+Times three startup paths of main.py in fresh interpreters:
+  help      - `main.py --help`
+  validate  - `--validate_only --no_cache` (full workbook parse + registry check)
+  cached    - `--validate_only` against the cached compiled plan
+
+Each case is run --repeat times and the median is compared against its
+budget. Results are printed and written as JSON; the exit code is 1 if any
+case is over budget or fails, so this can gate CI.
+
+    python benchmarks/startup_bench.py -e Configurations_updated.xlsx
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+FRAMEWORK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(FRAMEWORK_DIR, "main.py")
+
+# Median wall-clock budgets in seconds
+DEFAULT_BUDGETS = {"help": 0.5, "validate": 2.0, "cached": 0.6}
+
+
+def time_run(args: list, cwd: str) -> tuple:
+    """Runs main.py with args in a fresh interpreter; returns (seconds, returncode, stderr tail)."""
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, MAIN] + args, cwd=cwd, capture_output=True, text=True)
+    return time.perf_counter() - t0, proc.returncode, proc.stderr.strip()[-500:]
+
+
+def run_case(name: str, args: list, budget_s: float, repeat: int, cwd: str) -> dict:
+    samples, rc, err = [], 0, ""
+    for _ in range(repeat):
+        elapsed, rc, err = time_run(args, cwd)
+        samples.append(elapsed)
+        if rc != 0:
+            break
+    median = statistics.median(samples)
+    return {
+        "case": name,
+        "args": args,
+        "runs": len(samples),
+        "median_s": round(median, 4),
+        "min_s": round(min(samples), 4),
+        "max_s": round(max(samples), 4),
+        "budget_s": budget_s,
+        "returncode": rc,
+        "ok": rc == 0 and median <= budget_s,
+        "stderr": err if rc != 0 else "",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark main.py startup paths against a time budget")
+    parser.add_argument("--excel_path", "-e", default=os.path.join(FRAMEWORK_DIR, "Configurations_updated.xlsx"))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="startup_bench.json", help="Where to write the JSON results")
+    for case, budget in DEFAULT_BUDGETS.items():
+        parser.add_argument(f"--{case}_budget", type=float, default=budget,
+                            help=f"Median budget for the {case} case in seconds (default {budget})")
+    args = parser.parse_args()
+
+    excel_path = os.path.abspath(args.excel_path)
+    cases = [
+        ("help", ["--help"], args.help_budget),
+        ("validate", ["-e", excel_path, "--validate_only", "--no_cache"], args.validate_budget),
+        ("cached", ["-e", excel_path, "--validate_only"], args.cached_budget),
+    ]
+
+    # Run from a scratch directory so the benchmark leaves no log files in the tree
+    with tempfile.TemporaryDirectory(prefix="snd_startup_") as cwd:
+        # Warm the plan cache (and the OS file cache) before timing the cached path
+        time_run(["-e", excel_path, "--validate_only"], cwd)
+        results = [run_case(name, case_args, budget, args.repeat, cwd) for name, case_args, budget in cases]
+
+    for r in results:
+        status = "OK  " if r["ok"] else "FAIL"
+        print(f"{status} {r['case']:<9} median {r['median_s'] * 1000:7.1f} ms "
+              f"(min {r['min_s'] * 1000:.1f}, max {r['max_s'] * 1000:.1f}, budget {r['budget_s'] * 1000:.0f} ms)")
+        if r["returncode"] != 0:
+            print(f"     exited {r['returncode']}: {r['stderr']}")
+
+    with open(args.output, "w") as f:
+        json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    sys.exit(0 if all(r["ok"] for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
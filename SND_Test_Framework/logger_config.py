@@ -1,12 +1,37 @@
+import atexit
 import logging
 import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler
 
-def setup_logging(log_file: str = "testExecOutput.log", level: int = logging.INFO):
+FILE_FORMAT = "%(asctime)s [%(levelname)s] %(module)s: %(message)s"
+CONSOLE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+DUT_LOG_FILE = "testExecOutput.log"
+DEFAULT_FLUSH_S = 1.0
+DEFAULT_BATCH = 512
+
+_listener = None
+_context = threading.local()
+# DUTs with an open per-DUT log; replaced (never mutated) so producer threads can read it lock-free
+_active_duts = ()
+
+
+def setup_logging(log_file: str = "testExecOutput.log", level: int = logging.INFO, queued: bool = False,
+                  flush_interval_s: float = DEFAULT_FLUSH_S, batch_size: int = DEFAULT_BATCH):
     '''
     Configures the root logger to write to both console and a single log file.
     - log_file: path to the global testExecOutput.log.
     - level: default log level (INFO).
+    - queued: worker threads only enqueue records; one listener thread formats
+      and writes them in batches, to the global log, the console and the
+      per-DUT log opened with begin_dut_log().
+    - flush_interval_s / batch_size: [queued] how often files are flushed and
+      how many records the listener writes per wakeup.
     '''
+    global _listener
     # Ensure the directory exists
     log_dir = os.path.dirname(log_file) or "."
     os.makedirs(log_dir, exist_ok=True)
@@ -17,23 +42,163 @@ def setup_logging(log_file: str = "testExecOutput.log", level: int = logging.INF
     # Avoid duplicate handlers if re-called
     if logger.hasHandlers():
         logger.handlers.clear()
+    shutdown_logging()
+
+    file_formatter = logging.Formatter(FILE_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
+    console_formatter = logging.Formatter(CONSOLE_FORMAT, datefmt="%H:%M:%S")
+
+    if queued:
+        records = queue.SimpleQueue()
+        handler = QueueHandler(records)
+        handler.addFilter(_tag_dut)
+        logger.addHandler(handler)
+        _listener = _BatchListener(records, log_file, file_formatter, console_formatter, flush_interval_s, batch_size)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return logger
 
     # File handler
     fh = logging.FileHandler(log_file)
     fh.setLevel(level)
-    file_formatter = logging.Formatter(
-        "%(asctime)s [%(levelname)s] %(module)s: %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-    )
     fh.setFormatter(file_formatter)
     logger.addHandler(fh)
 
     # Console handler
     ch = logging.StreamHandler()
     ch.setLevel(level)
-    console_formatter = logging.Formatter(
-        "%(asctime)s [%(levelname)s] %(message)s", datefmt="%H:%M:%S"
-    )
     ch.setFormatter(console_formatter)
     logger.addHandler(ch)
 
     return logger
+
+
+def shutdown_logging():
+    '''Drains the queue and closes every log file (no-op in synchronous mode).'''
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def begin_dut_log(dut: str, log_dir: str):
+    '''
+    Tags records logged from the calling thread with dut and, in queued mode,
+    also writes them to {log_dir}/testExecOutput.log. Records from other
+    threads (collectors, followers) are matched by a "[dut]" message prefix
+    or a thread name containing the DUT.
+    '''
+    global _active_duts
+    _context.dut = dut
+    if _listener is not None:
+        _listener.control(("open", dut, os.path.join(log_dir, DUT_LOG_FILE)))
+        _active_duts = _active_duts + (dut,)
+
+
+def end_dut_log(dut: str, timeout_s: float = 10.0):
+    '''Closes the DUT's log once everything logged for it so far is written.'''
+    global _active_duts
+    if getattr(_context, "dut", None) == dut:
+        _context.dut = None
+    if _listener is not None:
+        _active_duts = tuple(d for d in _active_duts if d != dut)
+        _listener.control(("close", dut, None), wait_s=timeout_s)
+
+
+def _tag_dut(record: logging.LogRecord) -> bool:
+    '''Runs in the thread that logs: stamps record.dut while the DUT context is known.'''
+    dut = getattr(_context, "dut", None)
+    if dut is None and _active_duts:
+        msg = record.msg if isinstance(record.msg, str) else ""
+        prefix = msg[1:msg.find("]")] if msg.startswith("[") else None
+        for d in _active_duts:
+            if d == prefix or d in record.threadName:
+                dut = d
+                break
+    record.dut = dut
+    return True
+
+
+class _BatchListener:
+    '''
+    Single consumer of the log queue. Records are written in batches and
+    files are flushed every flush_interval_s (the console after each batch),
+    so worker threads never wait on a file or terminal.
+    '''
+
+    def __init__(self, records, log_file, file_formatter, console_formatter, flush_interval_s, batch_size):
+        self.records = records
+        self.file_formatter = file_formatter
+        self.console_formatter = console_formatter
+        self.flush_interval_s = flush_interval_s
+        self.batch_size = batch_size
+        self.global_file = open(log_file, "a", encoding="utf-8", buffering=1 << 16)
+        self.dut_files = {}
+        self._thread = threading.Thread(target=self._run, name="log-listener", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def control(self, message: tuple, wait_s: float = None):
+        done = threading.Event()
+        self.records.put((message, done))
+        if wait_s:
+            done.wait(wait_s)
+
+    def stop(self):
+        self.records.put(None)
+        self._thread.join()
+
+    def _handle_control(self, item):
+        (action, dut, path), done = item
+        if action == "open" and dut not in self.dut_files:
+            try:
+                self.dut_files[dut] = open(path, "a", encoding="utf-8", buffering=1 << 16)
+            except OSError as e:
+                sys.stderr.write(f"Could not open DUT log {path}: {e}\n")
+        elif action == "close" and dut in self.dut_files:
+            self.dut_files.pop(dut).close()
+        done.set()
+
+    def _write(self, record):
+        try:
+            line = self.file_formatter.format(record) + "\n"
+            self.global_file.write(line)
+            f = self.dut_files.get(getattr(record, "dut", None))
+            if f is not None:
+                f.write(line)
+            sys.stderr.write(self.console_formatter.format(record) + "\n")
+        except Exception as e:
+            sys.stderr.write(f"--- Logging error: {e} ({record.getMessage()!r})\n")
+
+    def _flush_files(self):
+        self.global_file.flush()
+        for f in self.dut_files.values():
+            f.flush()
+
+    def _run(self):
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            batch = []
+            try:
+                batch.append(self.records.get(timeout=self.flush_interval_s))
+                while len(batch) < self.batch_size:
+                    batch.append(self.records.get_nowait())
+            except queue.Empty:
+                pass
+            for item in batch:
+                if item is None:
+                    running = False
+                elif isinstance(item, tuple):
+                    self._handle_control(item)
+                else:
+                    self._write(item)
+            sys.stderr.flush()
+            if not running or time.monotonic() - last_flush >= self.flush_interval_s:
+                self._flush_files()
+                last_flush = time.monotonic()
+        self._flush_files()
+        self.global_file.close()
+        for f in self.dut_files.values():
+            f.close()
+        self.dut_files.clear()
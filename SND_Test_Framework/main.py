@@ -3,23 +3,23 @@ import sys
 import threading
 import logging
 import os
-import subprocess
 import time
-import pandas as pd
+from contextlib import nullcontext
 
+import logger_config
 from logger_config import setup_logging
 from colored_print import print_info, print_error, print_step
-from utils.excel_loader import (
-    load_execution_config,
-    load_sniffer_config,
-    load_sniffer_parameters,
-    load_test_config
-)
+from utils.excel_loader import compile_workbook, CACHE_DIR
 from utils import (
     common_utils, attenuator_utils, sniffer_utils,
-    tcpdump_utils, sysdiag_utils, wlan_utils, wlan_firmware_utils
+    tcpdump_utils, sysdiag_utils, wlan_utils, wlan_firmware_utils, ssh_session,
+    archive_utils, capture_rotation, phase_markers, wlan_status, timeline,
+    command_journal, tracing, row_scheduler
 )
 from utils.common_utils import ssh_execute
+from utils.remote_batch import RemoteBatch
+from utils.collector_stage import CollectorStage
+import tests
 
 def per_dut_worker(
     dut: str,
@@ -49,6 +49,11 @@ def per_dut_worker(
     dut_common_dir  = os.path.join(dut_root, "common")
     for d in [dut_sniffer_dir, dut_tcpdump_dir, dut_sysdiag_dir, dut_atten_dir, dut_common_dir]:
         os.makedirs(d, exist_ok=True)
+    # From here on this thread's records also go to {dut_root}/testExecOutput.log (queued logging)
+    logger_config.begin_dut_log(dut, dut_root)
+    # Steps below (and the ssh calls, waits and phases inside them) are traced under this DUT
+    tracing.bind_dut(dut)
+    barrier = tracing.traced_barrier(barrier)
 
     # Prepare folders for remote devices
     remote_dirs = {}
@@ -57,215 +62,446 @@ def per_dut_worker(
         os.makedirs(rd, exist_ok=True)
         remote_dirs[remote] = rd
 
-    # DUT cleanup step
+    # Commands run without an explicit log folder are journaled with this DUT's logs
+    command_journal.set_host_log_dir(dut, dut_common_dir)
+    for remote, rd in remote_dirs.items():
+        command_journal.set_host_log_dir(remote, rd)
+
+    # DUT cleanup step: every cleanup command goes to the DUT in one round trip
     print_step(f"🧼 [{dut}] Cleaning DUT logs and saved networks")
     logger.info(f"[{dut}] Performing log erase and Wi-Fi reset")
-    common_utils.erase_logs(dut, user)
-    time.sleep(1)
-    common_utils.clear_saved_networks(dut, user)
-    time.sleep(1)
-    common_utils.cleanup_scan_cache(dut, user)
-    time.sleep(1)
-    common_utils.wifi_off(dut, user)
-    time.sleep(2)
-    common_utils.wifi_on(dut, user)
-    time.sleep(1)
-
+    cleanup = RemoteBatch(dut, user, dut_common_dir)
+    sysdiag_utils.erase_logs(dut, user, batch=cleanup)
+    wlan_utils.clear_saved_networks(dut, user, batch=cleanup)
+    wlan_utils.cleanup_scan_cache(dut, user, batch=cleanup)
+    wlan_utils.wifi_off(dut, user, batch=cleanup)
+    wlan_utils.wifi_on(dut, user, batch=cleanup)
     # Clean Atlas firmware logs but DO NOT start logging yet
-    wlan_firmware_utils.clean_firmware_logs(dut, user)
-
-    # Start logging utilities (attenuator, sniffer, tcpdump, sysdiag)
-    print_step(f"📡 [{dut}] Starting always-on logs (Attenuator, Sniffer, WlanFW, sysdiag, tcpdump)")
-
-    # 🚨 Now start Attenuator setup
-    try:
-        if global_flags.get("enable_attenuator", False):
-            start_attn = int(test_params.get("start_attn_1", 0))
-            attenuator_utils.set_attenuation(start_attn)
-            attn_was_set = True
-            logger.info(f"[{dut}] Attenuator set to {start_attn} dB")
+    wlan_firmware_utils.clean_firmware_logs(dut, user, batch=cleanup)
+    with tracing.span("cleanup"):
+        steps = cleanup.run()
+    for step in steps:
+        if step.rc != 0:
+            logger.error(f"[{dut}] Cleanup step {step.name} failed (rc={step.rc}): {step.stderr}")
         else:
-            attn_was_set = False
-            logger.info(f"[{dut}] Attenuator disabled in global config")
-    except Exception as e:
-        attn_was_set = False
-        logger.error(f"[{dut}] Attenuator setup failed: {e}", exc_info=True)
+            logger.info(f"[{dut}] Cleanup step {step.name} done in {step.duration_s:.2f}s")
+
+    # Measure the DUT (and sniffer) clocks against ours so the timeline can line up their timestamps
+    build_timeline = global_flags.get("build_timeline", False)
+    if build_timeline:
+        with tracing.span("clock_offset"):
+            offsets = {timeline.DUT: timeline.estimate_clock_offset(dut, user, log_dir=dut_common_dir)}
+            if global_flags.get("enable_sniffer", False) and sniffer_devs:
+                offsets[timeline.SNIFFER] = timeline.estimate_clock_offset(
+                    sniffer_devs[0]["ip"], sniffer_devs[0]["user"], log_dir=dut_common_dir
+                )
+        timeline.save_clock_offsets(dut_root, offsets)
 
-    # 🚨 Now start Sniffer setup
-    sniffer_processes = []
+    # Start logging utilities (attenuator, sniffer, tcpdump, sysdiag) as one concurrent stage
+    print_step(f"📡 [{dut}] Starting always-on logs (Attenuator, Sniffer, WlanFW, sysdiag, tcpdump)")
+    collectors = CollectorStage(dut)
+
+    # 🚨 Attenuator setup: one attenuator per row, so its DUTs share a coordinator that
+    # applies the start level once and resets only after the row's last DUT is done
+    attenuator = None
+    if global_flags.get("enable_attenuator", False):
+        start_attn = int(test_params.get("start_attn_1", 0))
+        attenuator = attenuator_utils.get_coordinator(test_params, barrier.parties)
+        collectors.add("attenuator", start=lambda: attenuator.apply("start", start_attn, dut))
+    else:
+        logger.info(f"[{dut}] Attenuator disabled in global config")
+
+    # Captures are streamed back compressed with this codec when their collector stops
+    capture_codec = str(global_flags.get("capture_codec") or "gzip").strip().lower()
+
+    # Ring-buffer mode: captures rotate into fixed-size segments that are pulled during the test
+    segment_mb = int(global_flags.get("capture_segment_mb") or 0)
+    segment_count = int(global_flags.get("capture_segments") or capture_rotation.DEFAULT_SEGMENTS)
+    rotate_args = capture_rotation.ring_args(segment_mb, segment_count) if segment_mb else ""
+    sniffer_rotate_args = ""
+    if segment_mb:
+        template = str(global_flags.get("sniffer_rotate_args") or "-C {segment_mb} -W {segments}")
+        sniffer_rotate_args = template.format(segment_mb=segment_mb, segments=segment_count)
+
+    def segment_collector(host, host_user, remote_pcap, local_dir):
+        if not segment_mb:
+            return None
+        return capture_rotation.SegmentCollector(
+            host, host_user, remote_pcap, local_dir, segment_mb,
+            poll_s=float(global_flags.get("capture_poll_s") or capture_rotation.DEFAULT_POLL_S),
+            codec=capture_codec,
+            keep_local=int(global_flags.get("capture_keep_local") or 0)
+        ).start()
+
+    # 🚨 Sniffer setup: one collector per requested channel
     raw_ch_str = test_params.get("sniffer_channels", "")
     requested_channels = [ch.strip() for ch in raw_ch_str.split(",") if ch.strip()]
     if global_flags.get("enable_sniffer", False) and requested_channels:
         for i, ch in enumerate(requested_channels):
-            if i < len(sniffer_devs):
-                sn_info = sniffer_devs[i]
-                freq_info = sniffer_params.get(ch, {})
-                pid_file = sniffer_utils.start_sniffer(
-                    sn_info["ip"], sn_info["user"], sn_info["ifname"], freq_info, dut_sniffer_dir
-                )
-                sniffer_processes.append((sn_info, pid_file))
-                logger.info(f"[{dut}] Sniffer '{sn_info['name']}' started on channel {ch}")
-            else:
+            if i >= len(sniffer_devs):
                 logger.error(f"[{dut}] No available sniffer for channel {ch}")
+                continue
+            sn_info = sniffer_devs[i]
+            freq_info = sniffer_params.get(ch, {})
+
+            def start_sniffer(sn_info=sn_info, freq_info=freq_info):
+                remote_pcap = sniffer_utils.start_sniffer(
+                    sn_info["ip"], sn_info["user"], sn_info["ifname"], freq_info, dut_sniffer_dir,
+                    rotate_args=sniffer_rotate_args, tag=dut
+                )
+                if remote_pcap is None:
+                    raise RuntimeError(f"sniffer '{sn_info['name']}' did not start")
+                return remote_pcap, segment_collector(sn_info["ip"], sn_info["user"], remote_pcap, dut_sniffer_dir)
+
+            collectors.add(
+                f"sniffer:{sn_info['name']}:{ch}",
+                start=start_sniffer,
+                stop=lambda handle, sn_info=sn_info: sniffer_utils.stop_sniffer(
+                    sn_info["ip"], sn_info["user"], handle[0], dut_sniffer_dir, capture_codec, collector=handle[1]
+                )
+            )
     else:
         logger.info(f"[{dut}] Sniffer disabled or no channels requested")
 
-    # 🚨 Now start Sysdiagnose/logarchive setup
-    print_step(f"📝 [{dut}] Starting Sysdiagnose log collection")
+    # 🚨 Sysdiagnose/logarchive: taken once before and once after the test
     sys_mode = str(global_flags.get("get_sysdiagnose", "")).lower()
-    if sys_mode == "sysdiagnose":
-        try:
-            sysdiag_utils.run_sysdiagnose(dut, user, dut_sysdiag_dir)
-            logger.info(f"[{dut}] Initial sysdiagnose complete")
-        except Exception as e:
-            logger.error(f"[{dut}] Initial sysdiagnose failed: {e}", exc_info=True)
-    elif sys_mode == "logarchive":
-        try:
-            sysdiag_utils.run_logarchive(dut, user, dut_sysdiag_dir)
-            logger.info(f"[{dut}] Initial logarchive complete")
-        except Exception as e:
-            logger.error(f"[{dut}] Initial logarchive failed: {e}", exc_info=True)
+    snapshot = {"sysdiagnose": sysdiag_utils.run_sysdiagnose, "logarchive": sysdiag_utils.run_logarchive}.get(sys_mode)
+    if snapshot:
+        collectors.add(
+            sys_mode,
+            start=lambda: snapshot(dut, user, dut_sysdiag_dir),
+            stop=lambda _: snapshot(dut, user, dut_sysdiag_dir)
+        )
+
+    # 🚨 ATLAS WLAN firmware logging starts after the initial snapshot and stops after the final one, as it always has
+    collectors.add(
+        "firmware_log",
+        start=lambda: wlan_firmware_utils.start_firmware_log(dut, user),
+        stop=lambda _: wlan_firmware_utils.stop_and_pull_firmware_log(dut, user, dut_common_dir),
+        after=[sys_mode] if snapshot else [],
+        stop_after=[sys_mode] if snapshot else []
+    )
+
+    # 🚨 wlan_status (airport -I) sampling, parsed incrementally while the test runs
+    if global_flags.get("wlan_status_monitor", False):
+        def start_wlan_status():
+            max_s = int(global_flags.get("wlan_status_max_s") or 86400)
+            pid = wlan_utils.start_wlan_status_loop(dut, user, "/tmp", duration_s=max_s)
+            if not pid:
+                raise RuntimeError("wlan_status loop did not start")
+            follower = wlan_status.WlanStatusFollower(
+                dut, user, "/tmp/wlan_status.txt", os.path.join(dut_common_dir, "wlan_status.txt")
+            ).start()
+            return pid, follower
+
+        def stop_wlan_status(handle):
+            pid, follower = handle
+            wlan_utils.stop_wlan_status_loop(dut, user, pid)
+            store = follower.finish()
+            store.save(os.path.join(dut_common_dir, "wlan_status.npz"))
+            wlan_status.phase_stats(
+                store, phase_markers.get_recorder(dut).phases, os.path.join(dut_common_dir, "wlan_status_phases.json")
+            )
 
-    # 🚨 Now start ATLAS WLAN firmware setup
-    print_step(f"📝 [{dut}] Starting Atlas firmware log collection")
-    wlan_firmware_utils.start_firmware_log(dut, user)
-    logger.info(f"[{dut}] Firmware logging started")
+        collectors.add("wlan_status", start=start_wlan_status, stop=stop_wlan_status)
 
-    # 🚨 Now start TCPDump setup
+    # 🚨 TCPDump must be capturing before any traffic runs
     iface = test_params.get("dut_wifi_interface", "wlan0")
     if global_flags.get("enable_tcpdump", False):
-        tcpdump_handle = tcpdump_utils.start_tcpdump(dut, user, iface, dut_tcpdump_dir)
-        logger.info(f"[{dut}] TCPDump started")
+        def start_tcpdump():
+            remote_pcap = tcpdump_utils.start_tcpdump(dut, user, iface, dut_tcpdump_dir, rotate_args=rotate_args)
+            if remote_pcap is None:
+                raise RuntimeError("tcpdump did not start")
+            return remote_pcap, segment_collector(dut, user, remote_pcap, dut_tcpdump_dir)
+
+        collectors.add(
+            "tcpdump",
+            start=start_tcpdump,
+            stop=lambda handle: tcpdump_utils.stop_tcpdump(
+                dut, user, handle[0], dut_tcpdump_dir, capture_codec, collector=handle[1]
+            )
+        )
     else:
-        tcpdump_handle = None
         logger.info(f"[{dut}] TCPDump disabled in config")
-    
-    # Begin test execution
+
+    # Readiness gate: the test starts only once every collector is up
+    with tracing.span("collectors_start"):
+        collectors.start_all()
+
+    # Begin test execution; tests mark their phases into {dut_root}/phases.jsonl
     print_step(f"🚀 [{dut}] Running test logic for traffic type: {traffic_type}")
+    phase_markers.start_recorder(dut, dut_root)
     test_exception = None
     try:
-        mod_name = traffic_type.lower()
-        test_module = __import__(f"tests.{mod_name}", fromlist=["run_test"])
-        test_module.run_test(dut, test_params, remote_list, global_flags, barrier)
+        run_test = tests.get_test(traffic_type)
+        # Rows are shared across the group's DUTs, so hand each test its own copy
+        dut_test_params = dict(test_params, dut_log_dir=dut_root)
+        with tracing.span(f"test:{traffic_type}"):
+            run_test(dut, dut_test_params, remote_list, global_flags, barrier)
     except Exception as e:
         test_exception = e
         logger.error(f"[{dut}] Exception during test: {e}", exc_info=True)
 
     # Cleanup logging processes
     print_step(f"🧹 [{dut}] Stopping logs and collecting results")
-
-    # Stop tcpdump
-    if tcpdump_handle:
+    with tracing.span("collectors_stop"):
+        collectors.stop_all()
+    if attenuator:
+        attenuator.release(dut)
+    collectors.write_timings(dut_common_dir)
+
+    # Summarize the pulled captures before the folder is archived
+    if global_flags.get("analyze_captures", False):
+        print_step(f"🔎 [{dut}] Analyzing captures")
         try:
-            tcpdump_utils.stop_tcpdump(dut, user, tcpdump_handle)
-            logger.info(f"[{dut}] TCPDump stopped")
+            # numpy only loads when capture post-processing is enabled
+            from utils import pcap_analysis
+            with tracing.span("analyze_captures"):
+                tables = pcap_analysis.analyze_dut(dut_root, gap_s=float(global_flags.get("capture_gap_s") or pcap_analysis.DEFAULT_GAP_S))
+            logger.info(f"[{dut}] Capture analysis written: {tables}")
         except Exception as e:
-            logger.error(f"[{dut}] TCPDump stop error: {e}", exc_info=True)
+            logger.error(f"[{dut}] Capture analysis failed: {e}", exc_info=True)
 
-    # Stop sniffers
-    for sn_info, pid in sniffer_processes:
+    # Cut the captures into one small pcap per recorded phase (e.g. per attenuation step)
+    slice_phase = str(global_flags.get("slice_captures_by_phase") or "").strip()
+    if slice_phase:
         try:
-            sniffer_utils.stop_sniffer(sn_info["ip"], sn_info["user"], pid)
-            logger.info(f"[{dut}] Sniffer '{sn_info['name']}' stopped")
-        except Exception as e:
-            logger.error(f"[{dut}] Sniffer stop error: {e}", exc_info=True)
-
-    # Final sysdiagnose/logarchive
-    if sys_mode == "sysdiagnose":
-        try:
-            sysdiag_utils.run_sysdiagnose(dut, user, dut_sysdiag_dir)
-            logger.info(f"[{dut}] Final sysdiagnose complete")
-        except Exception as e:
-            logger.error(f"[{dut}] Final sysdiagnose failed: {e}", exc_info=True)
-    elif sys_mode == "logarchive":
-        try:
-            sysdiag_utils.run_logarchive(dut, user, dut_sysdiag_dir)
-            logger.info(f"[{dut}] Final logarchive complete")
+            from utils import pcap_index
+            with tracing.span("slice_captures"):
+                slices = pcap_index.slice_phases(
+                    dut_root, name=None if slice_phase.lower() == "all" else slice_phase,
+                    clock_offset_s=float(global_flags.get("capture_clock_offset_s") or 0.0)
+                )
+            logger.info(f"[{dut}] Wrote {len(slices)} capture slice(s)")
         except Exception as e:
-            logger.error(f"[{dut}] Final logarchive failed: {e}", exc_info=True)
+            logger.error(f"[{dut}] Capture slicing failed: {e}", exc_info=True)
 
-    # Stop firmware logging and download logs
-    wlan_firmware_utils.stop_and_pull_firmware_log(dut, user, dut_common_dir)
-    logger.info(f"[{dut}] Firmware logs downloaded")
+    # Command journals are buffered; write out and close this DUT's before the folder is read and archived
+    command_journal.close_under(dut_root)
+    command_journal.clear_host_log_dirs()
 
-    # Reset attenuator
-    if attn_was_set and global_flags.get("enable_attenuator", False):
+    # Merge every log, capture and sample of this DUT into one ordered timeline.jsonl
+    if build_timeline:
         try:
-            attenuator_utils.set_attenuation(0)
-            logger.info(f"[{dut}] Attenuator reset to 0 dB")
+            with tracing.span("timeline"):
+                count = timeline.write_timeline(dut_root, dut)
+            logger.info(f"[{dut}] Timeline written with {count} events")
         except Exception as e:
-            logger.error(f"[{dut}] Attenuator reset error: {e}", exc_info=True)
+            logger.error(f"[{dut}] Timeline build failed: {e}", exc_info=True)
 
-    # Archive test logs
-    try:
-        tar_path = f"{dut_root}.tar.gz"
-        subprocess.call(f"tar czf {tar_path} -C {base_log_folder} {test_name}/{dut.replace('.', '_')}", shell=True)
-        logger.info(f"[{dut}] Logs archived to {tar_path}")
-    except Exception as e:
-        logger.error(f"[{dut}] Archive failed: {e}", exc_info=True)
-
-    # Final result
+    # Final result (logged before archiving so the per-DUT log is complete)
     if test_exception:
         logger.error(f"[{dut}] ❌ Test FAILED")
         print_step(f"[{dut}] ❌ Test FAILED")
     else:
         logger.info(f"[{dut}] ✅ Test SUCCESSFUL")
         print_step(f"[{dut}] ✅ Test SUCCESSFUL")
+    logger_config.end_dut_log(dut)
+
+    # Archive test logs in the background; main waits for all archives before exiting
+    def trace_archive(fut):
+        if not fut.cancelled() and fut.exception() is None:
+            s = fut.result()
+            tracing.add_span("archive", "archive", dut, s["started"], s["seconds"], bytes_in=s["bytes_in"])
+
+    try:
+        fut = archive_utils.get_archiver().submit(dut_root, f"{test_name}/{dut.replace('.', '_')}", dut_root)
+        fut.add_done_callback(trace_archive)
+    except Exception as e:
+        logger.error(f"[{dut}] Archive failed: {e}", exc_info=True)
+    tracing.bind_dut(None)
 
 
 # Main function that launches CLI → reads Excel → starts threads
 def main():
     print_step("Parsing CLI arguments")
-    logger = setup_logging(log_file="testExecOutput.log", level=logging.INFO)
-
     parser = argparse.ArgumentParser()
     parser.add_argument("--excel_path", "-e", required=True, help="Path to Configurations_updated.xlsx")
     parser.add_argument("--tests_to_run", "-t", nargs="*", default=None,
                         help="Optional list of Test_Type names to run")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Re-parse the workbook instead of using the cached compiled plan")
+    parser.add_argument("--mode", choices=["threads", "async"], default="threads",
+                        help="threads: one OS thread per DUT; async: asyncio engine with bounded concurrency")
+    parser.add_argument("--max_concurrency", type=int, default=None,
+                        help="[async] Max DUT pipelines running at once (default 64)")
+    parser.add_argument("--max_commands", type=int, default=None,
+                        help="[async] Max concurrent ssh/scp processes (default 128; iperf3 traffic is exempt)")
+    parser.add_argument("--per_host_limit", type=int, default=None,
+                        help="[async] Max concurrent remote commands per host (default 4; iperf3 traffic is exempt)")
+    parser.add_argument("--validate_only", action="store_true",
+                        help="Compile the plan, check every TrafficType has a test module, then exit")
+    parser.add_argument("--log_mode", choices=["sync", "queued"], default="sync",
+                        help="sync: threads write log files directly; queued: one listener thread writes "
+                             "the global log plus a testExecOutput.log per DUT folder")
+    parser.add_argument("--log_flush_s", type=float, default=None,
+                        help="[queued] Seconds between log file flushes (default 1.0)")
     args = parser.parse_args()
 
+    # Logging starts after argparse so --help and bad flags leave no log file behind
+    logger = setup_logging(
+        log_file="testExecOutput.log", level=logging.INFO, queued=args.log_mode == "queued",
+        flush_interval_s=args.log_flush_s or logger_config.DEFAULT_FLUSH_S
+    )
+
     print_info("InfraFramework starting...")
     logger.info("Logger setup complete")
 
     print_step("Reading Excel configuration")
-    global_flags     = load_execution_config(args.excel_path)
-    sniffer_devs     = load_sniffer_config(args.excel_path)
-    sniffer_params   = load_sniffer_parameters(args.excel_path)
-    test_df          = load_test_config(args.excel_path)
+    try:
+        plan = compile_workbook(args.excel_path, use_cache=not args.no_cache)
+    except ValueError as e:
+        print_error(str(e))
+        logger.error(str(e))
+        sys.exit(1)
+    global_flags     = plan["execution"]
+    sniffer_devs     = plan["sniffers"]
+    sniffer_params   = plan["sniffer_params"]
+
+    # Span tracing of every DUT step; trace.json/trace_summary.json are written at the end
+    tracing.enable(bool(global_flags.get("enable_tracing", False)))
+
+    ssh_session.configure(
+        enabled=global_flags.get("ssh_multiplexing", True) is not False,
+        idle_timeout_s=int(global_flags.get("ssh_idle_timeout") or ssh_session.IDLE_TIMEOUT_S)
+    )
+
+    # One control session to the attenuator for the whole run (attenuator_cli per step if no address)
+    if global_flags.get("enable_attenuator", False):
+        attenuator_utils.configure(
+            address=str(global_flags.get("attenuator_address") or ""),
+            channels=global_flags.get("attenuator_channels") or "1",
+            settle_timeout_s=float(global_flags.get("attenuator_settle_timeout_s") or attenuator_utils.SETTLE_TIMEOUT_S),
+            step_db=float(global_flags.get("attenuator_step_db") or attenuator_utils.STEP_DB)
+        )
+
+    # Log folders are compressed in background processes while later rows run
+    try:
+        archive_utils.get_archiver(
+            codec=str(global_flags.get("archive_codec") or "gzip").strip().lower(),
+            level=int(global_flags["archive_level"]) if global_flags.get("archive_level") not in (None, "") else None,
+            max_workers=int(global_flags.get("archive_workers") or 0) or None
+        )
+    except ValueError as e:
+        print_error(str(e))
+        logger.error(str(e))
+        sys.exit(1)
 
     print_step("Filtering valid tests to run...")
-    to_run_df = test_df[test_df["Skipped_Execution"].str.strip().str.lower() != "skip"]
+    to_run = [row for row in plan["tests"] if str(row["Skipped_Execution"]).strip().lower() != "skip"]
     if args.tests_to_run:
-        to_run_df = to_run_df[to_run_df["Test_Type"].isin(args.tests_to_run)]
+        to_run = [row for row in to_run if row["Test_Type"] in args.tests_to_run]
         logger.info("User-specified test types: %s", args.tests_to_run)
 
-    if to_run_df.empty:
+    if not to_run:
         print_error("No tests to run.")
         logger.error("Nothing to execute after filtering.")
         sys.exit(1)
 
-    # Threading for each DUT/test combo
-    print_step("Launching DUT threads...")
-    all_threads = []
-    for _, row in to_run_df.iterrows():
+    # Every TrafficType must resolve to a test module before any DUT is touched
+    traffic_types = sorted({str(row["TrafficType"]).strip() for row in to_run})
+    errors = tests.validate(traffic_types)
+    if errors:
+        for err in errors:
+            print_error(err)
+            logger.error(err)
+        sys.exit(1)
+    logger.info("Test modules ready for TrafficType(s): %s", ", ".join(traffic_types))
+
+    # One barrier group per Test_Config row
+    groups = []
+    for row in to_run:
         dut_list = [d.strip() for d in str(row["dut"]).split(",") if d.strip()]
         remote_list = [r.strip() for r in str(row.get("controller_ip", "")).split(",") if r.strip()]
-
-        barrier = threading.Barrier(len(dut_list))
-        for dut in dut_list:
-            t = threading.Thread(
-                target=per_dut_worker,
-                args=(dut, remote_list, row.to_dict(), global_flags, sniffer_devs, sniffer_params, barrier)
-            )
+        groups.append({"name": row["Test_Type"], "duts": dut_list, "remotes": remote_list, "params": dict(row)})
+
+    # Rows sharing a DUT, the attenuator, a sniffer or an iperf3 port are queued through leases
+    scheduler = None
+    history_path = os.path.join(CACHE_DIR, row_scheduler.HISTORY_FILE)
+    if global_flags.get("resource_scheduling", True) is not False:
+        scheduler = row_scheduler.RowScheduler(
+            groups, global_flags, sniffer_devs, row_scheduler.load_history(history_path)
+        )
+        for line in scheduler.format_plan():
+            print_info(line)
+            logger.info(line)
+
+    if args.validate_only:
+        dut_count = sum(len(g["duts"]) for g in groups)
+        print_info(f"Plan OK: {len(to_run)} test(s), {dut_count} DUT run(s), TrafficType(s) {', '.join(traffic_types)}")
+        return
+
+    if args.mode == "async":
+        # asyncio is only worth importing when the async engine is actually used
+        from utils import async_engine
+        max_concurrency = args.max_concurrency or async_engine.DEFAULT_MAX_CONCURRENCY
+        print_step(f"Running DUT pipelines on asyncio engine (max {max_concurrency} concurrent)...")
+        engine = async_engine.AsyncEngine(
+            max_concurrency,
+            args.max_commands or async_engine.DEFAULT_MAX_COMMANDS,
+            args.per_host_limit or async_engine.DEFAULT_PER_HOST_LIMIT
+        )
+        engine.run(groups, per_dut_worker, (global_flags, sniffer_devs, sniffer_params), scheduler=scheduler)
+    else:
+        # Threading for each DUT/test combo; each row starts once it holds its leases
+        print_step("Launching DUT threads...")
+
+        def run_group(index, group):
+            with scheduler.lease(index) if scheduler else nullcontext():
+                barrier = threading.Barrier(len(group["duts"]))
+                threads = []
+                for dut in group["duts"]:
+                    t = threading.Thread(
+                        target=per_dut_worker,
+                        args=(dut, group["remotes"], group["params"], global_flags, sniffer_devs, sniffer_params, barrier)
+                    )
+                    t.start()
+                    threads.append(t)
+                for t in threads:
+                    t.join()
+
+        row_threads = [threading.Thread(target=run_group, args=(i, g), name=f"row-{i}") for i, g in enumerate(groups)]
+        for t in row_threads:
             t.start()
-            all_threads.append(t)
-
-    # Wait for all DUT threads to finish
-    print_step("Waiting for all DUT threads to complete...")
-    for t in all_threads:
-        t.join()
 
+        # Wait for all DUT threads to finish
+        print_step("Waiting for all DUT threads to complete...")
+        for t in row_threads:
+            t.join()
+
+    if scheduler:
+        row_scheduler.save_history(history_path, scheduler.observed)
+
+    print_step("Waiting for background log archives...")
+    archives = archive_utils.shutdown_archiver()
+    if archives:
+        bytes_in = sum(a["bytes_in"] for a in archives)
+        bytes_out = sum(a["bytes_out"] for a in archives)
+        logger.info(
+            "Archives: %d written, %.1f MB in, %.1f MB out, %.1fs total compression time",
+            len(archives), bytes_in / 1e6, bytes_out / 1e6, sum(a["seconds"] for a in archives)
+        )
+
+    # Tear down pooled SSH connections and report how many handshakes were needed
+    pool = ssh_session.get_pool()
+    stats = pool.stats()
+    pool.close_all()
+    logger.info(
+        "SSH: %d commands over %d handshakes, mean latency %.3fs, max %.3fs",
+        stats["commands"], stats["handshakes"], stats["mean_latency_s"], stats["max_latency_s"]
+    )
+
+    command_journal.close_all()
+    if global_flags.get("enable_attenuator", False):
+        steps = attenuator_utils.save_steps(
+            os.path.join(global_flags.get("test_log_folder", "logs"), "attenuator_steps.jsonl")
+        )
+        logger.info("Attenuator: %d step(s) applied", steps)
+        attenuator_utils.close()
+    if tracing.is_enabled():
+        tracing.write_reports(global_flags.get("test_log_folder", "logs"))
     print_info("✅ All test threads complete. See logs for details.")
+    logger_config.shutdown_logging()
 
 if __name__ == "__main__":
     main()
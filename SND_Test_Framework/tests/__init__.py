@@ -0,0 +1,75 @@
+import importlib
+import logging
+import os
+import pkgutil
+
+logger = logging.getLogger("tests")
+
+# TrafficType (lower-cased) -> module name, filled once by discover()
+_available = {}
+# TrafficType (lower-cased) -> imported module exposing run_test
+_loaded = {}
+
+
+def discover() -> dict:
+    """
+    Lists the test modules in this package without importing them.
+    A module named tests/<name>.py serves TrafficType <name> (case-insensitive).
+    """
+    if not _available:
+        for info in pkgutil.iter_modules([os.path.dirname(__file__)]):
+            if not info.name.startswith("_"):
+                _available[info.name.lower()] = info.name
+    return dict(_available)
+
+
+def validate(traffic_types) -> list:
+    """
+    Imports the modules serving the given TrafficTypes and checks each one
+    exposes run_test. Returns a list of error strings (empty when all good).
+    Only the requested modules are imported, so unused tests cost nothing.
+    """
+    available = discover()
+    errors = []
+    for traffic_type in sorted({str(t).strip() for t in traffic_types}):
+        key = traffic_type.lower()
+        if key in _loaded:
+            continue
+        if key not in available:
+            errors.append(
+                f"Unknown TrafficType '{traffic_type}' (available: {', '.join(sorted(available))})"
+            )
+            continue
+        try:
+            module = importlib.import_module(f"{__name__}.{available[key]}")
+        except Exception as e:
+            errors.append(f"TrafficType '{traffic_type}': failed to import tests.{available[key]}: {e}")
+            continue
+        if not callable(getattr(module, "run_test", None)):
+            errors.append(f"TrafficType '{traffic_type}': tests.{available[key]} has no run_test()")
+            continue
+        _loaded[key] = module
+    return errors
+
+
+def get_test(traffic_type: str):
+    """Returns the run_test callable for a TrafficType validated at startup."""
+    key = str(traffic_type).strip().lower()
+    if key not in _loaded:
+        errors = validate([traffic_type])
+        if errors:
+            raise ValueError(errors[0])
+    return _loaded[key].run_test
+
+
+def get_hook(traffic_type: str, name: str):
+    """
+    Returns an optional module-level function of a test module (e.g.
+    resources or estimate_duration_s), or None if the module has none or
+    the TrafficType does not resolve.
+    """
+    key = str(traffic_type).strip().lower()
+    if key not in _loaded and validate([traffic_type]):
+        return None
+    hook = getattr(_loaded[key], name, None)
+    return hook if callable(hook) else None
@@ -1,11 +1,18 @@
 import logging
 import time
 from colored_print import print_step
-from utils.wlan_utils import initiate_assoc_connect, initiate_forgetNw, wifi_on, wifi_off
-from utils.common_utils import countdown
+from utils.wlan_utils import initiate_assoc_connect, initiate_forgetNw, wifi_on, wifi_off, cond_associated
+from utils.common_utils import countdown, wait_until
+from utils.phase_markers import get_recorder
+from utils.tracing import span
 
 logger = logging.getLogger("tests.autojoin")
 
+def estimate_duration_s(test_params: dict) -> float:
+    """Rough run time for the row scheduler: Wi-Fi off/on, the off dwell and a typical rejoin per round."""
+    interval = int(test_params.get("join_on_off_interval", 2))
+    return 15 + (15 + interval) * int(test_params.get("join_attempts", 5))
+
 def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict, barrier):
     logger = logging.getLogger(__name__)
     print_step(f"[{dut}] Starting AutoJoin test...")
@@ -16,7 +23,8 @@ def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict,
     sec      = test_params["ap_wifi_sec"]
     user     = test_params.get("User", "root")
     rounds   = int(test_params.get("join_attempts", 5))
-    interval = int(test_params.get("join_on_off_interval", 2))  # interval between off/on
+    interval = int(test_params.get("join_on_off_interval", 2))  # seconds Wi-Fi stays off each round
+    join_timeout = int(test_params.get("join_timeout", 30))  # max seconds to rejoin
     log_dir = test_params.get("test_log_path", "logs")
 
     # Sync with other DUTs before beginning
@@ -24,7 +32,8 @@ def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict,
 
     # Initial association
     print_step(f"[{dut}] Initial association to {ssid}")
-    rc, out, err = initiate_assoc_connect(dut, user, ssid, sec, pwd, for_debug=True)
+    with span("join"):
+        rc, out, err = initiate_assoc_connect(dut, user, ssid, sec, pwd, for_debug=True)
     if rc != 0:
         logger.error(f"[{dut}] Initial association FAILED: {err}")
         return
@@ -34,24 +43,27 @@ def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict,
     for i in range(rounds):
         print_step(f"[{dut}] --- Round {i+1} ---")
 
-        # Turn Wi-Fi OFF
+        # Turn Wi-Fi OFF (returns once the radio reports off)
         print_step(f"[{dut}] Turning Wi-Fi OFF")
-        wifi_off(dut, user)
-        countdown(interval))
+        with span("wifi_off", round=i + 1):
+            wifi_off(dut, user)
+        # The off period is part of the stimulus: keep the radio down for the configured dwell
+        countdown(interval)
 
-        # Turn Wi-Fi ON
+        # Turn Wi-Fi ON and time the autojoin back to the SSID
         print_step(f"[{dut}] Turning Wi-Fi ON")
-        wifi_on(dut, user)
-        countdown(interval))
-
-        # Start timing for rejoin
         start_t = time.time()
-
-        # (Optional: re-check status or wait longer here if needed)
-        # You can insert a loop to poll `get_wlan_status()` until connected
-
+        with get_recorder(dut).phase("rejoin", round=i + 1):
+            wifi_on(dut, user)
+            rejoined = wait_until(
+                cond_associated(dut, user, ssid), timeout_s=join_timeout, desc=f"[{dut}] rejoin to {ssid}"
+            )
         end_t = time.time()
-        logger.info(f"[{dut}] Rejoin attempt {i+1} completed in {end_t - start_t:.2f}s")
+
+        if rejoined:
+            logger.info(f"[{dut}] Rejoin attempt {i+1} completed in {end_t - start_t:.2f}s")
+        else:
+            logger.error(f"[{dut}] Rejoin attempt {i+1} FAILED: not associated after {join_timeout}s")
 
     print_step(f"[{dut}] AutoJoin test complete.")
     logger.info(f"[{dut}] AutoJoin test completed successfully.")
@@ -3,9 +3,15 @@ import time
 from colored_print import print_step
 from utils.wlan_utils import initiate_assoc_connect, initiate_forgetNw
 from utils.common_utils import countdown
+from utils.phase_markers import get_recorder
+from utils.tracing import span
 
 logger = logging.getLogger("tests.idle")
 
+def estimate_duration_s(test_params: dict) -> float:
+    """Rough run time for the row scheduler: join plus the idle hold."""
+    return 15 + int(test_params.get("test_cycle_count", 30))
+
 def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict, barrier):
     logger = logging.getLogger(__name__)
     print_step(f"[{dut}] Starting Idle test...")
@@ -22,19 +28,22 @@ def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict,
     barrier.wait()
     # Step 1: Forget the network to ensure a clean join
     print_step(f"[{dut}] Forgetting and associating to {ssid}")
-    initiate_forgetNw(dut, user)
+    with span("forget"):
+        initiate_forgetNw(dut, user)
 
     # Step 2: Attempt to associate
     join_success = False
     for attempt in range(1, 4):
-        rc, out, err = initiate_assoc_connect(dut, user, ssid, sec, pwd, for_debug=True)
+        with span("join", attempt=attempt):
+            rc, out, err = initiate_assoc_connect(dut, user, ssid, sec, pwd, for_debug=True)
         if rc == 0:
             logger.info(f"[IDLE] Association attempt {attempt} SUCCEEDED on {dut}")
             join_success = True
             break
         else:
             logger.warning(f"[IDLE] Association attempt {attempt} FAILED on {dut}: {err}")
-            time.sleep(2)
+            with span("join_backoff", "wait"):
+                time.sleep(2)
 
     if not join_success:
         logger.error(f"[{dut}] Association failed after 3 attempts. Skipping idle wait.")
@@ -42,7 +51,8 @@ def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict,
         return
 
     print_step(f"[{dut}] Holding idle state for {duration} seconds...")
-    countdown(duration)
+    with get_recorder(dut).phase("idle", duration_s=duration):
+        countdown(duration)
 
     print_step(f"[{dut}] ✅ Idle test complete")
     logger.info(f"[{dut}] Idle test completed successfully")
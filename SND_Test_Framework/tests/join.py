@@ -3,9 +3,15 @@ import time
 from colored_print import print_step
 from utils.wlan_utils import initiate_assoc_connect, initiate_forgetNw
 from utils.common_utils import countdown
+from utils.phase_markers import get_recorder
+from utils.tracing import span
 
 logger = logging.getLogger("tests.join")
 
+def estimate_duration_s(test_params: dict) -> float:
+    """Rough run time for the row scheduler: a forget, a typical association and the interval per round."""
+    return (10 + int(test_params.get("join_on_off_interval", 2))) * int(test_params.get("join_attempts", 5))
+
 def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict, barrier):
     logger = logging.getLogger(__name__)
     print_step(f"[{dut}] Starting Join test...")
@@ -16,7 +22,8 @@ def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict,
     sec      = test_params["ap_wifi_sec"]
     user     = test_params.get("User", "root")
     rounds   = int(test_params.get("join_attempts", 5))
-    interval = int(test_params.get("join_on_off_interval", 2))  # in seconds
+    interval = int(test_params.get("join_on_off_interval", 2))  # in seconds, between rounds
+    join_timeout = int(test_params.get("join_timeout", 30))  # in seconds
     log_dir = test_params.get("test_log_path", "logs")
 
     # Barrier to sync all DUTs before beginning test
@@ -25,15 +32,16 @@ def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict,
     for i in range(rounds):
         print_step(f"[{dut}] --- Round {i+1} ---")
 
-        # Step 1: Forget the network to ensure a clean join
+        # Step 1: Forget the network to ensure a clean join (returns once disassociated)
         print_step(f"[{dut}] Forgetting network before join")
-        initiate_forgetNw(dut, user, for_debug=True)
-        time.sleep(1)
+        with span("forget", round=i + 1):
+            initiate_forgetNw(dut, user, for_debug=True)
 
         # Step 2: Attempt to associate
         print_step(f"[{dut}] Initiating association to {ssid}")
         start_t = time.time()
-        rc, out, err = initiate_assoc_connect(dut, user, ssid, sec, pwd, for_debug=True)
+        with get_recorder(dut).phase("join", round=i + 1):
+            rc, out, err = initiate_assoc_connect(dut, user, ssid, sec, pwd, for_debug=True, wait_s=join_timeout)
         end_t = time.time()
 
         # Step 3: Log result
@@ -43,7 +51,8 @@ def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict,
             logger.info(f"[JOIN] Round {i+1} SUCCEEDED on {dut} in {end_t - start_t:.2f}s")
 
         # Step 4: Wait interval before next round
-        countdown(interval))
+        if i < rounds - 1:
+            countdown(interval)
 
     print_step(f"[{dut}] Join test complete.")
     logger.info(f"[{dut}] Join test completed successfully.")
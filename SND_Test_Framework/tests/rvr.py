@@ -3,12 +3,33 @@ import time
 from colored_print import print_step
 from utils.wlan_utils import initiate_assoc_connect, initiate_forgetNw
 from utils.common_utils import (
-    start_iperf_server, stop_iperf_server, start_iperf_client
+    start_iperf_server, stop_iperf_server,
+    wait_until, cond_iperf_listening
 )
-from utils.attenuator_utils import set_attenuation
+from utils.traffic_runner import Flow, run_flows, server_leases
+from utils.iperf_results import IperfResultStore
+from utils.iperf_stream import get_ring
+from utils.attenuator_utils import get_coordinator
+from utils.rvr_sweep import get_sweep, throughput_mbps
+from utils.phase_markers import get_recorder
+from utils.tracing import span
 
 logger = logging.getLogger("tests.rvr")
 
+def _iperf_port(dut: str) -> int:
+    return 5400 + int(dut.split('.')[-1]) % 100
+
+def resources(dut: str, test_params: dict, remote_list: list) -> list:
+    """iperf3 server ports this DUT's flows listen on, leased by the row scheduler."""
+    return server_leases(dut, remote_list, test_params.get("TrafficDirection", "DL"), _iperf_port(dut))
+
+def estimate_duration_s(test_params: dict) -> float:
+    """Rough run time for the row scheduler: one iperf run (plus setup) per attenuation step."""
+    duration = int(test_params.get("test_cycle_count", 30))
+    steps = len(range(int(test_params.get("start_attn_1", 0)), int(test_params.get("stop_attn_1", 0)) + 1,
+                      int(test_params.get("attn_step_dB", 1)) or 1))
+    return 15 + max(1, steps) * (duration + 10)
+
 def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict, barrier):
     logger = logging.getLogger(__name__)
     print_step(f"[{dut}] Starting RvR test...")
@@ -21,82 +42,105 @@ def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict,
     duration  = int(test_params.get("test_cycle_count", 30))
     direction = test_params.get("TrafficDirection", "DL").upper()
     log_dir   = test_params.get("test_log_path", "logs")
+    results   = IperfResultStore(dut, test_params.get("dut_log_dir", log_dir))
+
+    # Live per-second samples for progress/stall detection, if streaming is enabled
+    ring      = (get_ring(dut, progress_s=int(global_flags.get("iperf_progress_s") or 0))
+                 if global_flags.get("iperf_streaming", False) else None)
+    stall_s   = int(global_flags.get("iperf_stall_abort_s") or 0)
+    parallel  = int(test_params.get("iperf_parallel") or 1)  # -P streams per flow
 
     # Support TCP or UDP
     protocol   = test_params.get("TrafficType", "TCP").upper()
     is_udp     = protocol == "UDP"
     udp_bw     = test_params.get("UDPBW", "10M") if is_udp else None
 
-    # Attenuation sweep
-    start_attn = int(test_params.get("start_attn_1", 0))
-    stop_attn  = int(test_params.get("stop_attn_1", 0))
-    step_attn  = int(test_params.get("attn_step_dB", 1))
-    attn_points = list(range(start_attn, stop_attn + 1, step_attn))
-
     # Assign iperf port range for RvR
-    iperf_port = 5400 + int(dut.split('.')[-1]) % 100
+    iperf_port = _iperf_port(dut)
+
+    # Join, attenuation steps and iperf runs are recorded so captures can be sliced per step
+    phases = get_recorder(dut)
+
+    # The row's DUTs share one attenuator: each step is applied once for all of them
+    attenuator = get_coordinator(test_params, barrier.parties) if global_flags.get("enable_attenuator", False) else None
 
     # Sync before association
     barrier.wait()
     # Step 1: Clear saved networks
     print_step(f"[{dut}] Forgetting and associating to {ssid}")
-    initiate_forgetNw(dut, user)
+    with span("forget"):
+        initiate_forgetNw(dut, user)
 
     # Step 2: Attempt to Join network
     print_step(f"[{dut}] Attempting association to {ssid} (with up to 3 retries)")
     join_success = False
     for attempt in range(1, 4):
-        rc, out, err = initiate_assoc_connect(dut, user, ssid, sec, pwd, for_debug=True)
+        with phases.phase("join", attempt=attempt):
+            rc, out, err = initiate_assoc_connect(dut, user, ssid, sec, pwd, for_debug=True)
         if rc == 0:
             logger.info(f"[{dut}] Association attempt {attempt} SUCCEEDED")
             join_success = True
             break
         else:
             logger.warning(f"[{dut}] Association attempt {attempt} FAILED: {err}")
-            time.sleep(2)
+            with span("join_backoff", "wait"):
+                time.sleep(2)
 
     if not join_success:
         logger.error(f"[{dut}] Association failed after 3 attempts. Skipping RvR test.")
         return
     
-    # Step 3: Setting Attenuation
-    for attn in attn_points:
-        print_step(f"[{dut}] Setting attenuation to {attn} dB")
-        if global_flags.get("enable_attenuator", False):
-            set_attenuation(attn)
-
+    # Step 3: Setting Attenuation. Points come from the row's sweep: the linear range, or
+    # (rvr_sweep=adaptive) coarse steps refined where any DUT's throughput changes sharply
+    sweep = get_sweep(test_params, global_flags, barrier.parties)
+    index = 0
+    while True:
+        # Every DUT has finished (and reported) the previous point before the next is chosen and applied
         barrier.wait()
-        # Step 4: Run iperf traffic if join was successful
-        print_step(f"[{dut}] Running {protocol} traffic at {attn} dB")
-        if direction == "UL":
-            start_iperf_server(dut, user, iperf_port, log_dir, udp=is_udp)
-            for remote in remote_list:
-                start_iperf_client(remote, user, dut, iperf_port, duration, log_dir, udp=is_udp, bandwidth=udp_bw)
-        elif direction == "DL":
-            for remote in remote_list:
-                start_iperf_server(remote, user, iperf_port, log_dir, udp=is_udp)
-            barrier.wait()
-            for remote in remote_list:
-                start_iperf_client(dut, user, remote, iperf_port, duration, log_dir, udp=is_udp, bandwidth=udp_bw)
-        elif direction == "BIDIR":
-            for remote in remote_list:
-                start_iperf_server(remote, user, iperf_port, log_dir, udp=is_udp)
-            barrier.wait()
-            for remote in remote_list:
-                start_iperf_client(dut, user, remote, iperf_port, duration, log_dir, udp=is_udp, bidir=True, bandwidth=udp_bw)
+        attn, reason = sweep.point(index)
+        if attn is None:
+            break
+        with phases.phase("attn_step", attn_db=attn, sweep=reason) as marks:
+            print_step(f"[{dut}] Setting attenuation to {attn} dB")
+            if attenuator:
+                with span("set_attenuation", attn_db=attn):
+                    applied = attenuator.apply(index, attn, dut)
+                marks.update(attn_applied_ts=applied["applied_at"], attn_settle_s=applied["settle_s"])
+                logger.info(f"[{dut}] {attn} dB applied by {applied['by']}"
+                            + (f", settled in {applied['settle_s'] * 1000:.1f} ms" if applied["settle_s"] else ""))
 
-        time.sleep(duration + 5)
+            barrier.wait()
+            # Step 4: Run iperf traffic if join was successful
+            print_step(f"[{dut}] Running {protocol} traffic at {attn} dB")
+            # All clients start together so the remotes form one aggregate load
+            flows = []
+            if direction == "UL":
+                # One DUT-side server per remote: an iperf3 server takes a single client at a time
+                for i, remote in enumerate(remote_list):
+                    start_iperf_server(dut, user, iperf_port + i, log_dir, udp=is_udp)
+                    wait_until(cond_iperf_listening(dut, user, iperf_port + i, log_dir), timeout_s=10, desc=f"[{dut}] iperf3 server up")
+                    flows.append(Flow(remote, dut, iperf_port + i, remote))
+            elif direction in ("DL", "BIDIR"):
+                for remote in remote_list:
+                    start_iperf_server(remote, user, iperf_port, log_dir, udp=is_udp)
+                    wait_until(cond_iperf_listening(remote, user, iperf_port, log_dir), timeout_s=10, desc=f"[{remote}] iperf3 server up")
+                    flows.append(Flow(dut, remote, iperf_port, remote, bidir=direction == "BIDIR"))
+                barrier.wait()
+            report = run_flows(dut, flows, user, duration, log_dir, results, direction, attn_db=attn, udp=is_udp,
+                               bandwidth=udp_bw, parallel=parallel, ring=ring, stall_s=stall_s)
+            mbps = throughput_mbps(report)
+            marks["throughput_mbps"] = round(mbps, 3)
+            sweep.report(dut, attn, mbps)
 
-        print_step(f"[{dut}] Cleaning up iperf3 servers after attn {attn}")
-        if direction in ["DL", "BIDIR"]:
-            for remote in remote_list:
-                stop_iperf_server(remote, user, log_dir)
-        elif direction == "UL":
-            stop_iperf_server(dut, user, log_dir)
+            print_step(f"[{dut}] Cleaning up iperf3 servers after attn {attn}")
+            with span("iperf_teardown"):
+                # Only this DUT's ports: other DUTs and rows may still be using the host
+                for f in flows:
+                    stop_iperf_server(f.server, user, log_dir, port=f.port)
+        index += 1
 
-    if global_flags.get("enable_attenuator", False):
-        set_attenuation(0)
-        print_step(f"[{dut}] Reset attenuator to 0 dB")
+    sweep.finish(dut, test_params.get("dut_log_dir"))
+    # The attenuator is reset by the worker once every DUT of the row has finished
 
     print_step(f"[{dut}] ✅ RvR - {protocol} test complete")
     logger.info(f"[{dut}] ✅ RvR - {protocol} test completed successfully")
@@ -2,12 +2,28 @@ import logging
 import time
 from colored_print import print_step
 from utils.common_utils import (
-    start_iperf_server, stop_iperf_server, start_iperf_client
+    start_iperf_server, stop_iperf_server,
+    wait_until, cond_iperf_listening
 )
+from utils.traffic_runner import Flow, run_flows, server_leases
+from utils.iperf_results import IperfResultStore
+from utils.iperf_stream import get_ring
+from utils.tracing import span
 from utils.wlan_utils import initiate_assoc_connect, initiate_forgetNw
 
 logger = logging.getLogger("tests.udp")
 
+def _iperf_port(dut: str) -> int:
+    return 5300 + int(dut.split('.')[-1]) % 100
+
+def resources(dut: str, test_params: dict, remote_list: list) -> list:
+    """iperf3 server ports this DUT's flows listen on, leased by the row scheduler."""
+    return server_leases(dut, remote_list, test_params.get("TrafficDirection", "DL"), _iperf_port(dut))
+
+def estimate_duration_s(test_params: dict) -> float:
+    """Rough run time for the row scheduler: join, server setup and the iperf run."""
+    return 15 + int(test_params.get("test_cycle_count", 30))
+
 def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict, barrier):
     logger = logging.getLogger(__name__)
     print_step(f"[{dut}] Starting UDP test execution")
@@ -21,21 +37,30 @@ def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict,
     udp_bw   = test_params.get("UDPBW", "10M")
     direction = test_params.get("TrafficDirection", "DL").upper()
     log_dir  = test_params.get("test_log_path", "logs")
+    results  = IperfResultStore(dut, test_params.get("dut_log_dir", log_dir))
+
+    # Live per-second samples for progress/stall detection, if streaming is enabled
+    ring      = (get_ring(dut, progress_s=int(global_flags.get("iperf_progress_s") or 0))
+                 if global_flags.get("iperf_streaming", False) else None)
+    stall_s   = int(global_flags.get("iperf_stall_abort_s") or 0)
+    parallel  = int(test_params.get("iperf_parallel") or 1)  # -P streams per flow
 
     # Assign unique port for each DUT (UDP range)
-    iperf_port = 5300 + int(dut.split('.')[-1]) % 100
+    iperf_port = _iperf_port(dut)
 
     barrier.wait()
     # Step 1: Clear saved networks
     print_step(f"[{dut}] Forgetting network before association")
-    initiate_forgetNw(dut, user)
+    with span("forget"):
+        initiate_forgetNw(dut, user)
 
     # Step 2: Attempt to Join network
     print_step(f"[{dut}] Attempting association to {ssid} (up to 3 retries)")
     join_success = False
     for attempt in range(1, 4):
         start_t = time.time()
-        rc, out, err = initiate_assoc_connect(dut, user, ssid, sec, pwd, for_debug=True)
+        with span("join", attempt=attempt):
+            rc, out, err = initiate_assoc_connect(dut, user, ssid, sec, pwd, for_debug=True)
         end_t = time.time()
 
         if rc == 0:
@@ -44,7 +69,8 @@ def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict,
             break
         else:
             logger.warning(f"[UDP] Attempt {attempt} FAILED on {dut}: {err}")
-            time.sleep(2)
+            with span("join_backoff", "wait"):
+                time.sleep(2)
 
     if not join_success:
         logger.error(f"[{dut}] UDP test aborted: association failed after 3 attempts")
@@ -52,34 +78,33 @@ def run_test(dut: str, test_params: dict, remote_list: list, global_flags: dict,
         return
 
     # Step 3: Run UDP iperf3 traffic
+    # All clients start together so the remotes form one aggregate load
+    flows = []
     if direction == "UL":
         print_step(f"[{dut}] UL: DUT is UDP server, remote is client")
-        start_iperf_server(dut, user, iperf_port, log_dir, udp=True)
-        for remote in remote_list:
-            start_iperf_client(remote, user, dut, iperf_port, duration, log_dir, udp=True)
-    elif direction == "DL":
-        print_step(f"[{dut}] DL: Remote is UDP server, DUT is client")
-        for remote in remote_list:
-            start_iperf_server(remote, user, iperf_port, log_dir, udp=True)
-        barrier.wait()
-        for remote in remote_list:
-            start_iperf_client(dut, user, remote, iperf_port, duration, log_dir, udp=True)
-    elif direction == "BIDIR":
-        print_step(f"[{dut}] BIDIR: Remote is UDP server, DUT uses --bidir")
+        # One DUT-side server per remote: an iperf3 server takes a single client at a time
+        for i, remote in enumerate(remote_list):
+            start_iperf_server(dut, user, iperf_port + i, log_dir, udp=True)
+            wait_until(cond_iperf_listening(dut, user, iperf_port + i, log_dir), timeout_s=10, desc=f"[{dut}] iperf3 server up")
+            flows.append(Flow(remote, dut, iperf_port + i, remote))
+    elif direction in ("DL", "BIDIR"):
+        if direction == "DL":
+            print_step(f"[{dut}] DL: Remote is UDP server, DUT is client")
+        else:
+            print_step(f"[{dut}] BIDIR: Remote is UDP server, DUT uses --bidir")
         for remote in remote_list:
             start_iperf_server(remote, user, iperf_port, log_dir, udp=True)
+            wait_until(cond_iperf_listening(remote, user, iperf_port, log_dir), timeout_s=10, desc=f"[{remote}] iperf3 server up")
+            flows.append(Flow(dut, remote, iperf_port, remote, bidir=direction == "BIDIR"))
         barrier.wait()
-        for remote in remote_list:
-            start_iperf_client(dut, user, remote, iperf_port, duration, log_dir, udp=True, bidir=True)
-
-    time.sleep(duration + 5)
+    run_flows(dut, flows, user, duration, log_dir, results, direction, udp=True, bandwidth=udp_bw,
+              parallel=parallel, ring=ring, stall_s=stall_s)
 
     print_step(f"[{dut}] Stopping iperf3 UDP server(s)")
-    if direction in ["DL", "BIDIR"]:
-        for remote in remote_list:
-            stop_iperf_server(remote, user, log_dir)
-    elif direction == "UL":
-        stop_iperf_server(dut, user, log_dir)
+    with span("iperf_teardown"):
+        # Only this DUT's ports: other DUTs and rows may still be using the host
+        for f in flows:
+            stop_iperf_server(f.server, user, log_dir, port=f.port)
 
     print_step(f"[{dut}] ✅ UDP test complete")
     logger.info(f"[{dut}] UDP test completed successfully")
@@ -0,0 +1,235 @@
+import gzip
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger("utils.archive_utils")
+
+CODECS = ("gzip", "zstd")
+EXTENSIONS = {"gzip": ".tar.gz", "zstd": ".tar.zst"}
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class _CountingWriter:
+    """Wraps a writer and counts the uncompressed tar bytes passing through."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return self.raw.write(data)
+
+    def close(self):
+        self.raw.close()
+
+
+class _ParallelGzipWriter:
+    """
+    gzip-compatible writer that compresses fixed-size blocks on a thread pool
+    (zlib releases the GIL) and writes them in order as concatenated gzip
+    members, which gzip, tar and Python's gzip module all read as one stream.
+    Used when pigz is not installed.
+    """
+
+    def __init__(self, out, level: int, threads: int):
+        self.out = out
+        self.level = level
+        self.buf = bytearray()
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.pending = deque()
+        self.max_pending = threads * 2
+
+    def _flush_done(self, block: bool):
+        # Blocks are written in submission order; without block, stop at the
+        # first unfinished one unless too many are already in flight
+        while self.pending and (block or self.pending[0].done() or len(self.pending) >= self.max_pending):
+            self.out.write(self.pending.popleft().result())
+
+    def write(self, data):
+        self.buf += data
+        while len(self.buf) >= BLOCK_SIZE:
+            chunk = bytes(self.buf[:BLOCK_SIZE])
+            del self.buf[:BLOCK_SIZE]
+            self.pending.append(self.pool.submit(gzip.compress, chunk, self.level))
+            self._flush_done(block=False)
+        return len(data)
+
+    def close(self):
+        if self.buf:
+            self.pending.append(self.pool.submit(gzip.compress, bytes(self.buf), self.level))
+            self.buf.clear()
+        self._flush_done(block=True)
+        self.pool.shutdown()
+        self.out.close()
+
+
+class _PipeWriter:
+    """Feeds the tar stream to an external compressor (pigz/zstd) writing out_path."""
+
+    def __init__(self, cmd: list, out_path: str):
+        self.cmd = cmd
+        self.out = open(out_path, "wb")
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=self.out, stderr=subprocess.PIPE)
+
+    def write(self, data):
+        self.proc.stdin.write(data)
+        return len(data)
+
+    def close(self):
+        self.proc.stdin.close()
+        err = self.proc.stderr.read().decode(errors="replace").strip()
+        rc = self.proc.wait()
+        self.out.close()
+        if rc != 0:
+            raise RuntimeError(f"{self.cmd[0]} exited {rc}: {err}")
+
+
+def _open_writer(codec: str, out_path: str, level: int, threads: int):
+    """Returns (writer, engine name) for codec, preferring multi-threaded engines."""
+    if codec == "gzip":
+        if shutil.which("pigz"):
+            return _PipeWriter(["pigz", f"-{level}", "-p", str(threads), "-c"], out_path), "pigz"
+        return _ParallelGzipWriter(open(out_path, "wb"), level, threads), "zlib-blocks"
+    if codec == "zstd":
+        try:
+            import zstandard
+            out = open(out_path, "wb")
+            cctx = zstandard.ZstdCompressor(level=level, threads=threads)
+            return cctx.stream_writer(out, closefd=True), "zstandard"
+        except ImportError:
+            pass
+        if shutil.which("zstd"):
+            return _PipeWriter(["zstd", f"-{level}", f"-T{threads}", "-q", "-c"], out_path), "zstd"
+        raise ValueError("zstd archives need the 'zstandard' package or the zstd command")
+    raise ValueError(f"Unknown archive codec '{codec}' (expected one of {', '.join(CODECS)})")
+
+
+def archive_dir(src_dir: str, arcname: str, out_path: str, codec: str = "gzip", level: int = None,
+                threads: int = 1) -> dict:
+    """
+    Streams src_dir into a compressed tar at out_path (stored under arcname).
+    Files are read straight into the tar stream and compressed on `threads`
+    cores; nothing is staged on disk. Returns the archive stats.
+    """
+    level = DEFAULT_LEVELS.get(codec, 6) if level is None else level
+    t0 = time.time()
+    raw, engine = _open_writer(codec, out_path, level, max(1, threads))
+    counter = _CountingWriter(raw)
+    try:
+        with tarfile.open(fileobj=counter, mode="w|") as tar:
+            tar.add(src_dir, arcname=arcname)
+    finally:
+        counter.close()
+    elapsed = time.time() - t0
+    bytes_out = os.path.getsize(out_path)
+    return {
+        "src": src_dir,
+        "archive": out_path,
+        "codec": codec,
+        "engine": engine,
+        "level": level,
+        "threads": threads,
+        "bytes_in": counter.bytes,
+        "bytes_out": bytes_out,
+        "ratio": round(counter.bytes / bytes_out, 3) if bytes_out else 0.0,
+        "started": t0,
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(counter.bytes / 1e6 / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+class ArchiveStage:
+    """
+    Background archiver shared by every DUT worker.
+
+    submit() queues a DUT folder and returns immediately, so the worker can
+    go on to its next test row while the archive is compressed in a separate
+    process. Jobs run on a small process pool and each job gets an equal
+    share of the cores, so DUTs finishing together do not all fight for the
+    same CPU. wait_all() blocks until every queued archive is written and
+    returns their stats.
+    """
+
+    def __init__(self, codec: str = "gzip", level: int = None, max_workers: int = None):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown archive codec '{codec}' (expected one of {', '.join(CODECS)})")
+        cpus = os.cpu_count() or 1
+        self.codec = codec
+        self.level = level
+        self.max_workers = max_workers or max(1, min(4, cpus // 2))
+        self.threads_per_job = max(1, cpus // self.max_workers)
+        # spawn: the workers are forked from a process full of threads otherwise
+        self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        self._jobs = []
+        self._lock = threading.Lock()
+
+    def submit(self, src_dir: str, arcname: str, out_base: str):
+        """Queues src_dir for archiving to out_base + the codec's extension."""
+        out_path = out_base + EXTENSIONS[self.codec]
+        fut = self._pool.submit(archive_dir, src_dir, arcname, out_path, self.codec, self.level, self.threads_per_job)
+        fut.add_done_callback(self._log_result)
+        with self._lock:
+            self._jobs.append(fut)
+        logger.info(f"Queued {src_dir} for {self.codec} archiving to {out_path}")
+        return fut
+
+    @staticmethod
+    def _log_result(fut):
+        try:
+            s = fut.result()
+        except Exception as e:
+            logger.error(f"Archive failed: {e}")
+            return
+        logger.info(
+            f"Archived {s['src']} -> {s['archive']} ({s['engine']} x{s['threads']}): "
+            f"{s['bytes_in'] / 1e6:.1f} MB in, {s['bytes_out'] / 1e6:.1f} MB out "
+            f"(ratio {s['ratio']:.2f}) in {s['seconds']:.2f}s, {s['mb_per_s']:.1f} MB/s"
+        )
+
+    def wait_all(self) -> list:
+        """Waits for every queued archive; returns the stats of those that succeeded."""
+        with self._lock:
+            jobs = list(self._jobs)
+        stats = []
+        for fut in jobs:
+            try:
+                stats.append(fut.result())
+            except Exception:
+                pass  # already logged by _log_result
+        return stats
+
+    def shutdown(self) -> list:
+        stats = self.wait_all()
+        self._pool.shutdown()
+        return stats
+
+
+_stage = None
+_stage_lock = threading.Lock()
+
+
+def get_archiver(codec: str = "gzip", level: int = None, max_workers: int = None) -> ArchiveStage:
+    """Returns the process-wide ArchiveStage, creating it on first use."""
+    global _stage
+    with _stage_lock:
+        if _stage is None:
+            _stage = ArchiveStage(codec, level, max_workers)
+        return _stage
+
+
+def shutdown_archiver() -> list:
+    """Waits for all background archives and stops the pool; returns their stats."""
+    global _stage
+    with _stage_lock:
+        stage, _stage = _stage, None
+    return stage.shutdown() if stage else []
@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+from . import common_utils
+from .ssh_session import get_pool
+
+logger = logging.getLogger("utils.async_engine")
+
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_MAX_COMMANDS = 128
+DEFAULT_PER_HOST_LIMIT = 4
+# Traffic runs for the whole measurement and must start together with its
+# row's other flows, so it is exempt from the command limits; it is bounded
+# by the admitted DUTs and their flows instead
+TRAFFIC_COMMANDS = ("iperf3 -c ",)
+
+
+def is_traffic(command: str) -> bool:
+    return command.lstrip().startswith(TRAFFIC_COMMANDS)
+
+
+class AsyncEngine:
+    """
+    asyncio execution mode for main.main.
+
+    Remote I/O (ssh_execute, scp_pull) runs as asyncio subprocesses on a
+    single event loop, throttled by a global command limit and a per-host
+    limit. Remote commands that stream or launch their own ssh process
+    (iperf_stream, capture_transfer, wlan_status) hold the same limits
+    through slot(). Traffic commands (TRAFFIC_COMMANDS) take neither limit,
+    so concurrent flows never start in waves, however many rows run at once.
+
+    DUT pipelines are admitted as whole barrier groups against
+    max_concurrency (a group's DUTs must run together to pass the barrier).
+    The per_dut_worker body itself is blocking code and runs on an executor
+    thread per admitted DUT, its remote calls handed to the loop. The thread
+    count is therefore max(max_concurrency, largest group), not one per
+    configured DUT: a single group larger than max_concurrency still gets a
+    thread per DUT.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_commands: int = DEFAULT_MAX_COMMANDS,
+        per_host_limit: int = DEFAULT_PER_HOST_LIMIT
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_commands = max_commands
+        self.per_host_limit = per_host_limit
+        self.loop = None
+        self._commands = None
+        self._host_limits = {}
+        self._slots = 0
+        self._slots_free = None
+        self._leases = None
+        self.peak_commands = 0
+        self._active_commands = 0
+
+    # ---- remote I/O ---------------------------------------------------------
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        sem = self._host_limits.get(host)
+        if sem is None:
+            sem = self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return sem
+
+    async def _enter(self, host: str, traffic: bool):
+        if not traffic:
+            await self._commands.acquire()
+            try:
+                await self._host_limit(host).acquire()
+            except BaseException:
+                self._commands.release()
+                raise
+        self._active_commands += 1
+        self.peak_commands = max(self.peak_commands, self._active_commands)
+
+    def _exit(self, host: str, traffic: bool):
+        self._active_commands -= 1
+        if not traffic:
+            self._host_limit(host).release()
+            self._commands.release()
+
+    @asynccontextmanager
+    async def _limits(self, host: str, traffic: bool = False):
+        await self._enter(host, traffic)
+        try:
+            yield
+        finally:
+            self._exit(host, traffic)
+
+    @contextmanager
+    def slot(self, host: str, traffic: bool = False):
+        """Holds the command limits from a DUT thread around a subprocess the caller runs itself."""
+        self._call(self._enter(host, traffic))
+        try:
+            yield
+        finally:
+            self.loop.call_soon_threadsafe(self._exit, host, traffic)
+
+    async def _run(self, host: str, argv: list, traffic: bool = False):
+        async with self._limits(host, traffic):
+            start = time.time()
+            proc = await asyncio.create_subprocess_exec(
+                *argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            out, err = await proc.communicate()
+        get_pool().record(host, time.time() - start)
+        return proc.returncode, out.decode(errors="replace"), err.decode(errors="replace")
+
+    async def ssh_execute_async(self, host: str, user: str, command: str, log_dir: str = None):
+        """Async counterpart of common_utils.ssh_execute, with the same logging."""
+        try:
+            # Opening a master may block on a handshake; keep it off the loop
+            prefix = await asyncio.to_thread(get_pool().ssh_args, host, user)
+            start = time.time()
+            rc, out, err = await self._run(host, prefix + [command], traffic=is_traffic(command))
+            if rc == 255:
+                await asyncio.to_thread(get_pool().revalidate, host, user)
+            common_utils.write_ssh_log(log_dir, host, user, command, out, err, rc, start)
+            return rc, out.strip(), err.strip()
+        except Exception as e:
+            logger.error(f"SSH execution failed: {e}", exc_info=True)
+            return 1, "", str(e)
+
+    async def scp_pull_async(self, host: str, user: str, remote_path: str, local_path: str) -> int:
+        """Async counterpart of common_utils.scp_pull."""
+        try:
+            prefix = await asyncio.to_thread(get_pool().scp_args, host, user)
+            rc, _, _ = await self._run(host, prefix + [f"{user}@{host}:{remote_path}", local_path])
+            return rc
+        except Exception as e:
+            logger.error(f"SCP from {host} failed: {e}", exc_info=True)
+            return 1
+
+    # Blocking entry points used by common_utils while the engine is installed
+    def ssh_execute(self, host: str, user: str, command: str, log_dir: str = None):
+        return self._call(self.ssh_execute_async(host, user, command, log_dir))
+
+    def scp_pull(self, host: str, user: str, remote_path: str, local_path: str) -> int:
+        return self._call(self.scp_pull_async(host, user, remote_path, local_path))
+
+    def _call(self, coro):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            raise RuntimeError("Blocking remote call made from the event loop thread")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    # ---- scheduling ---------------------------------------------------------
+
+    async def _acquire_slots(self, n: int):
+        async with self._slots_free:
+            await self._slots_free.wait_for(lambda: self._slots + n <= self.max_concurrency or self._slots == 0)
+            self._slots += n
+
+    async def _release_slots(self, n: int):
+        async with self._slots_free:
+            self._slots -= n
+            self._slots_free.notify_all()
+
+    def _leases_released(self):
+        """RowScheduler listener; may run on any thread."""
+        self.loop.call_soon_threadsafe(lambda: self.loop.create_task(self._wake_lease_waiters()))
+
+    async def _wake_lease_waiters(self):
+        async with self._leases:
+            self._leases.notify_all()
+
+    async def _lease(self, scheduler, index: int):
+        """Waits on the loop (no thread parked per queued row) until the row holds its leases."""
+        if scheduler.try_acquire(index, log_queued=True):
+            return
+        async with self._leases:
+            await self._leases.wait_for(lambda: scheduler.try_acquire(index))
+
+    async def _run_group(self, executor, worker, group: dict, worker_args: tuple, scheduler=None, index=None):
+        if scheduler is not None:
+            # Shared equipment first, then DUT slots: a queued row holds no slots while it waits
+            await self._lease(scheduler, index)
+            start = time.time()
+        try:
+            await self._run_admitted(executor, worker, group, worker_args)
+        finally:
+            if scheduler is not None:
+                scheduler.release(index, time.time() - start)
+
+    async def _run_admitted(self, executor, worker, group: dict, worker_args: tuple):
+        duts = group["duts"]
+        if len(duts) > self.max_concurrency:
+            logger.warning(
+                f"Barrier group {group['name']} has {len(duts)} DUTs, above max_concurrency "
+                f"{self.max_concurrency}; running it alone"
+            )
+        await self._acquire_slots(len(duts))
+        try:
+            barrier = threading.Barrier(len(duts))
+            logger.info(f"[async] Starting group {group['name']} with {len(duts)} DUT(s)")
+            await asyncio.gather(*[
+                self.loop.run_in_executor(
+                    executor, worker, dut, group["remotes"], group["params"], *worker_args, barrier
+                )
+                for dut in duts
+            ])
+        finally:
+            await self._release_slots(len(duts))
+
+    async def run_groups(self, groups: list, worker, worker_args: tuple, scheduler=None):
+        """
+        Runs every group (dict with name, duts, remotes, params) through worker,
+        which has per_dut_worker's signature. worker_args is
+        (global_flags, sniffer_devs, sniffer_params). With a
+        row_scheduler.RowScheduler, each group first waits for its leases.
+        """
+        self.loop = asyncio.get_running_loop()
+        self._commands = asyncio.Semaphore(self.max_commands)
+        self._slots_free = asyncio.Condition()
+        self._leases = asyncio.Condition()
+
+        largest = max((len(g["duts"]) for g in groups), default=1)
+        workers = max(self.max_concurrency, largest)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dut")
+        if scheduler is not None:
+            scheduler.add_listener(self._leases_released)
+        common_utils.set_command_runner(self)
+        try:
+            results = await asyncio.gather(
+                *[self._run_group(executor, worker, g, worker_args, scheduler, i)
+                  for i, g in enumerate(groups)],
+                return_exceptions=True
+            )
+            for g, r in zip(groups, results):
+                if isinstance(r, Exception):
+                    logger.error(f"[async] Group {g['name']} failed: {r}", exc_info=r)
+        finally:
+            common_utils.set_command_runner(None)
+            executor.shutdown(wait=True)
+        logger.info(f"[async] All groups complete; peak concurrent remote commands: {self.peak_commands}")
+
+    def run(self, groups: list, worker, worker_args: tuple, scheduler=None):
+        """Blocking wrapper around run_groups()."""
+        asyncio.run(self.run_groups(groups, worker, worker_args, scheduler))
@@ -1,35 +1,480 @@
+import json
 import logging
+import os
+import select
+import shlex
+import socket
+import socketserver
 import subprocess
+import threading
 import time
 
 logger = logging.getLogger("utils.attenuator_utils")
 
-def set_attenuation(level_db: int):
+# Control session protocol, one text line per request and reply:
+#   SET 1=30 2=30.25   -> OK | ERR <reason>    (accepted; the hardware then settles)
+#   GET                -> 1=30 2=30.25         (levels the hardware currently applies)
+SETTLE_TIMEOUT_S = 2.0
+SETTLE_POLL_S = 0.02         # readback polling; faster only floods the controller
+STEP_DB = 0.25               # hardware resolution: readback within half a step counts as applied
+CONNECT_TIMEOUT_S = 5
+REPLY_TIMEOUT_S = 5          # a silent controller fails the request instead of hanging the row
+SIM_ADDRESS = "sim"
+
+
+def _format_levels(levels: dict) -> str:
+    return " ".join(f"{ch}={db:g}" for ch, db in sorted(levels.items()))
+
+
+def _parse_levels(text: str) -> dict:
+    levels = {}
+    for item in text.split():
+        ch, _, db = item.partition("=")
+        levels[int(ch)] = float(db)
+    return levels
+
+
+class _CliTransport:
+    """The classic attenuator_cli: one process per set, all channels at once, no readback."""
+
+    name = "cli"
+
+    def set(self, levels: dict):
+        values = set(levels.values())
+        if len(values) != 1:
+            raise ValueError("attenuator_cli sets every channel to one level; per-channel levels need a session")
+        ret = subprocess.call(["attenuator_cli", "set", f"{values.pop():g}"])
+        if ret != 0:
+            raise RuntimeError(f"attenuator_cli returned {ret}")
+
+    def get(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class _SessionTransport:
     """
-    Sets the attenuator to the specified dB level.
+    Long-lived control session: a TCP connection to the attenuator's text
+    port (host:port) or a command run once with the protocol on its
+    stdin/stdout (cmd:<command line>). Reconnects once if the link drops
+    or a reply takes longer than REPLY_TIMEOUT_S.
     """
-    cmd = f"attenuator_cli set {level_db}"
-    try:
-        ret = subprocess.call(cmd, shell=True)
-        if ret == 0:
-            logger.info(f"Attenuator set to {level_db} dB")
+
+    def __init__(self, address: str):
+        self.address = address
+        self.name = "process" if address.startswith("cmd:") else "tcp"
+        self._io = None
+        self._proc = None
+        self._sock = None
+        self._buf = b""
+
+    def _connect(self):
+        if self.address.startswith("cmd:"):
+            self._proc = subprocess.Popen(
+                shlex.split(self.address[4:]), stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0
+            )
+            self._io = (self._proc.stdout, self._proc.stdin)
         else:
-            logger.error(f"Attenuator CLI returned {ret} for level {level_db}")
+            host, _, port = self.address.rpartition(":")
+            self._sock = socket.create_connection((host, int(port)), timeout=CONNECT_TIMEOUT_S)
+            self._sock.settimeout(REPLY_TIMEOUT_S)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            f = self._sock.makefile("rwb", buffering=0)
+            self._io = (f, f)
+        logger.info(f"Attenuator control session opened ({self.address})")
+
+    def request(self, line: str) -> str:
+        for attempt in (1, 2):
+            try:
+                if self._io is None:
+                    self._connect()
+                reader, writer = self._io
+                writer.write(f"{line}\n".encode())
+                reply = self._read_reply(reader)
+                if not reply:
+                    raise ConnectionError("attenuator session closed")
+                return reply.decode().strip()
+            except (OSError, ConnectionError) as e:
+                self.close()
+                if attempt == 2:
+                    raise
+                logger.warning(f"Attenuator session lost ({e}); reconnecting")
+
+    def _read_reply(self, reader) -> bytes:
+        """One reply line; the socket carries its own timeout, the pipe is waited on with select."""
+        if self._proc is None:
+            return reader.readline()
+        deadline = time.monotonic() + REPLY_TIMEOUT_S
+        fd = reader.fileno()
+        while b"\n" not in self._buf:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise TimeoutError(f"no reply from attenuator within {REPLY_TIMEOUT_S}s")
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                return b""
+            self._buf += chunk
+        reply, _, self._buf = self._buf.partition(b"\n")
+        return reply + b"\n"
+
+    def set(self, levels: dict):
+        reply = self.request(f"SET {_format_levels(levels)}")
+        if reply != "OK":
+            raise RuntimeError(f"attenuator refused {_format_levels(levels)}: {reply}")
+
+    def get(self) -> dict:
+        return _parse_levels(self.request("GET"))
+
+    def close(self):
+        for closer in (self._sock, self._proc and self._proc.stdin):
+            try:
+                if closer:
+                    closer.close()
+            except OSError:
+                pass
+        if self._proc:
+            try:
+                self._proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+        self._io = self._proc = self._sock = None
+        self._buf = b""
+
+
+class AttenuatorDriver:
+    """
+    Sets the attenuator through one transport and records every step:
+    target levels, levels read back, and settle latency (request sent until
+    the readback matches; request round trip for the CLI, which has no
+    readback). Steps whose levels are already applied are skipped, so the
+    DUTs of one RvR row setting the same step cost a single command. Levels
+    within half of step_db (the hardware resolution) count as equal.
+    """
+
+    def __init__(self, transport, channels: list = (1,), settle_timeout_s: float = SETTLE_TIMEOUT_S,
+                 step_db: float = STEP_DB):
+        self.transport = transport
+        self.channels = list(channels)
+        self.settle_timeout_s = settle_timeout_s
+        self.tolerance_db = step_db / 2
+        self.applied = {}
+        self.steps = []
+        self._lock = threading.Lock()
+
+    def _matches(self, actual: dict, levels: dict) -> bool:
+        return all(actual.get(ch) is not None and abs(actual[ch] - db) <= self.tolerance_db
+                   for ch, db in levels.items())
+
+    def set_levels(self, levels: dict, force: bool = False) -> dict:
+        """Applies {channel: dB} in one command and waits until it settles. Returns the step record."""
+        levels = {int(ch): float(db) for ch, db in levels.items()}
+        with self._lock:
+            if not force and self._matches(self.applied, levels):
+                return {"ts": time.time(), "target": levels, "readback": levels, "settle_s": 0.0, "skipped": True}
+            start = time.perf_counter()
+            ts = time.time()
+            self.transport.set(levels)
+            readback = self.transport.get()
+            while readback is not None and not self._matches(readback, levels):
+                if time.perf_counter() - start > self.settle_timeout_s:
+                    logger.warning(f"Attenuator reads back {_format_levels(readback)} "
+                                   f"{self.settle_timeout_s}s after setting {_format_levels(levels)}")
+                    break
+                time.sleep(SETTLE_POLL_S)
+                readback = self.transport.get()
+            settle_s = time.perf_counter() - start
+            self.applied.update(readback if readback is not None else levels)
+            step = {"ts": ts, "target": levels, "readback": readback, "settle_s": round(settle_s, 6),
+                    "transport": self.transport.name}
+            self.steps.append(step)
+        return step
+
+    def set_all(self, level_db: float, force: bool = False) -> dict:
+        return self.set_levels({ch: level_db for ch in self.channels}, force=force)
+
+    def read_levels(self):
+        """Levels the hardware reports, or None when the transport has no readback."""
+        with self._lock:
+            return self.transport.get()
+
+    def ramp(self, profile: list, dwell_s: float) -> list:
+        """
+        Steps through profile (a list of dB levels for every channel, or of
+        {channel: dB} dicts) holding each step dwell_s after the previous one
+        started. Steps are paced against the ramp's start, so settle time and
+        scheduling jitter do not accumulate; dwell_s may be sub-second.
+        """
+        records = []
+        start = time.monotonic()
+        for i, levels in enumerate(profile):
+            target = start + i * dwell_s
+            delay = target - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if not isinstance(levels, dict):
+                levels = {ch: levels for ch in self.channels}
+            step = dict(self.set_levels(levels), late_s=round(max(0.0, -delay), 6))
+            records.append(step)
+        if profile and dwell_s > 0:
+            time.sleep(max(0.0, start + len(profile) * dwell_s - time.monotonic()))
+        return records
+
+    def close(self):
+        with self._lock:
+            self.transport.close()
+
+
+class _SimHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        sim = self.server.sim
+        for raw in self.rfile:
+            line = raw.decode().strip()
+            if not line:
+                continue
+            verb, _, args = line.partition(" ")
+            if verb.upper() == "SET":
+                try:
+                    reply = sim.set(_parse_levels(args))
+                except ValueError as e:
+                    reply = f"ERR {e}"
+            elif verb.upper() == "GET":
+                reply = _format_levels(sim.get())
+            else:
+                reply = f"ERR unknown command {verb}"
+            self.wfile.write(f"{reply}\n".encode())
+
+
+class AttenuatorSimulator:
+    """
+    Local stand-in for a programmable attenuator speaking the session
+    protocol on 127.0.0.1. A new level is applied base_settle_s plus
+    settle_per_db_s per dB of change after the SET is accepted; until then
+    GET returns the previous level, as real hardware does.
+    """
+
+    def __init__(self, channels: int = 4, max_db: float = 95.0, base_settle_s: float = 0.002,
+                 settle_per_db_s: float = 0.0002):
+        self.channels = channels
+        self.max_db = max_db
+        self.base_settle_s = base_settle_s
+        self.settle_per_db_s = settle_per_db_s
+        self.commands = 0
+        self._levels = {ch: (0.0, 0.0, 0.0) for ch in range(1, channels + 1)}   # ch -> (old, new, settled_at)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def set(self, levels: dict) -> str:
+        now = time.monotonic()
+        with self._lock:
+            self.commands += 1
+            for ch, db in levels.items():
+                if ch not in self._levels or not 0 <= db <= self.max_db:
+                    raise ValueError(f"channel {ch} level {db:g} out of range")
+            for ch, db in levels.items():
+                current = self._current(ch, now)
+                self._levels[ch] = (current, db, now + self.base_settle_s + abs(db - current) * self.settle_per_db_s)
+        return "OK"
+
+    def _current(self, ch: int, now: float) -> float:
+        old, new, settled_at = self._levels[ch]
+        return new if now >= settled_at else old
+
+    def get(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {ch: self._current(ch, now) for ch in self._levels}
+
+    def start(self) -> str:
+        """Serves the protocol on a free local port; returns its host:port address."""
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SimHandler)
+        self._server.daemon_threads = True
+        self._server.sim = self
+        threading.Thread(target=self._server.serve_forever, name="attenuator-sim", daemon=True).start()
+        host, port = self._server.server_address
+        return f"{host}:{port}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+_driver = None
+_simulator = None
+_lock = threading.Lock()
+
+
+def configure(address: str = "", channels=None, settle_timeout_s: float = SETTLE_TIMEOUT_S,
+              step_db: float = STEP_DB) -> AttenuatorDriver:
+    """
+    Applies Execution_Config settings to the process-wide driver:
+    - address: host:port of the attenuator's control port, cmd:<command line>
+      for a CLI session on stdin/stdout, "sim" for the local simulator, or
+      empty for one attenuator_cli call per step.
+    - channels: channels set_attenuation() drives ("1,2,3,4" or a list).
+    - step_db: the attenuator's resolution, for comparing readback to targets.
+    """
+    global _driver, _simulator
+    if isinstance(channels, (str, int, float)):
+        channels = [int(float(c)) for c in str(channels).split(",") if c.strip()]
+    channels = channels or [1]
+    close()
+    with _lock:
+        address = (address or "").strip()
+        if address.lower() == SIM_ADDRESS:
+            _simulator = AttenuatorSimulator(channels=max(channels))
+            address = _simulator.start()
+        transport = _SessionTransport(address) if address else _CliTransport()
+        _driver = AttenuatorDriver(transport, channels, settle_timeout_s, step_db)
+    logger.info(f"Attenuator driver: {transport.name} {address or 'attenuator_cli'}, channel(s) {channels}")
+    return _driver
+
+
+def get_driver() -> AttenuatorDriver:
+    """Returns the process-wide driver (attenuator_cli per step until configure() says otherwise)."""
+    global _driver
+    with _lock:
+        if _driver is None:
+            _driver = AttenuatorDriver(_CliTransport())
+        return _driver
+
+
+def close():
+    """Closes the control session and stops the simulator, if any."""
+    global _driver, _simulator
+    with _lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+        if _simulator is not None:
+            _simulator.stop()
+            _simulator = None
+
+
+def save_steps(path: str) -> int:
+    """Writes every step applied so far as JSON lines; returns the number of steps."""
+    steps = list(get_driver().steps)
+    if steps:
+        with open(path, "w") as f:
+            for step in steps:
+                f.write(json.dumps(step) + "\n")
+    return len(steps)
+
+
+def set_attenuation(level_db: float):
+    """
+    Sets every configured attenuator channel to the specified dB level.
+    Returns the step record (with settle_s), or None if it failed.
+    """
+    try:
+        step = get_driver().set_all(level_db)
+        if not step.get("skipped"):
+            logger.info(f"Attenuator set to {level_db} dB (settled in {step['settle_s'] * 1000:.1f} ms)")
+        return step
     except Exception as e:
         logger.error(f"Exception in set_attenuation: {e}", exc_info=True)
+        return None
+
 
-def ramp_attenuation(start_db: int, end_db: int, step_db: int, delay_s: int):
+class AttenuatorCoordinator:
+    """
+    Shared by the DUTs of one barrier group, which all drive the same
+    attenuator. The first DUT to reach a step applies it; the others wait
+    for that single hardware operation and get the same record (level,
+    applied_at, settle_s, by), so every participant sees one value and
+    timestamp per step. The final reset is reference counted: it happens
+    once every party has released, never under a DUT that is still running.
     """
-    Gradually ramps attenuator from start_db to end_db in steps of step_db.
+
+    def __init__(self, key: str, parties: int):
+        self.key = key
+        self.parties = parties
+        self.current = None
+        self._steps = {}
+        self._released = set()
+        self._lock = threading.Lock()
+
+    def apply(self, step, level_db: float, dut: str = None) -> dict:
+        """Applies level_db for step once per group; returns the published record (ok False if it failed)."""
+        with self._lock:
+            entry = self._steps.get(step)
+            owner = entry is None
+            if owner:
+                entry = self._steps[step] = {"level_db": level_db, "done": threading.Event(), "record": None}
+        if not owner:
+            if entry["level_db"] != level_db:
+                logger.warning(f"[{dut}] Step {step} of {self.key} asks for {level_db} dB; "
+                               f"the group applies {entry['level_db']} dB")
+            entry["done"].wait()
+            return entry["record"]
+        try:
+            result = set_attenuation(level_db)
+            entry["record"] = {
+                "step": step, "level_db": level_db, "applied_at": time.time(), "ok": result is not None,
+                "settle_s": result["settle_s"] if result else None, "by": dut,
+            }
+            self.current = entry["record"]
+        finally:
+            entry["done"].set()
+        return entry["record"]
+
+    def release(self, dut: str, reset_db: float = 0) -> bool:
+        """Marks dut finished; the last party resets the attenuator. Returns True for that party."""
+        with self._lock:
+            self._released.add(dut)
+            remaining = self.parties - len(self._released)
+        if remaining > 0:
+            logger.info(f"[{dut}] Attenuator reset deferred: {remaining} DUT(s) of {self.key} still running")
+            return False
+        set_attenuation(reset_db)
+        with _lock:
+            if _coordinators.get(self.key) is self:
+                del _coordinators[self.key]
+        logger.info(f"[{dut}] Attenuator reset to {reset_db} dB after all {self.parties} DUT(s) of {self.key}")
+        return True
+
+
+_coordinators = {}
+
+
+def get_coordinator(test_params: dict, parties: int) -> AttenuatorCoordinator:
     """
-    current = start_db
+    Returns the coordinator of the Test_Config row test_params belongs to
+    (by Test_Type and DUT list), creating it for parties DUTs on first use.
+    """
+    key = f"{test_params.get('Test_Type')}[{test_params.get('dut')}]"
+    with _lock:
+        coordinator = _coordinators.get(key)
+        if coordinator is None:
+            coordinator = _coordinators[key] = AttenuatorCoordinator(key, parties)
+        return coordinator
+
+
+def linear_profile(start_db: float, end_db: float, step_db: float) -> list:
+    """Levels from start_db towards end_db in steps of step_db, end_db included when it is on the grid."""
     if step_db == 0:
-        set_attenuation(current)
-        return
-
-    ascending = step_db > 0
-    while (ascending and current <= end_db) or (not ascending and current >= end_db):
-        set_attenuation(current)
-        time.sleep(delay_s)
-        current += step_db
-    logger.info(f"Attenuation ramp completed: {start_db} → {end_db} dB")
+        return [start_db]
+    if (end_db - start_db) * step_db < 0:
+        return []
+    count = int((end_db - start_db) / step_db + 1e-9) + 1
+    return [round(start_db + i * step_db, 4) for i in range(max(0, count))]
+
+
+def ramp_attenuation(start_db: float, end_db: float, step_db: float, delay_s: float):
+    """
+    Gradually ramps attenuator from start_db to end_db in steps of step_db,
+    holding each step delay_s (sub-second values are fine). Returns the step records.
+    """
+    profile = linear_profile(start_db, end_db, step_db)
+    try:
+        steps = get_driver().ramp(profile, delay_s)
+    except Exception as e:
+        logger.error(f"Exception in ramp_attenuation: {e}", exc_info=True)
+        return []
+    settles = [s["settle_s"] for s in steps if not s.get("skipped")]
+    logger.info(f"Attenuation ramp completed: {start_db} → {end_db} dB, {len(steps)} step(s)"
+                + (f", max settle {max(settles) * 1000:.1f} ms" if settles else ""))
+    return steps
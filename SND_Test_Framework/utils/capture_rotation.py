@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+import time
+
+from .common_utils import ssh_execute
+from .capture_transfer import pull_capture
+
+logger = logging.getLogger("utils.capture_rotation")
+
+DEFAULT_SEGMENTS = 4
+DEFAULT_POLL_S = 10
+
+
+def ring_args(segment_mb: int, segments: int) -> str:
+    """tcpdump-style ring buffer flags: rotate every segment_mb MB, keep at most segments files."""
+    return f"-C {int(segment_mb)} -W {int(segments)}"
+
+
+class SegmentCollector:
+    """
+    Collects the finished segments of a rotating remote capture while it runs.
+
+    The capture writes remote_prefix0, remote_prefix1, ... and wraps after
+    `segments` files, so remote disk use never exceeds segment_mb * segments.
+    Every poll_s seconds the segments that are complete (not the newest, and
+    at least segment_mb in size) are streamed back with pull_capture and
+    deleted remotely; they are stored locally in capture order as
+    {host}_{name}_00000.pcap, _00001.pcap, ...
+
+    keep_local > 0 keeps only the newest keep_local segments on disk
+    locally. finish() is called after the capture process has stopped and
+    pulls whatever is left, normally just the last segment.
+    """
+
+    def __init__(self, host: str, user: str, remote_prefix: str, local_dir: str, segment_mb: int,
+                 poll_s: float = DEFAULT_POLL_S, codec: str = "gzip", keep_local: int = 0):
+        self.host = host
+        self.user = user
+        self.remote_prefix = remote_prefix
+        self.local_dir = local_dir
+        self.segment_bytes = int(segment_mb) * 1000 * 1000
+        self.poll_s = poll_s
+        self.codec = codec
+        self.keep_local = keep_local
+        self.local_segments = []
+        self.transfers = []
+        self._seq = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        base = os.path.splitext(os.path.basename(remote_prefix))[0]
+        self._local_base = f"{host.replace('.', '_')}_{base}"
+
+    def _list_segments(self) -> list:
+        """Returns [(path, size)] of the remote segments, newest first."""
+        cmd = (
+            f"ls -1t '{self.remote_prefix}'* 2>/dev/null | "
+            "while read f; do echo \"$(wc -c < \"$f\" | tr -d ' ') $f\"; done"
+        )
+        rc, out, err = ssh_execute(self.host, self.user, cmd, self.local_dir)
+        segments = []
+        for line in out.splitlines():
+            size, _, path = line.strip().partition(" ")
+            if size.isdigit() and path:
+                segments.append((path, int(size)))
+        return segments
+
+    def _pull(self, remote_path: str):
+        name = f"{self._local_base}_{self._seq:05d}.pcap"
+        stats = pull_capture(self.host, self.user, remote_path, self.local_dir, codec=self.codec, local_name=name)
+        self.transfers.append(stats)
+        if not stats["ok"]:
+            return
+        self._seq += 1
+        self.local_segments.append(stats["local_path"])
+        while self.keep_local and len(self.local_segments) > self.keep_local:
+            old = self.local_segments.pop(0)
+            try:
+                os.remove(old)
+                logger.info(f"[{self.host}] Local retention: removed {old}")
+            except OSError as e:
+                logger.error(f"[{self.host}] Could not remove {old}: {e}")
+
+    def collect(self, final: bool = False) -> int:
+        """Pulls every finished segment (all of them when final); returns how many were pulled."""
+        with self._lock:
+            segments = self._list_segments()
+            if not final:
+                # The newest file is still being written; older ones are done
+                segments = [(p, size) for p, size in segments[1:] if size >= self.segment_bytes]
+            # Oldest first so local sequence numbers follow capture order
+            for path, _ in reversed(segments):
+                self._pull(path)
+            return len(segments)
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_s):
+            try:
+                self.collect()
+            except Exception as e:
+                logger.error(f"[{self.host}] Segment collection failed: {e}", exc_info=True)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._loop, name=f"segments-{self.host}", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"[{self.host}] Collecting {self.remote_prefix}* segments every {self.poll_s}s "
+            f"({self.segment_bytes // 1000000} MB each)"
+        )
+        return self
+
+    def finish(self) -> list:
+        """Stops background collection, pulls the remaining segments and returns all transfer stats."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.collect(final=True)
+        pulled = sum(t["local_bytes"] for t in self.transfers if t["ok"])
+        failed = sum(1 for t in self.transfers if not t["ok"])
+        logger.info(
+            f"[{self.host}] Collected {self._seq} segment(s) of {self.remote_prefix} "
+            f"({pulled / 1e6:.1f} MB, {failed} failed)"
+        )
+        return self.transfers
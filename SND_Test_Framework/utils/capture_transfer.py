@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import os
+import subprocess
+import time
+import zlib
+
+from .common_utils import command_slot, ssh_execute, write_ssh_log
+from .ssh_session import get_pool
+
+logger = logging.getLogger("utils.capture_transfer")
+
+CHUNK_SIZE = 1024 * 1024
+META_MARKER = "@@SND_META"
+CODECS = ("gzip", "zstd", "none")
+
+# Remote size + sha256 (GNU sha256sum or BSD/macOS shasum), printed to stderr
+# ahead of the data so the whole transfer is one SSH command
+_META_CMD = (
+    "__sz=$(wc -c < \"$__f\" | tr -d ' '); "
+    "__sum=$( (sha256sum \"$__f\" 2>/dev/null || shasum -a 256 \"$__f\" 2>/dev/null) | cut -d' ' -f1); "
+    f"echo \"{META_MARKER} $__sz $__sum\" >&2"
+)
+
+
+def _zstd_decompressor():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def _stream_command(remote_path: str, codec: str) -> str:
+    compress = {"gzip": "gzip -1 -c \"$__f\"", "zstd": "zstd -1 -T0 -q -c \"$__f\"", "none": "cat \"$__f\""}[codec]
+    return f"__f='{remote_path}'; [ -f \"$__f\" ] || {{ echo 'no such file' >&2; exit 2; }}; {_META_CMD}; {compress}"
+
+
+def _parse_meta(stderr: str):
+    for line in stderr.splitlines():
+        if line.startswith(META_MARKER):
+            parts = line.split()
+            size = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else -1
+            digest = parts[2] if len(parts) > 2 else ""
+            return size, digest
+    return -1, ""
+
+
+def pull_capture(host: str, user: str, remote_path: str, local_dir: str, codec: str = "gzip",
+                 delete_remote: bool = True, log_dir: str = None, local_name: str = None) -> dict:
+    """
+    Streams a finished remote capture into local_dir in a single pass.
+
+    The file is compressed on the remote side, sent over the host's pooled
+    SSH session and decompressed and hashed locally as it arrives, so a
+    multi-GB capture never needs a temporary copy or a separate scp. Size and
+    SHA-256 are checked against the remote file; the remote copy is deleted
+    only when both match (and delete_remote is set).
+
+    local_name overrides the default {host}_{remote basename} file name.
+    Returns the transfer stats; "ok" is False if the transfer or check failed.
+    """
+    log_dir = log_dir or local_dir
+    os.makedirs(local_dir, exist_ok=True)
+    if codec == "zstd" and _zstd_decompressor() is None:
+        logger.warning(f"[{host}] zstandard not installed, pulling {remote_path} with gzip instead")
+        codec = "gzip"
+    if codec not in CODECS:
+        raise ValueError(f"Unknown capture codec '{codec}' (expected one of {', '.join(CODECS)})")
+
+    local_path = os.path.join(local_dir, local_name or f"{host.replace('.', '_')}_{os.path.basename(remote_path)}")
+    decoder = {"gzip": lambda: zlib.decompressobj(wbits=31), "zstd": _zstd_decompressor}.get(codec)
+    decoder = decoder() if decoder else None
+    sha = hashlib.sha256()
+    bytes_wire = bytes_local = 0
+    command = _stream_command(remote_path, codec)
+
+    pool = get_pool()
+    t0 = time.time()
+    with command_slot(host):
+        proc = subprocess.Popen(pool.ssh_args(host, user) + [command], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with open(local_path, "wb") as out:
+            while True:
+                chunk = proc.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                bytes_wire += len(chunk)
+                data = decoder.decompress(chunk) if decoder else chunk
+                if data:
+                    out.write(data)
+                    sha.update(data)
+                    bytes_local += len(data)
+            if decoder is not None and hasattr(decoder, "flush"):
+                tail = decoder.flush()
+                out.write(tail)
+                sha.update(tail)
+                bytes_local += len(tail)
+        err = proc.stderr.read().decode(errors="replace")
+        rc = proc.wait()
+    elapsed = time.time() - t0
+    pool.record(host, elapsed)
+    if rc == 255:
+        pool.revalidate(host, user)
+
+    remote_size, remote_sum = _parse_meta(err)
+    digest = sha.hexdigest()
+    size_ok = rc == 0 and remote_size == bytes_local
+    sum_ok = size_ok and (remote_sum == digest if remote_sum else True)
+    stats = {
+        "host": host,
+        "remote_path": remote_path,
+        "local_path": local_path,
+        "codec": codec,
+        "rc": rc,
+        "remote_bytes": remote_size,
+        "local_bytes": bytes_local,
+        "wire_bytes": bytes_wire,
+        "sha256": digest,
+        "checksum_verified": bool(remote_sum) and sum_ok,
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(bytes_local / 1e6 / elapsed, 2) if elapsed > 0 else 0.0,
+        "ok": sum_ok,
+        "remote_deleted": False,
+    }
+    errors = "\n".join(l for l in err.splitlines() if not l.startswith(META_MARKER))
+    write_ssh_log(log_dir, host, user, command, f"<{bytes_wire} bytes streamed to {local_path}>\n", errors,
+                  rc, time.time() - elapsed)
+
+    if not sum_ok:
+        if bytes_local == 0:
+            os.remove(local_path)
+        logger.error(
+            f"[{host}] Pull of {remote_path} failed verification (rc={rc}, remote {remote_size} bytes "
+            f"{remote_sum or '-'}, local {bytes_local} bytes {digest}): {errors.strip()}"
+        )
+        return stats
+    if not remote_sum:
+        logger.warning(f"[{host}] No sha256 tool on host, {remote_path} verified by size only")
+
+    if delete_remote:
+        rc, _, rm_err = ssh_execute(host, user, f"rm -f '{remote_path}'", log_dir)
+        stats["remote_deleted"] = rc == 0
+        if rc != 0:
+            logger.error(f"[{host}] Could not delete {remote_path}: {rm_err}")
+
+    logger.info(
+        f"[{host}] Pulled {remote_path} -> {local_path}: {bytes_local / 1e6:.1f} MB "
+        f"({bytes_wire / 1e6:.1f} MB on the wire, {codec}) in {elapsed:.2f}s, {stats['mb_per_s']:.1f} MB/s"
+    )
+    return stats
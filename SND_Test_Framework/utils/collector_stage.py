@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import tracing
+
+logger = logging.getLogger("utils.collector_stage")
+
+
+class CollectorStage:
+    """
+    Starts and stops a DUT's always-on log collectors concurrently.
+
+    Each collector is registered with a start callable (its return value is
+    the handle passed to stop) and an optional stop callable. `after` names
+    collectors that must have started first; on teardown the order is
+    reversed, so a collector is stopped only after everything that depends on
+    it. `stop_after` names collectors whose stop must finish first instead,
+    for a collector that has to outlive one it started after (e.g. logging
+    that must cover the final snapshot). start_all() is the readiness gate:
+    it returns once every collector has started or failed to start. A failed
+    start does not hold the test back, so check is_started() where a
+    collector is required.
+
+    Collectors are best effort, like the serial code they replace: a failing
+    start is logged and its stop is skipped, but the rest of the stage runs.
+    """
+
+    def __init__(self, dut: str, max_workers: int = 8):
+        self.dut = dut
+        self.max_workers = max_workers
+        self.collectors = {}
+        self.handles = {}
+        self.timings = {}
+
+    def add(self, name: str, start, stop=None, after=(), stop_after=()):
+        self.collectors[name] = {"start": start, "stop": stop, "after": list(after), "stop_after": list(stop_after)}
+        self.timings[name] = {"start_s": None, "stop_s": None, "started": False, "stopped": False}
+        return self
+
+    def _start_one(self, name: str):
+        t0 = time.time()
+        try:
+            with tracing.span(f"start:{name}", "collector", dut=self.dut):
+                handle = self.collectors[name]["start"]()
+            self.handles[name] = handle
+            self.timings[name]["started"] = True
+            logger.info(f"[{self.dut}] Collector {name} started in {time.time() - t0:.2f}s")
+        except Exception as e:
+            logger.error(f"[{self.dut}] Collector {name} failed to start: {e}", exc_info=True)
+        finally:
+            self.timings[name]["start_s"] = round(time.time() - t0, 3)
+
+    def _stop_one(self, name: str):
+        stop = self.collectors[name]["stop"]
+        if stop is None or not self.timings[name]["started"]:
+            return
+        t0 = time.time()
+        try:
+            with tracing.span(f"stop:{name}", "collector", dut=self.dut):
+                stop(self.handles.get(name))
+            self.timings[name]["stopped"] = True
+            logger.info(f"[{self.dut}] Collector {name} stopped in {time.time() - t0:.2f}s")
+        except Exception as e:
+            logger.error(f"[{self.dut}] Collector {name} failed to stop: {e}", exc_info=True)
+        finally:
+            self.timings[name]["stop_s"] = round(time.time() - t0, 3)
+
+    def _run(self, fn, deps: dict):
+        """Runs fn(name) for every collector once all of its deps have finished."""
+        done = set()
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"collect-{self.dut}") as pool:
+            while len(done) < len(deps):
+                for name, needs in deps.items():
+                    if name in done or name in pending.values():
+                        continue
+                    if all(n in done or n not in deps for n in needs):
+                        pending[pool.submit(fn, name)] = name
+                finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    done.add(pending.pop(fut))
+
+    @staticmethod
+    def _check_cycles(deps: dict):
+        seen, stack = set(), set()
+
+        def visit(name):
+            if name in stack:
+                raise ValueError(f"Collector dependency cycle through '{name}'")
+            if name in seen or name not in deps:
+                return
+            stack.add(name)
+            for dep in deps[name]:
+                visit(dep)
+            stack.discard(name)
+            seen.add(name)
+
+        for name in deps:
+            visit(name)
+
+    def _stop_deps(self) -> dict:
+        """Teardown order: the reverse of `after`, except where a collector asked to stop after the other."""
+        deps = {n: list(c["stop_after"]) for n, c in self.collectors.items()}
+        for name, c in self.collectors.items():
+            for dep in c["after"]:
+                if dep in deps and dep not in c["stop_after"]:
+                    deps[dep].append(name)
+        return deps
+
+    def start_all(self) -> float:
+        """Starts every collector concurrently; returns the stage wall time."""
+        deps = {n: c["after"] for n, c in self.collectors.items()}
+        self._check_cycles(deps)
+        self._check_cycles(self._stop_deps())
+        t0 = time.time()
+        self._run(self._start_one, deps)
+        elapsed = time.time() - t0
+        logger.info(f"[{self.dut}] Collectors ready in {elapsed:.2f}s")
+        return elapsed
+
+    def stop_all(self) -> float:
+        """Stops every started collector concurrently, dependents first (see stop_after)."""
+        t0 = time.time()
+        self._run(self._stop_one, self._stop_deps())
+        elapsed = time.time() - t0
+        logger.info(f"[{self.dut}] Collectors stopped in {elapsed:.2f}s")
+        return elapsed
+
+    def is_started(self, name: str) -> bool:
+        return self.timings.get(name, {}).get("started", False)
+
+    def write_timings(self, output_dir: str):
+        """Writes per-collector start/stop timings to collector_timing.json."""
+        path = os.path.join(output_dir, "collector_timing.json")
+        with open(path, "w") as f:
+            json.dump(self.timings, f, indent=2)
+        return path
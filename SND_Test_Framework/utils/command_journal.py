@@ -0,0 +1,253 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+logger = logging.getLogger("utils.command_journal")
+
+JOURNAL_SUFFIX = "_ssh_output.jsonl"
+DEFAULT_LOG_DIR = "logs"
+FLUSH_BYTES = 64 * 1024
+FLUSH_S = 1.0
+ROTATE_BYTES = 64 * 1024 * 1024
+KEEP_ROTATED = 5
+BODY_LIMIT = 4096
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    half = limit // 2
+    return f"{text[:half]}\n...[{len(text) - 2 * half} chars omitted]...\n{text[-half:]}"
+
+
+class CommandJournal:
+    """
+    Append-only JSON-lines journal of the remote commands run on one host.
+    The file stays open; entries are buffered and written once flush_bytes
+    have accumulated or the oldest entry is flush_s old (the background
+    flusher covers hosts that go quiet). Once the file passes rotate_bytes it
+    is gzipped to {path}.1.gz, older rotations shift up and the oldest of
+    keep_rotated is dropped.
+    """
+
+    def __init__(self, path: str, flush_bytes: int = FLUSH_BYTES, flush_s: float = FLUSH_S,
+                 rotate_bytes: int = ROTATE_BYTES, keep_rotated: int = KEEP_ROTATED):
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.flush_s = flush_s
+        self.rotate_bytes = rotate_bytes
+        self.keep_rotated = keep_rotated
+        self._buffer = []
+        self._buffered = 0
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._closed = False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def append(self, entry: dict):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._buffer.append(line)
+            self._buffered += len(line)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._buffered >= self.flush_bytes or time.monotonic() - self._oldest >= self.flush_s:
+                self._flush_locked()
+
+    def flush(self, stale_only: bool = False):
+        with self._lock:
+            if self._buffer and (not stale_only or time.monotonic() - self._oldest >= self.flush_s):
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._closed:
+            # A late entry after close(): append it without keeping a handle open
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(self._buffer))
+            self._size += self._buffered
+            self._buffer, self._buffered, self._oldest = [], 0, None
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write("".join(self._buffer))
+        self._file.flush()
+        self._size += self._buffered
+        self._buffer, self._buffered, self._oldest = [], 0, None
+        if self._size >= self.rotate_bytes:
+            self._rotate_locked()
+
+    def _rotate_locked(self):
+        self._file.close()
+        self._file = None
+        for n in range(self.keep_rotated - 1, 0, -1):
+            older = f"{self.path}.{n}.gz"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{n + 1}.gz")
+        with open(self.path, "rb") as src, gzip.open(f"{self.path}.1.gz", "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.remove(self.path)
+        self._size = 0
+        logger.info(f"Rotated command journal {self.path}")
+
+    def close(self):
+        with self._lock:
+            if self._buffer:
+                self._flush_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._closed = True
+
+
+_journals = {}
+_host_dirs = {}              # host -> {log_dir: number of threads that registered it}
+_context = threading.local()
+_lock = threading.Lock()
+_flusher = None
+
+
+def _thread_dirs() -> dict:
+    dirs = getattr(_context, "dirs", None)
+    if dirs is None:
+        dirs = _context.dirs = {}
+    return dirs
+
+
+def set_host_log_dir(host: str, log_dir: str):
+    """
+    Journals commands the calling thread runs on host without an explicit
+    log_dir into log_dir (e.g. the DUT's common folder). Other threads use it
+    only while it is the host's single registered folder, so a remote shared
+    by several DUTs never lands in whichever DUT registered last.
+    """
+    with _lock:
+        previous = _thread_dirs().get(host)
+        if previous is not None:
+            _unregister_locked(host, previous)
+        _thread_dirs()[host] = log_dir
+        counts = _host_dirs.setdefault(host, {})
+        counts[log_dir] = counts.get(log_dir, 0) + 1
+
+
+def _unregister_locked(host: str, log_dir: str):
+    counts = _host_dirs.get(host, {})
+    if counts.get(log_dir, 0) > 1:
+        counts[log_dir] -= 1
+    else:
+        counts.pop(log_dir, None)
+        if not counts:
+            _host_dirs.pop(host, None)
+
+
+def clear_host_log_dirs():
+    """Drops the calling thread's registrations (its DUT is done; the thread may be reused)."""
+    with _lock:
+        dirs = _thread_dirs()
+        for host, log_dir in dirs.items():
+            _unregister_locked(host, log_dir)
+        dirs.clear()
+
+
+def _host_dir(host: str) -> str:
+    log_dir = _thread_dirs().get(host)
+    if log_dir is None:
+        registered = _host_dirs.get(host, {})
+        log_dir = next(iter(registered)) if len(registered) == 1 else DEFAULT_LOG_DIR
+    return log_dir
+
+
+def journal_path(log_dir: str, host: str) -> str:
+    return os.path.join(log_dir, f"{host.replace('.', '_')}{JOURNAL_SUFFIX}")
+
+
+def get_journal(host: str, log_dir: str = None) -> CommandJournal:
+    """Returns the shared journal for host in log_dir, opening it on first use."""
+    global _flusher
+    with _lock:
+        path = journal_path(log_dir or _host_dir(host), host)
+        journal = _journals.get(path)
+        if journal is None:
+            journal = _journals[path] = CommandJournal(path)
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="command-journal", daemon=True)
+            _flusher.start()
+        return journal
+
+
+def record(host: str, user: str, command: str, stdout: str, stderr: str, rc: int = None,
+           start_ts: float = None, end_ts: float = None, log_dir: str = None, body_limit: int = BODY_LIMIT):
+    """Appends one command, its timing, return code and (truncated) output to the host's journal."""
+    end_ts = end_ts or time.time()
+    get_journal(host, log_dir).append({
+        "host": host,
+        "user": user,
+        "cmd": command,
+        "start": start_ts if start_ts is not None else end_ts,
+        "end": end_ts,
+        "rc": rc,
+        "stdout_bytes": len(stdout),
+        "stderr_bytes": len(stderr),
+        "stdout": _truncate(stdout, body_limit),
+        "stderr": _truncate(stderr, body_limit),
+    })
+
+
+def flush_all():
+    """Writes out every buffered entry (e.g. before a DUT folder is read or archived)."""
+    with _lock:
+        journals = list(_journals.values())
+    for journal in journals:
+        journal.flush()
+
+
+def close_under(root: str):
+    """Flushes and closes every journal below root (a finished DUT's folder), releasing its file handles."""
+    prefix = os.path.join(os.path.abspath(root), "")
+    with _lock:
+        paths = [p for p in _journals if os.path.abspath(p).startswith(prefix)]
+        journals = [_journals.pop(p) for p in paths]
+    for journal in journals:
+        journal.close()
+
+
+def close_all():
+    """Flushes and closes every journal; they reopen on the next command."""
+    with _lock:
+        journals = list(_journals.values())
+        _journals.clear()
+    for journal in journals:
+        journal.close()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_S)
+        with _lock:
+            journals = list(_journals.values())
+        for journal in journals:
+            try:
+                journal.flush(stale_only=True)
+            except Exception as e:
+                logger.error(f"Flushing {journal.path} failed: {e}")
+
+
+def read_journal(path: str):
+    """Yields the entries of a journal file (plain or rotated .gz)."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+atexit.register(close_all)
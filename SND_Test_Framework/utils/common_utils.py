@@ -2,31 +2,91 @@ import os
 import time
 import logging
 import subprocess
+from contextlib import nullcontext
 
 from colored_print import print_step
-from .wlan_utils import cleanup_scan_cache, wifi_on, wifi_off
-from .sysdiag_utils import erase_logs
+from . import command_journal, tracing
+from .ssh_session import get_pool
 
 logger = logging.getLogger("utils.common_utils")
 
-def ssh_execute(host: str, user: str, command: str, log_dir: str = "logs"):
+# When set (by the asyncio engine), ssh_execute/scp_pull hand their work to
+# this object instead of blocking on a subprocess of their own.
+_command_runner = None
+
+def set_command_runner(runner):
+    """
+    Routes ssh_execute and scp_pull through runner.ssh_execute/runner.scp_pull.
+    Pass None to go back to running subprocesses directly.
+    """
+    global _command_runner
+    _command_runner = runner
+
+def command_slot(host: str, traffic: bool = False):
+    """
+    Context manager for remote commands that run an ssh process of their own
+    (streams, background launches): while the asyncio engine is installed it
+    holds the engine's command limits (traffic is exempt from them),
+    otherwise it does nothing.
     """
-    Executes an SSH command on the given host and writes stdout/stderr to log_dir.
+    runner = _command_runner
+    return runner.slot(host, traffic) if runner is not None else nullcontext()
+
+def write_ssh_log(log_dir: str, host: str, user: str, command: str, stdout: str, stderr: str,
+                  rc: int = None, start_ts: float = None):
+    """
+    Records one command and its output in the host's command journal,
+    {log_dir}/{host}_ssh_output.jsonl (see command_journal). Without a
+    log_dir the folder registered for the host is used.
+    """
+    command_journal.record(host, user, command, stdout, stderr, rc, start_ts, log_dir=log_dir)
+
+def ssh_execute(host: str, user: str, command: str, log_dir: str = None):
+    """
+    Executes an SSH command on the given host and journals stdout/stderr to
+    log_dir (default: the folder registered for the host, else "logs").
+    The command is multiplexed over the host's pooled SSH session.
     Returns (returncode, stdout, stderr)
     """
-    log_file = os.path.join(log_dir, f"{host.replace('.', '_')}_ssh_output.txt")
-    full_cmd = f"ssh {user}@{host} '{command}'"
+    with tracing.span("ssh", "ssh", host=host, cmd=command[:120]):
+        runner = _command_runner
+        if runner is not None:
+            return runner.ssh_execute(host, user, command, log_dir)
+
+        pool = get_pool()
+        try:
+            full_cmd = pool.ssh_args(host, user) + [command]
+            start = time.time()
+            result = subprocess.run(full_cmd, capture_output=True, text=True)
+            pool.record(host, time.time() - start)
+            if result.returncode == 255:
+                pool.revalidate(host, user)
+            write_ssh_log(log_dir, host, user, command, result.stdout, result.stderr, result.returncode, start)
+            return result.returncode, result.stdout.strip(), result.stderr.strip()
+        except Exception as e:
+            logger.error(f"SSH execution failed: {e}", exc_info=True)
+            return 1, "", str(e)
+
+def scp_pull(host: str, user: str, remote_path: str, local_path: str) -> int:
+    """
+    Copies remote_path from the host to local_path over the pooled SSH session.
+    Returns the scp return code.
+    """
+    with tracing.span("scp", "ssh", host=host, path=remote_path):
+        runner = _command_runner
+        if runner is not None:
+            return runner.scp_pull(host, user, remote_path, local_path)
 
-    try:
-        result = subprocess.run(full_cmd, shell=True, capture_output=True, text=True)
-        with open(log_file, "a") as f:
-            f.write(f"$ {full_cmd}\n")
-            f.write(result.stdout)
-            f.write(result.stderr)
-        return result.returncode, result.stdout.strip(), result.stderr.strip()
-    except Exception as e:
-        logger.error(f"SSH execution failed: {e}", exc_info=True)
-        return 1, "", str(e)
+        pool = get_pool()
+        try:
+            cmd = pool.scp_args(host, user) + [f"{user}@{host}:{remote_path}", local_path]
+            start = time.time()
+            ret = subprocess.call(cmd)
+            pool.record(host, time.time() - start)
+            return ret
+        except Exception as e:
+            logger.error(f"SCP from {host} failed: {e}", exc_info=True)
+            return 1
 
 def get_timestamp():
     """Returns a formatted UTC timestamp string."""
@@ -41,25 +101,84 @@ def prepare_workspace(dut: str, base_log_dir: str = "logs"):
         os.makedirs(os.path.join(dut_dir, sub), exist_ok=True)
     logger.info(f"Created workspace at {dut_dir}")
 
-    # Remote cleanup
-    erase_logs(dut, user="root")
-    clear_saved_networks(dut, user="root")
-    cleanup_scan_cache(dut, user="root")
+    # Remote cleanup and Wi-Fi restart in a single round trip. Imported here
+    # because those modules import ssh_execute from this one.
+    from .remote_batch import RemoteBatch
+    from .wlan_utils import clear_saved_networks, cleanup_scan_cache, wifi_on, wifi_off
+    from .sysdiag_utils import erase_logs
 
-    # Restart Wi-Fi
-    wifi_off(dut, user="root")
-    time.sleep(1)
-    wifi_on(dut, user="root")
+    batch = RemoteBatch(dut, "root", os.path.join(dut_dir, "common"))
+    erase_logs(dut, "root", batch=batch)
+    clear_saved_networks(dut, "root", batch=batch)
+    cleanup_scan_cache(dut, "root", batch=batch)
+    wifi_off(dut, "root", batch=batch)
+    wifi_on(dut, "root", batch=batch)
+    batch.run()
     logger.info(f"Finished remote cleanup for {dut}")
 
 def countdown(seconds: int):
     """Print a dark-orange countdown for long sleeps or traffic durations."""
-    for rem in range(seconds, 0, -1):
-        print_step(f"{rem} seconds remaining…")
-        time.sleep(1)
+    with tracing.span("countdown", "wait", seconds=seconds):
+        for rem in range(seconds, 0, -1):
+            print_step(f"{rem} seconds remaining…")
+            time.sleep(1)
     print_step("Done.")
 
-def start_iperf_server(host, user, port=5201, log_dir="logs", udp=False):
+def wait_until(
+    condition,
+    timeout_s: float = 30,
+    poll_s: float = 0.25,
+    backoff: float = 1.5,
+    max_poll_s: float = 2.0,
+    desc: str = "condition"
+) -> bool:
+    """
+    Polls condition() until it returns truthy or timeout_s elapses.
+    The poll interval starts at poll_s and grows by backoff up to max_poll_s.
+    Returns True if the condition was met before the deadline.
+    """
+    start = time.time()
+    deadline = start + timeout_s
+    interval = poll_s
+    with tracing.span("wait_until", "wait", desc=desc):
+        while True:
+            try:
+                if condition():
+                    logger.info(f"{desc} met after {time.time() - start:.2f}s")
+                    return True
+            except Exception as e:
+                logger.warning(f"{desc} check raised: {e}")
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                logger.warning(f"{desc} not met within {timeout_s}s")
+                return False
+            time.sleep(min(interval, remaining))
+            interval = min(interval * backoff, max_poll_s)
+
+def shell_wait(check_cmd: str, timeout_s: float = 10, poll_s: float = 0.2) -> str:
+    """
+    Returns a shell snippet that polls check_cmd on the remote side until it
+    succeeds or timeout_s passes, exiting non-zero on timeout. Appending it
+    to a command waits for readiness without extra SSH round trips.
+    """
+    n = max(1, int(timeout_s / poll_s))
+    return (
+        f"__w=0; until {check_cmd}; do [ $__w -ge {n} ] && break; "
+        f"sleep {poll_s}; __w=$((__w+1)); done; [ $__w -lt {n} ]"
+    )
+
+def cond_iperf_listening(host: str, user: str, port: int, log_dir: str = None):
+    """Condition: an iperf3 server is listening on host:port."""
+    cmd = f"lsof -nP -iTCP:{port} -sTCP:LISTEN > /dev/null 2>&1 || ss -ltn | grep -q ':{port} '"
+    return lambda: ssh_execute(host, user, cmd, log_dir)[0] == 0
+
+def cond_iperf_exited(host: str, user: str, server_ip: str, port: int, log_dir: str = None):
+    """Condition: no iperf3 client towards server_ip:port is running on host."""
+    # [i] keeps the pattern from matching the shell that runs pgrep
+    cmd = f"pgrep -f '[i]perf3 -c {server_ip} .*-p {port}' > /dev/null"
+    return lambda: ssh_execute(host, user, cmd, log_dir)[0] != 0
+
+def start_iperf_server(host, user, port=5201, log_dir=None, udp=False):
     """
     Starts iperf3 server on specified host and port (TCP or UDP).
     """
@@ -67,18 +186,36 @@ def start_iperf_server(host, user, port=5201, log_dir="logs", udp=False):
     cmd = f"iperf3 {proto_flag} -s -p {port} -D"
     return ssh_execute(host, user, cmd, log_dir)
 
-def stop_iperf_server(host, user, log_dir="logs"):
+def stop_iperf_server(host, user, log_dir=None, port=None):
     """
-    Stops iperf3 server via pkill.
+    Stops iperf3 server via pkill. With port, only the server started on that
+    port is stopped, so rows and DUTs sharing a host keep their own servers.
     """
-    cmd = "pkill iperf3"
+    # [i] keeps the pattern from matching the shell that runs pkill
+    cmd = f"pkill -f '[i]perf3 .*-s -p {port} '" if port else "pkill iperf3"
     return ssh_execute(host, user, cmd, log_dir)
 
-def start_iperf_client(host, user, server_ip, port, duration=10, log_dir="logs", udp=False, bidir=False):
+def start_iperf_client(host, user, server_ip, port, duration=10, log_dir=None, udp=False, bidir=False,
+                       bandwidth=None, json_output=True, ring=None, stall_s=0, parallel=1, flow_id=0,
+                       on_interval=None):
     """
     Starts iperf3 client connecting to a remote iperf3 server.
+    With json_output (the default) iperf3 runs with -J, so stdout can be fed
+    to iperf_results.IperfResultStore.add_run().
+    Passing an iperf_stream.IntervalRing switches to streaming mode: intervals
+    are pushed into the ring live (tagged with flow_id), and stall_s aborts a
+    run with no throughput, and each interval goes to on_interval(data)
+    instead of the returned document. parallel > 1 runs that many streams (-P).
     """
+    if ring is not None:
+        from .iperf_stream import stream_iperf_client
+        return stream_iperf_client(host, user, server_ip, port, duration, log_dir, ring,
+                                   udp=udp, bidir=bidir, bandwidth=bandwidth, stall_s=stall_s,
+                                   parallel=parallel, flow_id=flow_id, on_interval=on_interval)
     proto_flag = "-u" if udp else ""
     bidi_flag = "--bidir" if bidir else ""
-    cmd = f"iperf3 -c {server_ip} {proto_flag} {bidi_flag} -p {port} -t {duration} -i 1"
+    bw_flag = f"-b {bandwidth}" if bandwidth else ""
+    par_flag = f"-P {parallel}" if parallel > 1 else ""
+    json_flag = "-J" if json_output else ""
+    cmd = f"iperf3 -c {server_ip} {proto_flag} {bidi_flag} {bw_flag} {par_flag} -p {port} -t {duration} -i 1 {json_flag}"
     return ssh_execute(host, user, cmd, log_dir)
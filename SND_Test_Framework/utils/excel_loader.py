@@ -1,69 +1,169 @@
-import pandas as pd
+import hashlib
+import json
 import logging
+import os
+import time
+
+# pandas/openpyxl are imported inside the functions that parse the workbook:
+# they cost about half a second to import and cached runs never need them.
 
 logger = logging.getLogger("utils.excel_loader")
 
+SHEETS = ["Execution_Config", "Sniffer_Config", "Sniffer_Paramters", "Test_Config"]
+REQUIRED_TEST_COLUMNS = ["Test_Type", "Skipped_Execution", "TrafficType", "dut"]
+# Bump when the plan layout changes so stale cache entries are ignored
+PLAN_VERSION = 1
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "snd_test_framework")
+
 def load_execution_config(excel_path: str) -> dict:
     """
-    Reads the Execution_Config sheet and returns a dict:
+    Returns the Execution_Config sheet as a dict:
       { Name.lower(): parsed(Value) }
     """
-    df = pd.read_excel(excel_path, sheet_name="Execution_Config", engine="openpyxl")
+    return compile_workbook(excel_path)["execution"]
+
+def load_sniffer_config(excel_path: str) -> list:
+    """
+    Returns the Sniffer_Config sheet as a list of dicts:
+      [ {"name": suffix, "ip": ip, "user": user, "pass": pwd, "ifname": ifname}, ... ]
+    """
+    return compile_workbook(excel_path)["sniffers"]
+
+def load_sniffer_parameters(excel_path: str) -> dict:
+    """
+    Returns the Sniffer_Paramters sheet as a dict keyed by channel name.
+    """
+    return compile_workbook(excel_path)["sniffer_params"]
+
+def load_test_config(excel_path: str):
+    """
+    Returns the Test_Config sheet as a pandas DataFrame.
+    """
+    import pandas as pd
+    return pd.DataFrame(compile_workbook(excel_path)["tests"])
+
+def _plain(value):
+    """Converts numpy/pandas cell values to plain JSON-friendly Python values."""
+    if hasattr(value, "item"):
+        value = value.item()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+def _execution_from_df(df) -> dict:
+    import pandas as pd
     out = {}
-    for _, row in df.iterrows():
-        key = str(row["Name"]).strip().lower()
-        raw = row["Value"]
+    for name, raw in zip(df["Name"], df["Value"]):
+        key = str(name).strip().lower()
         if isinstance(raw, str) and raw.lower() in ("true", "false"):
             out[key] = raw.lower() == "true"
         elif pd.isna(raw):
             out[key] = ""
         else:
-            out[key] = raw
+            out[key] = _plain(raw)
     return out
 
-def load_sniffer_config(excel_path: str) -> list:
-    """
-    Reads Sniffer_Config sheet and returns list of dicts:
-      [ {"name": suffix, "ip": ip, "user": user, "pass": pwd, "ifname": ifname}, ... ]
-    """
-    df = pd.read_excel(excel_path, sheet_name="Sniffer_Config", engine="openpyxl")
+def _sniffers_from_df(df) -> list:
+    import pandas as pd
+    # Index by the Name column once instead of a boolean mask per field per column
+    rows = df.drop_duplicates("Name").set_index("Name")
     out = []
     for col in df.columns:
         if str(col).strip().lower() in ("name",) or str(col).startswith("Unnamed"):
             continue
-        ip = str(df.loc[df["Name"]=="ip", col].values[0]).strip()
-        user = str(df.loc[df["Name"]=="username", col].values[0]).strip()
-        pwd = str(df.loc[df["Name"]=="password", col].values[0]).strip()
-        suffix = str(df.loc[df["Name"]=="suffix", col].values[0]).strip()
-        ifname = str(df.loc[df["Name"]=="ifname", col].values[0]).strip()
-        if ip and user and suffix and ifname:
-            out.append({"name": suffix, "ip": ip, "user": user, "pass": pwd, "ifname": ifname})
+        field = {}
+        for key in ("ip", "username", "password", "suffix", "ifname"):
+            raw = rows[col].get(key, "")
+            field[key] = "" if pd.isna(raw) else str(raw).strip()
+        if field["ip"] and field["username"] and field["suffix"] and field["ifname"]:
+            out.append({"name": field["suffix"], "ip": field["ip"], "user": field["username"],
+                        "pass": field["password"], "ifname": field["ifname"]})
     return out
 
-def load_sniffer_parameters(excel_path: str) -> dict:
+def _sniffer_params_from_df(df) -> dict:
+    keys = ["isFreq", "pFreq", "bw", "sFreq", "band", "passive", "psc", "Ch_parameter"]
+    return {
+        row["Name"]: {k: _plain(row[k]) for k in keys}
+        for row in df.to_dict("records")
+    }
+
+def validate_plan(plan: dict):
     """
-    Reads Sniffer_Paramters sheet, returns dict keyed by channel name.
+    Checks a compiled plan for problems that would otherwise only surface
+    inside a DUT thread. Raises ValueError listing every problem found.
     """
-    df = pd.read_excel(excel_path, sheet_name="Sniffer_Paramters", engine="openpyxl")
-    out = {}
-    for _, row in df.iterrows():
-        ch_name = row["Name"]
-        info = {
-            "isFreq": row["isFreq"],
-            "pFreq": row["pFreq"],
-            "bw": row["bw"],
-            "sFreq": row["sFreq"],
-            "band": row["band"],
-            "passive": row["passive"],
-            "psc": row["psc"],
-            "Ch_parameter": row["Ch_parameter"],
-        }
-        out[ch_name] = info
-    return out
+    errors = []
+    tests = plan["tests"]
+    if tests:
+        missing = [c for c in REQUIRED_TEST_COLUMNS if c not in tests[0]]
+        if missing:
+            errors.append(f"Test_Config is missing column(s): {', '.join(missing)}")
+    for i, row in enumerate(tests, start=2):
+        if str(row.get("Skipped_Execution", "")).strip().lower() == "skip":
+            continue
+        for col in ("Test_Type", "TrafficType", "dut"):
+            if col in row and (row[col] is None or str(row[col]).strip() in ("", "nan")):
+                errors.append(f"Test_Config row {i}: {col} is empty")
+        for ch in str(row.get("sniffer_channels", "") or "").split(","):
+            ch = ch.strip()
+            if ch and ch != "nan" and ch not in plan["sniffer_params"]:
+                logger.warning(f"Test_Config row {i}: sniffer channel {ch} not in Sniffer_Paramters")
+    if errors:
+        raise ValueError("Invalid workbook:\n  " + "\n  ".join(errors))
 
-def load_test_config(excel_path: str):
+def _parse_workbook(excel_path: str) -> dict:
+    import pandas as pd
+    # One open/parse of the workbook for all sheets
+    sheets = pd.read_excel(excel_path, sheet_name=SHEETS, engine="openpyxl")
+    tests = [{k: _plain(v) for k, v in row.items()} for row in sheets["Test_Config"].to_dict("records")]
+    return {
+        "version": PLAN_VERSION,
+        "execution": _execution_from_df(sheets["Execution_Config"]),
+        "sniffers": _sniffers_from_df(sheets["Sniffer_Config"]),
+        "sniffer_params": _sniffer_params_from_df(sheets["Sniffer_Paramters"]),
+        "tests": tests,
+    }
+
+def workbook_hash(excel_path: str) -> str:
+    """SHA-256 of the workbook contents."""
+    h = hashlib.sha256()
+    with open(excel_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def compile_workbook(excel_path: str, cache_dir: str = CACHE_DIR, use_cache: bool = True) -> dict:
     """
-    Reads Test_Config sheet into a pandas DataFrame.
+    Reads all four configuration sheets in a single pass and returns a
+    validated plan:
+      { "execution": {...}, "sniffers": [...], "sniffer_params": {...}, "tests": [row dicts] }
+    The compiled plan is cached as JSON under cache_dir, keyed by the
+    workbook's content hash, so unchanged workbooks skip Excel parsing.
     """
-    df = pd.read_excel(excel_path, sheet_name="Test_Config", engine="openpyxl")
-    return df
+    start = time.time()
+    digest = workbook_hash(excel_path)
+    cache_file = os.path.join(cache_dir, f"plan_{digest}.json")
+
+    if use_cache and os.path.exists(cache_file):
+        try:
+            with open(cache_file) as f:
+                plan = json.load(f)
+            if plan.get("version") == PLAN_VERSION:
+                logger.info(f"Loaded cached plan for {excel_path} in {(time.time() - start) * 1000:.1f} ms")
+                return plan
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable plan cache {cache_file}: {e}")
+
+    plan = _parse_workbook(excel_path)
+    validate_plan(plan)
+    if use_cache:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{cache_file}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(plan, f)
+            os.replace(tmp, cache_file)
+        except OSError as e:
+            logger.warning(f"Could not write plan cache {cache_file}: {e}")
+    logger.info(f"Compiled {excel_path} in {(time.time() - start) * 1000:.1f} ms")
+    return plan
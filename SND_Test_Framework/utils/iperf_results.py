@@ -0,0 +1,236 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass, fields, astuple
+
+import numpy as np
+
+logger = logging.getLogger("utils.iperf_results")
+
+INTERVALS_FILE = "iperf_intervals.npz"
+SUMMARY_FILE = "iperf_summary.npz"
+
+NAN = float("nan")
+
+
+@dataclass
+class IperfInterval:
+    run_id: int
+    dut: str
+    remote: str
+    direction: str
+    attn_db: float
+    stream: str          # "fwd" for client->server, "rev" for the --bidir reverse leg
+    start_s: float
+    end_s: float
+    bytes: int
+    bps: float
+    retransmits: int     # -1 when not reported (UDP, receiver side)
+    cwnd: int            # summed snd_cwnd over parallel streams, -1 when not reported
+    jitter_ms: float
+    lost_packets: int
+    packets: int
+
+
+@dataclass
+class IperfSummary:
+    run_id: int
+    dut: str
+    remote: str
+    direction: str
+    attn_db: float
+    protocol: str
+    start_ts: float      # controller wall clock when the client was launched
+    duration_s: float
+    sent_bps: float
+    received_bps: float
+    reverse_sent_bps: float
+    reverse_received_bps: float
+    retransmits: int
+    max_cwnd: int
+    jitter_ms: float
+    lost_packets: int
+    packets: int
+    lost_percent: float
+    error: str
+
+
+def _num(d: dict, key: str, default=NAN):
+    v = d.get(key, default) if d else default
+    return default if v is None else v
+
+
+def _interval_row(meta: dict, stream: str, s: dict, streams: list) -> IperfInterval:
+    cwnds = [st.get("snd_cwnd") for st in streams if st.get("snd_cwnd") is not None]
+    return IperfInterval(
+        meta["run_id"], meta["dut"], meta["remote"], meta["direction"], meta["attn_db"], stream,
+        float(_num(s, "start")), float(_num(s, "end")), int(_num(s, "bytes", 0)),
+        float(_num(s, "bits_per_second")), int(_num(s, "retransmits", -1)),
+        sum(cwnds) if cwnds else -1, float(_num(s, "jitter_ms")),
+        int(_num(s, "lost_packets", -1)), int(_num(s, "packets", -1)),
+    )
+
+
+def parse_iperf_json(text: str, meta: dict):
+    """
+    Parses `iperf3 -J` output into (list[IperfInterval], IperfSummary).
+    meta carries run_id, dut, remote, direction, attn_db and start_ts.
+    Unparseable output yields no intervals and a summary with error set.
+    """
+    try:
+        doc = json.loads(text)
+    except (ValueError, TypeError) as e:
+        return [], _summary(meta, {}, error=f"invalid iperf3 JSON: {e}")
+
+    intervals = []
+    for iv in doc.get("intervals", []):
+        intervals.extend(interval_rows(meta, iv))
+    return intervals, _summary(meta, doc, error=doc.get("error", ""))
+
+
+def interval_rows(meta: dict, iv: dict) -> list:
+    """IperfInterval rows (one per leg) of one entry of iperf3's "intervals" list."""
+    streams = iv.get("streams", [])
+    if "sum_bidir_reverse" in iv:
+        fwd = [st for st in streams if st.get("sender", True)]
+        rev = [st for st in streams if not st.get("sender", True)]
+        return [_interval_row(meta, "fwd", iv.get("sum", {}), fwd),
+                _interval_row(meta, "rev", iv["sum_bidir_reverse"], rev)]
+    return [_interval_row(meta, "fwd", iv.get("sum", {}), streams)]
+
+
+def _summary(meta: dict, doc: dict, error: str = "") -> IperfSummary:
+    end = doc.get("end", {})
+    test_start = doc.get("start", {}).get("test_start", {})
+    sent = end.get("sum_sent", {})
+    received = end.get("sum_received", {})
+    udp = end.get("sum", {}) if test_start.get("protocol") == "UDP" else {}
+    cwnds = [st.get("sender", {}).get("max_snd_cwnd") for st in end.get("streams", [])]
+    cwnds = [c for c in cwnds if c is not None]
+    return IperfSummary(
+        meta["run_id"], meta["dut"], meta["remote"], meta["direction"], meta["attn_db"],
+        test_start.get("protocol", ""), meta["start_ts"],
+        float(_num(sent, "seconds", _num(udp, "seconds"))),
+        float(_num(sent, "bits_per_second", _num(udp, "bits_per_second"))),
+        float(_num(received, "bits_per_second")),
+        float(_num(end.get("sum_sent_bidir_reverse", {}), "bits_per_second")),
+        float(_num(end.get("sum_received_bidir_reverse", {}), "bits_per_second")),
+        int(_num(sent, "retransmits", -1)), sum(cwnds) if cwnds else -1,
+        float(_num(udp, "jitter_ms")), int(_num(udp, "lost_packets", -1)),
+        int(_num(udp, "packets", -1)), float(_num(udp, "lost_percent")),
+        error or "",
+    )
+
+
+def _to_columns(records: list, cls) -> dict:
+    names = [f.name for f in fields(cls)]
+    types = {f.name: f.type for f in fields(cls)}
+    rows = [astuple(r) for r in records]
+    cols = {}
+    for i, name in enumerate(names):
+        values = [row[i] for row in rows]
+        if types[name] in (int, "int"):
+            cols[name] = np.array(values, dtype=np.int64)
+        elif types[name] in (float, "float"):
+            cols[name] = np.array(values, dtype=np.float64)
+        else:
+            cols[name] = np.array(values, dtype=np.str_)
+    return cols
+
+
+class IperfResultStore:
+    """
+    Collects parsed iperf3 runs for one DUT and keeps two columnar files in
+    its log folder: iperf_intervals.npz (one row per interval per leg) and
+    iperf_summary.npz (one row per run). save() rewrites both; traffic_runner
+    calls it once per set of concurrent flows (once per RvR step), so the files
+    survive an interrupted test without being rewritten after every run.
+    """
+
+    def __init__(self, dut: str, output_dir: str):
+        self.dut = dut
+        self.output_dir = output_dir
+        self.intervals = []
+        self.summaries = []
+        self._next_run = 0
+        self._saved_runs = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def new_run(self) -> int:
+        """Reserves a run_id for a run whose intervals are fed in with add_interval() while it runs."""
+        with self._lock:
+            run_id = self._next_run
+            self._next_run += 1
+            return run_id
+
+    def add_interval(self, run_id: int, interval: dict, remote: str, direction: str, attn_db=None):
+        """Appends one streamed iperf3 interval (an entry of its "intervals" list) to run_id."""
+        rows = interval_rows({
+            "run_id": run_id, "dut": self.dut, "remote": remote, "direction": direction,
+            "attn_db": NAN if attn_db is None else float(attn_db),
+        }, interval)
+        with self._lock:
+            self.intervals.extend(rows)
+
+    def add_run(self, iperf_json: str, remote: str, direction: str, attn_db=None, start_ts: float = None,
+                run_id: int = None) -> IperfSummary:
+        """
+        Parses one iperf3 -J output and appends it to the store. start_ts is
+        when the client was launched; without it the run is assumed to have
+        just ended and its start is derived from the reported duration.
+        For a run reserved with new_run(), pass its run_id; intervals already
+        fed with add_interval() are kept and the document may omit them.
+        """
+        intervals, summary = parse_iperf_json(iperf_json, {
+            "run_id": -1, "dut": self.dut, "remote": remote, "direction": direction,
+            "attn_db": NAN if attn_db is None else float(attn_db),
+            "start_ts": NAN if start_ts is None else float(start_ts),
+        })
+        if start_ts is None:
+            summary.start_ts = time.time() - (0.0 if math.isnan(summary.duration_s) else summary.duration_s)
+        with self._lock:
+            if run_id is None:
+                run_id = self._next_run
+                self._next_run += 1
+            summary.run_id = run_id
+            for iv in intervals:
+                iv.run_id = run_id
+            self.intervals.extend(intervals)
+            self.summaries.append(summary)
+        if summary.error:
+            logger.error(f"[{self.dut}] iperf3 run {run_id} to {remote} failed: {summary.error}")
+        else:
+            logger.info(
+                f"[{self.dut}] iperf3 {direction} to {remote}: sent {summary.sent_bps / 1e6:.1f} Mbps, "
+                f"received {summary.received_bps / 1e6:.1f} Mbps"
+            )
+        return summary
+
+    def save(self):
+        """Writes both files if runs were added since the last save; add_run() is not blocked meanwhile."""
+        with self._save_lock:
+            with self._lock:
+                if len(self.summaries) == self._saved_runs:
+                    return
+                intervals, summaries = list(self.intervals), list(self.summaries)
+            os.makedirs(self.output_dir, exist_ok=True)
+            np.savez_compressed(os.path.join(self.output_dir, INTERVALS_FILE), **_to_columns(intervals, IperfInterval))
+            np.savez_compressed(os.path.join(self.output_dir, SUMMARY_FILE), **_to_columns(summaries, IperfSummary))
+            self._saved_runs = len(summaries)
+
+
+def load_columns(path: str) -> dict:
+    """Loads an iperf_*.npz file as {column: numpy array}."""
+    with np.load(path) as data:
+        return {k: data[k] for k in data.files}
+
+
+def load_dataframe(paths: list):
+    """Concatenates several iperf_*.npz files (e.g. from many DUTs) into one DataFrame."""
+    import pandas as pd
+    frames = [pd.DataFrame(load_columns(p)) for p in paths]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
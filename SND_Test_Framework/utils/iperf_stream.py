@@ -0,0 +1,178 @@
+import json
+import logging
+import subprocess
+import threading
+import time
+from array import array
+
+from .common_utils import command_slot, write_ssh_log
+from .ssh_session import get_pool
+
+logger = logging.getLogger("utils.iperf_stream")
+
+DEFAULT_CAPACITY = 600
+COLUMNS = ("ts", "flow", "start_s", "end_s", "bps", "retransmits", "jitter_ms", "lost_packets")
+
+
+class IntervalRing:
+    """
+    Fixed-capacity ring buffer of per-second iperf3 samples for one DUT.
+    Each column is a preallocated array('d'), so memory is constant however
+    long the test runs; once full, the oldest samples are overwritten.
+
+    Subscribers are called as fn(dut, sample_dict) on every append, from the
+    thread reading the iperf3 stream, and must return quickly.
+    """
+
+    def __init__(self, dut: str, capacity: int = DEFAULT_CAPACITY):
+        self.dut = dut
+        self.capacity = capacity
+        self.cols = {c: array("d", bytes(8 * capacity)) for c in COLUMNS}
+        self.total = 0
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    def append(self, sample: dict):
+        with self._lock:
+            i = self.total % self.capacity
+            for c in COLUMNS:
+                self.cols[c][i] = float(sample.get(c, float("nan")))
+            self.total += 1
+            subscribers = list(self._subscribers)
+        for fn in subscribers:
+            try:
+                fn(self.dut, sample)
+            except Exception as e:
+                logger.error(f"[{self.dut}] iperf interval subscriber failed: {e}", exc_info=True)
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def snapshot(self, last_n: int = None) -> dict:
+        """Returns {column: list} for the newest last_n samples (all retained by default), oldest first."""
+        with self._lock:
+            n = len(self) if last_n is None else min(last_n, len(self))
+            first = self.total - n
+            idx = [(first + k) % self.capacity for k in range(n)]
+            return {c: [self.cols[c][i] for i in idx] for c in COLUMNS}
+
+    def subscribe(self, fn):
+        with self._lock:
+            self._subscribers.append(fn)
+        return fn
+
+    def unsubscribe(self, fn):
+        with self._lock:
+            if fn in self._subscribers:
+                self._subscribers.remove(fn)
+
+
+_rings = {}
+_rings_lock = threading.Lock()
+
+
+def get_ring(dut: str, capacity: int = DEFAULT_CAPACITY, progress_s: int = 0) -> IntervalRing:
+    """
+    Returns the process-wide ring buffer for dut, creating it on first use.
+    With progress_s > 0 a new ring prints the throughput every progress_s
+    seconds (see progress_printer).
+    """
+    with _rings_lock:
+        ring = _rings.get(dut)
+        if ring is None:
+            ring = _rings[dut] = IntervalRing(dut, capacity)
+            if progress_s > 0:
+                ring.subscribe(progress_printer(progress_s))
+        return ring
+
+
+def _sample(data: dict, flow_id: int = 0) -> dict:
+    s = data.get("sum", {})
+    return {
+        "ts": time.time(),
+        "flow": flow_id,
+        "start_s": s.get("start", float("nan")),
+        "end_s": s.get("end", float("nan")),
+        "bps": s.get("bits_per_second", float("nan")),
+        "retransmits": s.get("retransmits", float("nan")),
+        "jitter_ms": s.get("jitter_ms", float("nan")),
+        "lost_packets": s.get("lost_packets", float("nan")),
+    }
+
+
+def stream_iperf_client(host, user, server_ip, port, duration=10, log_dir=None, ring=None,
+                        udp=False, bidir=False, bandwidth=None, stall_s=0, parallel=1, flow_id=0, on_interval=None):
+    """
+    Runs an iperf3 client with --json-stream (iperf3 >= 3.17) and parses each
+    interval as it arrives over the SSH channel, pushing it into ring.
+    With stall_s > 0 the client is killed after stall_s consecutive
+    zero-throughput intervals. Samples are tagged with flow_id so several
+    concurrent flows can share one DUT's ring.
+
+    Intervals are not kept: each is passed to on_interval(data) as it arrives
+    (e.g. IperfResultStore.add_interval), so memory does not grow with the
+    test length. Returns (returncode, iperf3 JSON document with start, end and
+    error only, stderr) like start_iperf_client, for IperfResultStore.add_run().
+    """
+    proto_flag = "-u" if udp else ""
+    bidi_flag = "--bidir" if bidir else ""
+    bw_flag = f"-b {bandwidth}" if bandwidth else ""
+    par_flag = f"-P {parallel}" if parallel > 1 else ""
+    command = f"iperf3 -c {server_ip} {proto_flag} {bidi_flag} {bw_flag} {par_flag} -p {port} -t {duration} -i 1 --json-stream"
+
+    pool = get_pool()
+    doc = {}
+    stalled = 0
+    start = time.time()
+    with command_slot(host, traffic=True):
+        try:
+            proc = subprocess.Popen(
+                pool.ssh_args(host, user) + [command],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1
+            )
+        except Exception as e:
+            logger.error(f"[{host}] Failed to start streaming iperf3 client: {e}", exc_info=True)
+            return 1, "", str(e)
+
+        for line in proc.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            kind, data = event.get("event"), event.get("data")
+            if kind == "interval":
+                if on_interval is not None:
+                    on_interval(data)
+                sample = _sample(data, flow_id)
+                if ring is not None:
+                    ring.append(sample)
+                stalled = stalled + 1 if sample["bps"] == 0 else 0
+                if stall_s and stalled >= stall_s:
+                    logger.warning(f"[{host}] iperf3 to {server_ip} stalled for {stalled}s, aborting run")
+                    doc["error"] = f"aborted: no throughput for {stalled} intervals"
+                    proc.kill()
+                    break
+            elif kind in ("start", "end"):
+                doc[kind] = data
+            elif kind == "error":
+                doc["error"] = data
+
+        _, err = proc.communicate()
+    pool.record(host, time.time() - start)
+    if proc.returncode == 255:
+        pool.revalidate(host, user)
+    text = json.dumps(doc)
+    write_ssh_log(log_dir, host, user, command, text + "\n", err, proc.returncode, start)
+    return proc.returncode, text, err.strip()
+
+
+def progress_printer(every_s: int = 5):
+    """Subscriber that prints the current throughput every every_s samples."""
+    from colored_print import print_step
+
+    def show(dut: str, sample: dict):
+        end = sample.get("end_s", 0)
+        if end and int(round(end)) % every_s == 0:
+            print_step(f"[{dut}] t={end:.0f}s {sample['bps'] / 1e6:.1f} Mbps")
+
+    return show
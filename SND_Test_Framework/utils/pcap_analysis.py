@@ -0,0 +1,478 @@
+import glob
+import logging
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+logger = logging.getLogger("utils.pcap_analysis")
+
+BATCH = 262144              # records decoded per vectorized batch
+DEFAULT_GAP_S = 1.0         # inter-packet gap counted as a stall
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_RADIOTAP = 127
+LINKTYPE_IPV4 = 228
+
+FLOWS_FILE = "pcap_flows.npz"
+FLOW_SECONDS_FILE = "pcap_flow_seconds.npz"
+STATIONS_FILE = "wifi_stations.npz"
+WIFI_SECONDS_FILE = "wifi_seconds.npz"
+
+_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6), b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9), b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+
+# Radiotap fields in present-bit order: (alignment, size)
+_RADIOTAP_FIELDS = [
+    (8, 8), (1, 1), (1, 1), (2, 4), (1, 2), (1, 1), (1, 1), (2, 2), (2, 2), (2, 2), (1, 1), (1, 1),
+    (1, 1), (1, 1), (2, 2), (2, 2), (1, 1), (1, 1), (4, 8), (1, 3), (4, 8), (2, 12), (8, 12), (2, 12),
+]
+RT_FLAGS, RT_RATE, RT_CHANNEL, RT_DBM_SIGNAL, RT_MCS, RT_VHT = 1, 2, 3, 5, 19, 21
+RT_FLAG_BAD_FCS = 0x40
+
+
+# ---- zero-copy gathers over the mmap'd capture --------------------------------
+
+def _u8(buf, idx):
+    return buf[np.minimum(idx, buf.size - 1)]
+
+
+def _be16(buf, idx):
+    return (_u8(buf, idx).astype(np.uint32) << 8) | _u8(buf, idx + 1)
+
+
+def _be32(buf, idx):
+    return (_be16(buf, idx) << 16) | _be16(buf, idx + 2)
+
+
+def _le16(buf, idx):
+    return _u8(buf, idx).astype(np.uint32) | (_u8(buf, idx + 1).astype(np.uint32) << 8)
+
+
+def _le32(buf, idx):
+    return _le16(buf, idx) | (_le16(buf, idx + 2) << 16)
+
+
+def iter_records(mm, endian: str, ts_unit: float, start: int = 24):
+    """
+    Walks the pcap record headers and yields (ts, data_offset, caplen, origlen)
+    arrays of up to BATCH records. Only headers are touched here; packet bytes
+    are read later by the vectorized gathers, straight from the mapping.
+    """
+    hdr = struct.Struct(endian + "IIII")
+    size = len(mm)
+    off = start
+    while off + 16 <= size:
+        ts_s, ts_f, offs, caps, origs = [], [], [], [], []
+        while off + 16 <= size and len(offs) < BATCH:
+            sec, frac, incl, orig = hdr.unpack_from(mm, off)
+            if off + 16 + incl > size:
+                off = size  # truncated last record (capture still being written or cut short)
+                break
+            ts_s.append(sec)
+            ts_f.append(frac)
+            offs.append(off + 16)
+            caps.append(incl)
+            origs.append(orig)
+            off += 16 + incl
+        if offs:
+            ts = np.array(ts_s, dtype=np.float64) + np.array(ts_f, dtype=np.float64) * ts_unit
+            yield ts, np.array(offs, dtype=np.int64), np.array(caps, dtype=np.int64), np.array(origs, dtype=np.int64)
+
+
+# ---- IP flows -------------------------------------------------------------------
+
+class _FlowState:
+    __slots__ = ("packets", "bytes", "payload", "first_ts", "last_ts", "max_gap", "gaps",
+                 "retransmits", "last_seq", "last_rel", "max_end")
+
+    def __init__(self):
+        self.packets = self.bytes = self.payload = self.gaps = self.retransmits = 0
+        self.first_ts = self.last_ts = None
+        self.max_gap = 0.0
+        self.last_seq = self.last_rel = self.max_end = None
+
+
+class _FlowAnalyzer:
+    """Accumulates per-flow (IPv4 5-tuple, per direction) and per-second statistics."""
+
+    def __init__(self, linktype: int, gap_s: float):
+        self.linktype = linktype
+        self.gap_s = gap_s
+        self.flows = {}
+        self.seconds = {}
+        self.non_ip = 0
+
+    def _l3(self, buf, off, caplen):
+        """Returns (ipv4 header offsets, mask of IPv4 packets)."""
+        if self.linktype == LINKTYPE_ETHERNET:
+            ethertype = _be16(buf, off + 12)
+            vlan = ethertype == 0x8100
+            ethertype = np.where(vlan, _be16(buf, off + 16), ethertype)
+            l3 = off + np.where(vlan, 18, 14)
+            return l3, (ethertype == 0x0800) & (caplen >= (l3 - off) + 20)
+        if self.linktype == LINKTYPE_LINUX_SLL:
+            l3 = off + 16
+            return l3, (_be16(buf, off + 14) == 0x0800) & (caplen >= 36)
+        l3 = off
+        return l3, ((_u8(buf, off) >> 4) == 4) & (caplen >= 20)
+
+    def add(self, buf, ts, off, caplen):
+        l3, ok = self._l3(buf, off, caplen)
+        self.non_ip += int((~ok).sum())
+        if not ok.any():
+            return
+        ts, off, caplen, l3 = ts[ok], off[ok], caplen[ok], l3[ok]
+        ihl = (_u8(buf, l3) & 0x0F).astype(np.int64) * 4
+        total = _be16(buf, l3 + 2).astype(np.int64)
+        proto = _u8(buf, l3 + 9).astype(np.uint64)
+        src = _be32(buf, l3 + 12).astype(np.uint64)
+        dst = _be32(buf, l3 + 16).astype(np.uint64)
+        l4 = l3 + ihl
+        has_ports = ((proto == 6) | (proto == 17)) & (caplen >= (l4 - off) + 4)
+        sport = np.where(has_ports, _be16(buf, l4), 0).astype(np.uint64)
+        dport = np.where(has_ports, _be16(buf, l4 + 2), 0).astype(np.uint64)
+        is_tcp = (proto == 6) & (caplen >= (l4 - off) + 14)
+        seq = _be32(buf, l4 + 4).astype(np.int64)
+        doff = (_u8(buf, l4 + 12) >> 4).astype(np.int64) * 4
+        payload = np.where(is_tcp, total - ihl - doff, np.where(proto == 17, total - ihl - 8, total - ihl))
+        payload = np.maximum(payload, 0)
+
+        keys = np.stack([(src << np.uint64(32)) | dst, (proto << np.uint64(32)) | (sport << np.uint64(16)) | dport], 1)
+        uniq, inv = np.unique(keys, axis=0, return_inverse=True)
+        inv = inv.ravel()
+
+        # Bytes per flow per wall-clock second
+        sec = np.floor(ts).astype(np.int64)
+        pairs, pinv = np.unique(np.stack([inv, sec], 1), axis=0, return_inverse=True)
+        pbytes = np.bincount(pinv.ravel(), weights=total, minlength=len(pairs))
+        for (j, s), b in zip(pairs.tolist(), pbytes.tolist()):
+            k = (int(uniq[j][0]), int(uniq[j][1]), s)
+            self.seconds[k] = self.seconds.get(k, 0) + b
+
+        # Per-flow state, one group at a time in capture order
+        order = np.argsort(inv, kind="stable")
+        bounds = np.searchsorted(inv[order], np.arange(len(uniq) + 1))
+        for j in range(len(uniq)):
+            idx = order[bounds[j]:bounds[j + 1]]
+            key = (int(uniq[j][0]), int(uniq[j][1]))
+            st = self.flows.get(key)
+            if st is None:
+                st = self.flows[key] = _FlowState()
+            t = ts[idx]
+            prev = t[0] if st.last_ts is None else st.last_ts
+            gaps = np.diff(np.concatenate(([prev], t)))
+            st.max_gap = max(st.max_gap, float(gaps.max()))
+            st.gaps += int((gaps > self.gap_s).sum())
+            st.first_ts = float(t[0]) if st.first_ts is None else st.first_ts
+            st.last_ts = float(t[-1])
+            st.packets += len(idx)
+            st.bytes += int(total[idx].sum())
+            st.payload += int(payload[idx].sum())
+            if (key[1] >> 32) == 6:
+                self._retransmits(st, seq[idx][is_tcp[idx]], payload[idx][is_tcp[idx]])
+
+    @staticmethod
+    def _retransmits(st: _FlowState, seq, payload):
+        """Counts segments starting below the highest sequence already sent (retransmits and reordering)."""
+        if not len(seq):
+            return
+        prev = seq[0] if st.last_seq is None else st.last_seq
+        # Unwrap 32-bit sequence numbers relative to the flow's first segment
+        step = ((np.diff(np.concatenate(([prev], seq))) + 2**31) % 2**32) - 2**31
+        rel = (0 if st.last_rel is None else st.last_rel) + np.cumsum(step)
+        ends = rel + payload
+        seed = rel[0] if st.max_end is None else st.max_end
+        prior = np.maximum.accumulate(np.concatenate(([seed], ends)))[:-1]
+        st.retransmits += int(((payload > 0) & (rel < prior)).sum())
+        st.last_seq, st.last_rel = int(seq[-1]), int(rel[-1])
+        st.max_end = int(max(prior[-1], ends[-1]))
+
+    def tables(self, capture: str):
+        def ip(v):
+            return ".".join(str((v >> s) & 0xFF) for s in (24, 16, 8, 0))
+
+        keys = list(self.flows)
+        flow_ids = {k: i for i, k in enumerate(keys)}
+        flows = {c: [] for c in ("capture", "flow_id", "src", "dst", "proto", "sport", "dport", "packets", "bytes",
+                                 "payload_bytes", "first_ts", "last_ts", "duration_s", "mean_bps", "max_gap_s",
+                                 "gaps", "retransmits")}
+        for k in keys:
+            st = self.flows[k]
+            dur = st.last_ts - st.first_ts
+            for c, v in (("capture", capture), ("flow_id", flow_ids[k]), ("src", ip(k[0] >> 32)),
+                         ("dst", ip(k[0] & 0xFFFFFFFF)), ("proto", k[1] >> 32), ("sport", (k[1] >> 16) & 0xFFFF),
+                         ("dport", k[1] & 0xFFFF), ("packets", st.packets), ("bytes", st.bytes),
+                         ("payload_bytes", st.payload), ("first_ts", st.first_ts), ("last_ts", st.last_ts),
+                         ("duration_s", dur), ("mean_bps", st.bytes * 8 / dur if dur > 0 else 0.0),
+                         ("max_gap_s", st.max_gap), ("gaps", st.gaps), ("retransmits", st.retransmits)):
+                flows[c].append(v)
+        seconds = {"capture": [], "flow_id": [], "second": [], "bytes": [], "bps": []}
+        for (k0, k1, s), b in sorted(self.seconds.items(), key=lambda kv: (flow_ids[kv[0][:2]], kv[0][2])):
+            for c, v in (("capture", capture), ("flow_id", flow_ids[(k0, k1)]), ("second", s),
+                         ("bytes", int(b)), ("bps", b * 8.0)):
+                seconds[c].append(v)
+        return flows, seconds
+
+
+# ---- 802.11 radiotap ----------------------------------------------------------------
+
+def _radiotap_offsets(present: int, words: int) -> dict:
+    """Byte offsets (from the radiotap header) of the fields we read, for one present bitmap."""
+    pos = 4 + 4 * words
+    offsets = {}
+    for bit, (align, size) in enumerate(_RADIOTAP_FIELDS):
+        if present & (1 << bit):
+            pos = (pos + align - 1) // align * align
+            offsets[bit] = pos
+            pos += size
+    return offsets
+
+
+class _WifiAnalyzer:
+    """Accumulates per-second and per-transmitter frame, retry, RSSI and rate statistics."""
+
+    def __init__(self):
+        self.seconds = {}
+        self.stations = {}
+
+    def add(self, buf, ts, off, caplen, origlen):
+        rt_len = _le16(buf, off + 2).astype(np.int64)
+        present = _le32(buf, off + 4).astype(np.uint64)
+        words = np.ones(len(off), dtype=np.int64)
+        cur = present
+        while True:
+            more = (cur & np.uint64(0x80000000)) != 0
+            if not more.any():
+                break
+            cur = np.where(more, _le32(buf, off + 4 + 4 * words).astype(np.uint64), 0)
+            words += more
+
+        n = len(off)
+        flags = np.zeros(n, dtype=np.int64)
+        rate = np.zeros(n, dtype=np.int64)          # 500 kbps units, 0 = not reported
+        signal = np.full(n, 999, dtype=np.int64)    # dBm, 999 = not reported
+        mcs = np.full(n, -1, dtype=np.int64)
+        layout = present | (words.astype(np.uint64) << np.uint64(32))
+        for key in np.unique(layout).tolist():
+            sel = layout == key
+            base = off[sel]
+            fields = _radiotap_offsets(key & 0xFFFFFFFF, key >> 32)
+            if RT_FLAGS in fields:
+                flags[sel] = _u8(buf, base + fields[RT_FLAGS])
+            if RT_RATE in fields:
+                rate[sel] = _u8(buf, base + fields[RT_RATE])
+            if RT_DBM_SIGNAL in fields:
+                signal[sel] = _u8(buf, base + fields[RT_DBM_SIGNAL]).astype(np.int8)
+            if RT_MCS in fields:
+                mcs[sel] = _u8(buf, base + fields[RT_MCS] + 2)
+            elif RT_VHT in fields:
+                mcs[sel] = _u8(buf, base + fields[RT_VHT] + 4) >> 4
+
+        hdr = off + rt_len
+        fc0, fc1 = _u8(buf, hdr), _u8(buf, hdr + 1)
+        ftype = (fc0 >> 2) & 3
+        valid = (caplen >= rt_len + 10) & ((flags & RT_FLAG_BAD_FCS) == 0)
+        retry = valid & ((fc1 & 0x08) != 0)
+        has_signal = valid & (signal != 999)
+        bad_fcs = (flags & RT_FLAG_BAD_FCS) != 0
+
+        sec = np.floor(ts).astype(np.int64)
+        useq, sinv = np.unique(sec, return_inverse=True)
+        per_sec = [np.bincount(sinv, weights=w, minlength=len(useq)) for w in (
+            valid, retry, bad_fcs, np.where(valid, origlen, 0), np.where(has_signal, signal, 0), has_signal)]
+        for i, s in enumerate(useq.tolist()):
+            acc = self.seconds.setdefault(s, [0, 0, 0, 0, 0, 0])
+            for c in range(6):
+                acc[c] += per_sec[c][i]
+
+        # Per transmitter: management and data frames carry addr2 at offset 10
+        has_ta = valid & ((ftype == 0) | (ftype == 2)) & (caplen >= rt_len + 16)
+        if not has_ta.any():
+            return
+        ta = np.zeros(n, dtype=np.uint64)
+        for b in range(6):
+            ta = (ta << np.uint64(8)) | _u8(buf, hdr + 10 + b).astype(np.uint64)
+        ta, t, r, ln = ta[has_ta], ts[has_ta], retry[has_ta], origlen[has_ta]
+        sg, hs, rt, mc = signal[has_ta], has_signal[has_ta], rate[has_ta], mcs[has_ta]
+        uniq, inv = np.unique(ta, return_inverse=True)
+        order = np.argsort(inv, kind="stable")
+        bounds = np.searchsorted(inv[order], np.arange(len(uniq) + 1))
+        for j, addr in enumerate(uniq.tolist()):
+            idx = order[bounds[j]:bounds[j + 1]]
+            st = self.stations.get(addr)
+            if st is None:
+                st = self.stations[addr] = {
+                    "frames": 0, "retries": 0, "bytes": 0, "first_ts": float(t[idx[0]]), "last_ts": 0.0,
+                    "rssi_hist": np.zeros(256, dtype=np.int64), "rate_hist": np.zeros(256, dtype=np.int64),
+                    "mcs_hist": np.zeros(256, dtype=np.int64),
+                }
+            st["frames"] += len(idx)
+            st["retries"] += int(r[idx].sum())
+            st["bytes"] += int(ln[idx].sum())
+            st["last_ts"] = float(t[idx[-1]])
+            s_idx = idx[hs[idx]]
+            st["rssi_hist"] += np.bincount(sg[s_idx] + 128, minlength=256)
+            st["rate_hist"] += np.bincount(rt[idx][rt[idx] > 0], minlength=256)
+            st["mcs_hist"] += np.bincount(mc[idx][mc[idx] >= 0], minlength=256)
+
+    @staticmethod
+    def _hist_percentile(hist, q: float, offset: int = 0) -> float:
+        total = hist.sum()
+        if total == 0:
+            return float("nan")
+        return float(np.searchsorted(np.cumsum(hist), q * total) + offset)
+
+    def tables(self, capture: str):
+        stations = {c: [] for c in ("capture", "ta", "frames", "retries", "retry_pct", "bytes", "first_ts", "last_ts",
+                                    "rssi_mean", "rssi_min", "rssi_p10", "rssi_p50", "rssi_p90", "rssi_max",
+                                    "rate_p50_mbps", "mcs_mode")}
+        for addr, st in sorted(self.stations.items()):
+            h = st["rssi_hist"]
+            nz = np.nonzero(h)[0]
+            values = np.arange(256) - 128
+            row = {
+                "capture": capture,
+                "ta": ":".join(f"{(addr >> s) & 0xFF:02x}" for s in range(40, -1, -8)),
+                "frames": st["frames"], "retries": st["retries"],
+                "retry_pct": 100.0 * st["retries"] / st["frames"] if st["frames"] else 0.0,
+                "bytes": st["bytes"], "first_ts": st["first_ts"], "last_ts": st["last_ts"],
+                "rssi_mean": float((h * values).sum() / h.sum()) if h.sum() else float("nan"),
+                "rssi_min": float(nz[0] - 128) if len(nz) else float("nan"),
+                "rssi_p10": self._hist_percentile(h, 0.10, -128),
+                "rssi_p50": self._hist_percentile(h, 0.50, -128),
+                "rssi_p90": self._hist_percentile(h, 0.90, -128),
+                "rssi_max": float(nz[-1] - 128) if len(nz) else float("nan"),
+                "rate_p50_mbps": self._hist_percentile(st["rate_hist"], 0.5) / 2,
+                "mcs_mode": int(st["mcs_hist"].argmax()) if st["mcs_hist"].sum() else -1,
+            }
+            for c, v in row.items():
+                stations[c].append(v)
+        seconds = {c: [] for c in ("capture", "second", "frames", "retries", "retry_pct", "bad_fcs", "bytes",
+                                   "rssi_mean")}
+        for s, (frames, retries, bad, nbytes, sig_sum, sig_n) in sorted(self.seconds.items()):
+            for c, v in (("capture", capture), ("second", s), ("frames", int(frames)), ("retries", int(retries)),
+                         ("retry_pct", 100.0 * retries / frames if frames else 0.0), ("bad_fcs", int(bad)),
+                         ("bytes", int(nbytes)), ("rssi_mean", sig_sum / sig_n if sig_n else float("nan"))):
+                seconds[c].append(v)
+        return stations, seconds
+
+
+# ---- entry points ---------------------------------------------------------------
+
+def read_header(mm, path: str = "capture"):
+    """Returns (struct endian prefix, timestamp unit in seconds, link type) of a pcap mapping."""
+    magic = mm[:4]
+    if magic == b"\x0a\x0d\x0d\x0a":
+        raise ValueError(f"{path}: pcapng is not supported, capture with -w in classic pcap format")
+    if magic not in _MAGIC:
+        raise ValueError(f"{path}: not a pcap file")
+    endian, ts_unit = _MAGIC[magic]
+    return endian, ts_unit, struct.unpack_from(endian + "I", mm, 20)[0] & 0x0FFFFFFF
+
+
+def analyze_pcap(path: str, gap_s: float = DEFAULT_GAP_S) -> dict:
+    """
+    Analyzes one classic pcap file through a read-only mmap.
+
+    Records are decoded BATCH at a time with NumPy gathers on a view of the
+    mapping, so memory stays bounded however large the capture is. Returns
+    {table name: {column: list}}: "flows"/"flow_seconds" for Ethernet,
+    Linux cooked and raw IP captures, "stations"/"wifi_seconds" for 802.11
+    radiotap captures.
+    """
+    capture = os.path.basename(path)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < 24:
+            raise ValueError(f"{path}: too short to be a pcap")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        endian, ts_unit, linktype = read_header(mm, path)
+        buf = np.frombuffer(mm, dtype=np.uint8)
+
+        if linktype == LINKTYPE_RADIOTAP:
+            analyzer = _WifiAnalyzer()
+            for ts, off, caplen, origlen in iter_records(mm, endian, ts_unit):
+                analyzer.add(buf, ts, off, caplen, origlen)
+            stations, seconds = analyzer.tables(capture)
+            result = {"stations": stations, "wifi_seconds": seconds}
+        elif linktype in (LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL, LINKTYPE_RAW, LINKTYPE_IPV4):
+            analyzer = _FlowAnalyzer(linktype, gap_s)
+            for ts, off, caplen, _ in iter_records(mm, endian, ts_unit):
+                analyzer.add(buf, ts, off, caplen)
+            flows, seconds = analyzer.tables(capture)
+            result = {"flows": flows, "flow_seconds": seconds}
+        else:
+            raise ValueError(f"{path}: unsupported link type {linktype}")
+        del buf  # release the exported view before closing the mapping
+    finally:
+        mm.close()
+    return result
+
+
+def _to_arrays(table: dict) -> dict:
+    cols = {}
+    for name, values in table.items():
+        arr = np.asarray(values)
+        cols[name] = arr.astype(np.str_) if arr.dtype == object else arr
+    return cols
+
+
+def _concat(tables: list, renumber: dict = None) -> dict:
+    """Concatenates per-capture tables; renumber maps capture -> flow_id offset."""
+    out = {}
+    for t in tables:
+        for name, values in t.items():
+            if renumber is not None and name == "flow_id":
+                base = renumber[t["capture"][0]] if values else 0
+                values = [v + base for v in values]
+            out.setdefault(name, []).extend(values)
+    return out
+
+
+def analyze_dut(dut_root: str, output_dir: str = None, gap_s: float = DEFAULT_GAP_S) -> dict:
+    """
+    Analyzes every pcap under dut_root/sniffer and dut_root/tcpdump and writes
+    compact per-DUT tables (pcap_flows, pcap_flow_seconds, wifi_stations,
+    wifi_seconds) as .npz files to output_dir (default dut_root/analysis).
+    Returns {table file: row count}.
+    """
+    output_dir = output_dir or os.path.join(dut_root, "analysis")
+    paths = sorted(glob.glob(os.path.join(dut_root, "sniffer", "*.pcap*")) +
+                   glob.glob(os.path.join(dut_root, "tcpdump", "*.pcap*")))
+    paths = [p for p in paths if not p.endswith(".npz")]  # skip pcap_index files
+    collected = {"flows": [], "flow_seconds": [], "stations": [], "wifi_seconds": []}
+    for path in paths:
+        t0 = time.time()
+        try:
+            result = analyze_pcap(path, gap_s)
+        except Exception as e:
+            logger.error(f"Could not analyze {path}: {e}")
+            continue
+        for name, table in result.items():
+            collected[name].append(table)
+        logger.info(f"Analyzed {path} ({os.path.getsize(path) / 1e6:.1f} MB) in {time.time() - t0:.2f}s")
+
+    # flow_ids are per capture; shift them so they index the combined flows table
+    offsets, n = {}, 0
+    for t in collected["flows"]:
+        if t["capture"]:
+            offsets[t["capture"][0]] = n
+            n += len(t["capture"])
+
+    os.makedirs(output_dir, exist_ok=True)
+    written = {}
+    for name, fname in (("flows", FLOWS_FILE), ("flow_seconds", FLOW_SECONDS_FILE),
+                        ("stations", STATIONS_FILE), ("wifi_seconds", WIFI_SECONDS_FILE)):
+        if not collected[name]:
+            continue
+        table = _concat(collected[name], offsets if name in ("flows", "flow_seconds") else None)
+        np.savez_compressed(os.path.join(output_dir, fname), **_to_arrays(table))
+        written[fname] = len(next(iter(table.values()), []))
+    return written
@@ -0,0 +1,150 @@
+import glob
+import logging
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from .pcap_analysis import iter_records, read_header
+from .phase_markers import PHASES_FILE, load_phases
+
+logger = logging.getLogger("utils.pcap_index")
+
+INDEX_SUFFIX = ".idx.npz"
+DEFAULT_STEP_S = 1.0
+DEFAULT_SLACK_S = 2.0
+
+
+def build_index(path: str, step_s: float = DEFAULT_STEP_S) -> dict:
+    """
+    Builds a sparse timestamp -> byte offset index for a pcap: one entry
+    (offset of the record header) for the first record of every step_s
+    window. The index is saved as {path}.idx.npz and returned as
+    {"ts": float64 array, "offset": int64 array}.
+    """
+    ts_out, off_out = [], []
+    last_bucket = None
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        endian, ts_unit, _ = read_header(mm, path)
+        for ts, off, _, _ in iter_records(mm, endian, ts_unit):
+            bucket = np.floor(ts / step_s).astype(np.int64)
+            first = np.ones(len(ts), dtype=bool)
+            first[1:] = bucket[1:] != bucket[:-1]
+            if last_bucket is not None:
+                first[0] = bucket[0] != last_bucket
+            ts_out.append(ts[first])
+            off_out.append(off[first] - 16)
+            last_bucket = bucket[-1]
+    finally:
+        mm.close()
+    index = {
+        "ts": np.concatenate(ts_out) if ts_out else np.zeros(0),
+        "offset": np.concatenate(off_out) if off_out else np.zeros(0, dtype=np.int64),
+    }
+    np.savez(path + INDEX_SUFFIX, **index)
+    return index
+
+
+def load_index(path: str, step_s: float = DEFAULT_STEP_S) -> dict:
+    """Loads the saved index for path, rebuilding it if missing or older than the capture."""
+    idx_path = path + INDEX_SUFFIX
+    if os.path.exists(idx_path) and os.path.getmtime(idx_path) >= os.path.getmtime(path):
+        with np.load(idx_path) as data:
+            return {"ts": data["ts"], "offset": data["offset"]}
+    return build_index(path, step_s)
+
+
+def slice_pcap(path: str, start_ts: float, end_ts: float, out_path: str, index: dict = None,
+               slack_s: float = DEFAULT_SLACK_S) -> int:
+    """
+    Writes the records of path with start_ts <= ts <= end_ts to out_path as
+    a standalone pcap. The index is used to seek to the first candidate
+    record; the scan stops once timestamps pass end_ts + slack_s (captures
+    can be slightly out of order). Runs of matching records are copied
+    straight from the mapping. Returns the number of records written; no
+    file is left behind when nothing matches.
+    """
+    index = index if index is not None else load_index(path)
+    # Start one index entry early to tolerate slightly out-of-order records
+    i = int(np.searchsorted(index["ts"], start_ts, side="right")) - 2
+    start = int(index["offset"][i]) if i >= 0 and len(index["offset"]) else 24
+
+    written = 0
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        endian, ts_unit, _ = read_header(mm, path)
+        hdr = struct.Struct(endian + "IIII")
+        size = len(mm)
+        with memoryview(mm) as view, open(out_path, "wb") as out:
+            out.write(mm[:24])
+            run_start = None
+            off = start
+            while off + 16 <= size:
+                sec, frac, incl, _ = hdr.unpack_from(mm, off)
+                ts = sec + frac * ts_unit
+                nxt = off + 16 + incl
+                if nxt > size or ts > end_ts + slack_s:
+                    break
+                if start_ts <= ts <= end_ts:
+                    run_start = off if run_start is None else run_start
+                    written += 1
+                elif run_start is not None:
+                    out.write(view[run_start:off])
+                    run_start = None
+                off = nxt
+            if run_start is not None:
+                out.write(view[run_start:off])
+    finally:
+        mm.close()
+    if written == 0:
+        os.remove(out_path)
+    return written
+
+
+def _label(phase: dict, n: int) -> str:
+    attrs = "_".join(f"{k}{v}" for k, v in phase.items() if k not in ("name", "start_ts", "end_ts", "ok"))
+    return "_".join(p for p in (f"{n:03d}", phase["name"], attrs) if p).replace("/", "-").replace(" ", "")
+
+
+def slice_phases(dut_root: str, name: str = None, clock_offset_s: float = 0.0, **match) -> list:
+    """
+    Cuts every capture under dut_root/sniffer and dut_root/tcpdump into one
+    small pcap per recorded phase (optionally only phases called name and
+    whose attributes equal match, e.g. name="attn_step", attn_db=42).
+    clock_offset_s is added to the controller-side phase times to line them
+    up with the capture clock. Slices go to dut_root/slices/<phase>/.
+    Returns the written slice paths.
+    """
+    phases_path = os.path.join(dut_root, PHASES_FILE)
+    if not os.path.exists(phases_path):
+        return []
+    captures = sorted(glob.glob(os.path.join(dut_root, "sniffer", "*.pcap*")) +
+                      glob.glob(os.path.join(dut_root, "tcpdump", "*.pcap*")))
+    captures = [c for c in captures if not c.endswith(INDEX_SUFFIX)]
+    indexes = {}
+    slices = []
+    for n, phase in enumerate(load_phases(phases_path)):
+        if name and phase["name"] != name:
+            continue
+        if any(phase.get(k) != v for k, v in match.items()):
+            continue
+        out_dir = os.path.join(dut_root, "slices", _label(phase, n))
+        os.makedirs(out_dir, exist_ok=True)
+        for cap in captures:
+            try:
+                if cap not in indexes:
+                    indexes[cap] = load_index(cap)
+                out_path = os.path.join(out_dir, os.path.basename(cap))
+                count = slice_pcap(cap, phase["start_ts"] + clock_offset_s, phase["end_ts"] + clock_offset_s,
+                                   out_path, indexes[cap])
+            except Exception as e:
+                logger.error(f"Could not slice {cap} to phase {phase['name']}: {e}")
+                continue
+            if count:
+                slices.append(out_path)
+                logger.info(f"Sliced {count} packets of {cap} to {out_path}")
+    return slices
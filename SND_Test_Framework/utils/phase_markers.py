@@ -0,0 +1,76 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from . import tracing
+
+logger = logging.getLogger("utils.phase_markers")
+
+PHASES_FILE = "phases.jsonl"
+
+
+class PhaseRecorder:
+    """
+    Records named test phases (join, attenuation steps, iperf runs, ...) with
+    their wall-clock window and attributes for one DUT. Each finished phase is
+    appended as one JSON line to {output_dir}/phases.jsonl, so captures can
+    later be sliced to a phase with pcap_index.slice_phases().
+    """
+
+    def __init__(self, dut: str, output_dir: str = None):
+        self.dut = dut
+        self.path = os.path.join(output_dir, PHASES_FILE) if output_dir else None
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str, **attrs):
+        """
+        Context manager marking one phase; attrs (e.g. attn_db=42) are stored
+        with it. Yields the attrs dict, so values known only inside the phase
+        can be added to the record.
+        """
+        start = time.time()
+        ok = False
+        try:
+            with tracing.span(name, "phase", dut=self.dut, **attrs):
+                yield attrs
+            ok = True
+        finally:
+            self._record({"name": name, "start_ts": start, "end_ts": time.time(), "ok": ok, **attrs})
+
+    def _record(self, record: dict):
+        with self._lock:
+            self.phases.append(record)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def start_recorder(dut: str, output_dir: str) -> PhaseRecorder:
+    """Starts a fresh recorder for dut writing into output_dir (one per test row)."""
+    with _recorders_lock:
+        rec = _recorders[dut] = PhaseRecorder(dut, output_dir)
+        return rec
+
+
+def get_recorder(dut: str) -> PhaseRecorder:
+    """Returns the DUT's current recorder; without one, phases are kept in memory only."""
+    with _recorders_lock:
+        rec = _recorders.get(dut)
+        if rec is None:
+            rec = _recorders[dut] = PhaseRecorder(dut)
+        return rec
+
+
+def load_phases(path: str) -> list:
+    """Reads a phases.jsonl file."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
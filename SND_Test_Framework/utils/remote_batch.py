@@ -0,0 +1,129 @@
+import logging
+import time
+from dataclasses import dataclass
+
+from .common_utils import ssh_execute
+
+logger = logging.getLogger("utils.remote_batch")
+
+MARKER = "@@SND_STEP"
+
+# Portable sub-second clock: GNU date understands %N, BSD/Darwin date prints a
+# literal "N", in which case we fall back to whole seconds.
+_CLOCK_FN = '__snd_t() { t=$(date +%s.%N 2>/dev/null); case "$t" in *N) date +%s;; *) echo "$t";; esac; }'
+
+
+@dataclass
+class StepResult:
+    name: str
+    rc: int
+    stdout: str = ""
+    stderr: str = ""
+    duration_s: float = 0.0
+    skipped: bool = False
+
+
+class RemoteBatch:
+    """
+    Collects remote steps for one host and runs them in a single SSH round trip.
+    Every step runs in its own subshell so a failing step cannot abort the
+    script; per-step return code, stdout, stderr and on-device duration are
+    reported back through marker lines.
+
+    Usage:
+        batch = RemoteBatch(dut, user, log_dir)
+        sysdiag_utils.erase_logs(dut, user, batch=batch)
+        wlan_utils.wifi_off(dut, user, batch=batch)
+        results = batch.run()
+    """
+
+    def __init__(self, host: str, user: str, log_dir: str = None, stop_on_error: bool = False):
+        self.host = host
+        self.user = user
+        self.log_dir = log_dir
+        self.stop_on_error = stop_on_error
+        self.steps = []
+
+    def add(self, name: str, command: str, settle_s: float = 0):
+        """
+        Queues a step. settle_s adds an on-device sleep after the command,
+        for hardware that needs time to react before the next step.
+        """
+        self.steps.append((name, command, settle_s))
+        return self
+
+    def script(self) -> str:
+        """Builds the shell script that runs every queued step."""
+        lines = [_CLOCK_FN, '__snd_e=/tmp/.snd_batch_$$.err']
+        for i, (name, command, settle_s) in enumerate(self.steps):
+            lines.append(f'printf "\\n{MARKER} {i} BEGIN %s\\n" "$(__snd_t)"')
+            lines.append(f'( {command} ) 2>"$__snd_e"; __snd_rc=$?')
+            if settle_s:
+                lines.append(f"sleep {settle_s}")
+            lines.append(f'printf "\\n{MARKER} {i} END %s %s\\n" "$__snd_rc" "$(__snd_t)"')
+            lines.append(f'cat "$__snd_e"')
+            if self.stop_on_error:
+                lines.append(f'[ "$__snd_rc" -eq 0 ] || {{ rm -f "$__snd_e"; exit "$__snd_rc"; }}')
+        lines.append('rm -f "$__snd_e"')
+        return "\n".join(lines)
+
+    def run(self) -> list:
+        """
+        Sends all queued steps in one round trip and returns a StepResult per
+        step, in order. Steps that never ran (stop_on_error, lost connection)
+        come back with skipped=True and rc=-1.
+        """
+        if not self.steps:
+            return []
+
+        start = time.time()
+        rc, out, err = ssh_execute(self.host, self.user, self.script(), self.log_dir)
+        elapsed = time.time() - start
+
+        results = self._parse(out)
+        for i, (name, _, _) in enumerate(self.steps):
+            if i not in results:
+                results[i] = StepResult(name, -1, stderr=err, skipped=True)
+
+        ordered = [results[i] for i in range(len(self.steps))]
+        failed = [r.name for r in ordered if r.rc != 0]
+        logger.info(
+            f"[{self.host}] Batch of {len(self.steps)} steps finished in {elapsed:.2f}s"
+            + (f" (failed: {', '.join(failed)})" if failed else "")
+        )
+        return ordered
+
+    def _parse(self, out: str) -> dict:
+        results = {}
+        current = None
+        section = None
+        body = {"stdout": [], "stderr": []}
+        begin_t = 0.0
+
+        def flush():
+            if current is not None and current in results:
+                results[current].stdout = "\n".join(body["stdout"]).strip()
+                results[current].stderr = "\n".join(body["stderr"]).strip()
+
+        for line in out.splitlines():
+            if line.startswith(MARKER):
+                parts = line.split()
+                idx, kind = int(parts[1]), parts[2]
+                if kind == "BEGIN":
+                    flush()
+                    current, section = idx, "stdout"
+                    body = {"stdout": [], "stderr": []}
+                    begin_t = float(parts[3])
+                    results[idx] = StepResult(self.steps[idx][0], -1)
+                elif kind == "END":
+                    results[idx].rc = int(parts[3])
+                    results[idx].duration_s = float(parts[4]) - begin_t
+                    section = "stderr"
+                continue
+            if section:
+                body[section].append(line)
+        flush()
+        return results
+
+    def __len__(self):
+        return len(self.steps)
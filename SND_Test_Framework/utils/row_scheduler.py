@@ -0,0 +1,258 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import tests
+
+logger = logging.getLogger("utils.row_scheduler")
+
+HISTORY_FILE = "row_durations.json"
+ROW_OVERHEAD_S = 60          # cleanup, collectors, snapshots and archive hand-off around each test
+DEFAULT_ESTIMATE_S = 120     # test modules without estimate_duration_s()
+EXHAUSTIVE_ROWS = 6          # up to this many rows every priority order is simulated
+
+
+def row_resources(group: dict, global_flags: dict, sniffer_devs: list) -> set:
+    """
+    Shared equipment a Test_Config row holds while it runs:
+      dut:<ip>             each of its DUTs
+      attenuator           the single global attenuator (enable_attenuator)
+      sniffer:<name>       the sniffers its sniffer_channels take, assigned by position
+      iperf:<host>:<port>  iperf3 server ports of its flows (the test module's resources())
+    """
+    params = group["params"]
+    needs = {f"dut:{dut}" for dut in group["duts"]}
+    if global_flags.get("enable_attenuator", False):
+        needs.add("attenuator")
+    if global_flags.get("enable_sniffer", False):
+        channels = [ch for ch in str(params.get("sniffer_channels", "") or "").split(",") if ch.strip()]
+        needs.update(f"sniffer:{sn['name']}" for sn in sniffer_devs[:len(channels)])
+    hook = tests.get_hook(params["TrafficType"], "resources")
+    if hook:
+        for dut in group["duts"]:
+            needs.update(hook(dut, params, group["remotes"]))
+    return needs
+
+
+def history_key(group: dict) -> str:
+    return f"{group['name']}|{group['params']['TrafficType']}|{len(group['duts'])}"
+
+
+def estimate_duration_s(group: dict, history: dict = None) -> float:
+    """The row's last observed run time, else the test module's estimate plus per-row overhead."""
+    observed = (history or {}).get(history_key(group))
+    if observed:
+        return float(observed)
+    hook = tests.get_hook(group["params"]["TrafficType"], "estimate_duration_s")
+    try:
+        base = float(hook(group["params"])) if hook else DEFAULT_ESTIMATE_S
+    except (TypeError, ValueError):
+        base = DEFAULT_ESTIMATE_S
+    return base + ROW_OVERHEAD_S
+
+
+def load_history(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_history(path: str, observed: dict):
+    """Merges this run's row durations into the history file."""
+    if not observed:
+        return
+    history = load_history(path)
+    history.update({k: round(v, 1) for k, v in observed.items()})
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(history, f, indent=1)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not save row durations to {path}: {e}")
+
+
+def _grantable(waiting: list, resources: list, busy: set) -> list:
+    """
+    Rows (from waiting, in priority order) that may start now: all their
+    resources are free and no higher-priority waiting row is queued for any
+    of them, so a row is never starved by later ones slipping past it.
+    """
+    granted = []
+    taken = set(busy)
+    queued = set()
+    for row in waiting:
+        needs = resources[row]
+        if needs.isdisjoint(taken) and needs.isdisjoint(queued):
+            granted.append(row)
+            taken |= needs
+        else:
+            queued |= needs
+    return granted
+
+
+def simulate(order: list, resources: list, durations: list) -> dict:
+    """Runs the lease policy over estimated durations; returns {row: (start_s, end_s)}."""
+    waiting = list(order)
+    running = []
+    busy = set()
+    placed = {}
+    now = 0.0
+    while waiting:
+        for row in _grantable(waiting, resources, busy):
+            waiting.remove(row)
+            busy |= resources[row]
+            placed[row] = (now, now + durations[row])
+            heapq.heappush(running, (now + durations[row], row))
+        if not waiting:
+            break
+        now, row = heapq.heappop(running)
+        busy -= resources[row]
+        while running and running[0][0] <= now:
+            busy -= resources[heapq.heappop(running)[1]]
+    return placed
+
+
+def _makespan(placed: dict) -> float:
+    return max((end for _, end in placed.values()), default=0.0)
+
+
+def plan_order(resources: list, durations: list) -> tuple:
+    """
+    Picks the priority order with the shortest simulated makespan: every
+    order for small plans, otherwise the sheet order, longest-first and
+    most-contended-first (own time plus the time of every row it conflicts with).
+    Returns (order, placed).
+    """
+    rows = list(range(len(resources)))
+    if len(rows) <= EXHAUSTIVE_ROWS:
+        candidates = itertools.permutations(rows)
+    else:
+        contention = [durations[r] + sum(durations[o] for o in rows if o != r and resources[r] & resources[o])
+                      for r in rows]
+        candidates = [
+            rows,
+            sorted(rows, key=lambda r: -durations[r]),
+            sorted(rows, key=lambda r: (-contention[r], -durations[r])),
+        ]
+    best = None
+    for order in candidates:
+        placed = simulate(list(order), resources, durations)
+        # Ties keep the earlier candidate, i.e. the operator's sheet order when it is as good
+        if best is None or _makespan(placed) < _makespan(best[1]) - 1e-9:
+            best = (list(order), placed)
+    return best
+
+
+def _fmt(seconds: float) -> str:
+    m, s = divmod(int(round(seconds)), 60)
+    h, m = divmod(m, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+class RowScheduler:
+    """
+    Runs Test_Config rows through leases on the equipment they share.
+    Rows with disjoint resources run in parallel; conflicting rows queue in
+    the planned priority order and start as soon as every lease they need
+    is released (actual run times decide, the plan only sets the order).
+    """
+
+    def __init__(self, groups: list, global_flags: dict, sniffer_devs: list, history: dict = None):
+        self.groups = groups
+        self.resources = [row_resources(g, global_flags, sniffer_devs) for g in groups]
+        self.durations = [estimate_duration_s(g, history) for g in groups]
+        self.order, self.plan = plan_order(self.resources, self.durations)
+        self.observed = {}
+        self._waiting = list(self.order)
+        self._busy = set()
+        self._holders = {}
+        self._listeners = []
+        self._cond = threading.Condition()
+
+    def conflicts(self, row: int) -> dict:
+        """{other row: shared resources} for every row that cannot run alongside row."""
+        return {o: self.resources[row] & r for o, r in enumerate(self.resources)
+                if o != row and self.resources[row] & r}
+
+    def format_plan(self) -> list:
+        """Human-readable planned schedule, one line per row in start order."""
+        makespan = _makespan(self.plan)
+        lines = [f"Planned schedule: {len(self.groups)} row(s), est. {_fmt(makespan)} "
+                 f"(one at a time: {_fmt(sum(self.durations))})"]
+        for row in sorted(self.order, key=lambda r: (self.plan[r][0], self.order.index(r))):
+            start, end = self.plan[row]
+            g = self.groups[row]
+            after = sorted({self.groups[o]["name"] for o in self.conflicts(row) if self.plan[o][0] < start})
+            shared = sorted(set().union(*self.conflicts(row).values())) if self.conflicts(row) else []
+            line = f"  {_fmt(start)} -> {_fmt(end)}  {g['name']} ({g['params']['TrafficType']}, {len(g['duts'])} DUT(s))"
+            if after:
+                line += f"  after {', '.join(after)}"
+            if shared:
+                line += f"  [shares {', '.join(shared[:4])}{' ...' if len(shared) > 4 else ''}]"
+            lines.append(line)
+        return lines
+
+    def add_listener(self, fn):
+        """Calls fn() (from the releasing thread) after every release, e.g. to wake waiters on an event loop."""
+        self._listeners.append(fn)
+
+    def _grant_locked(self, row: int):
+        self._waiting.remove(row)
+        self._busy |= self.resources[row]
+        for r in self.resources[row]:
+            self._holders[r] = self.groups[row]["name"]
+
+    def _log_queued_locked(self, row: int):
+        held = sorted({self._holders[r] for r in self.resources[row] if r in self._holders})
+        logger.info(f"Row {self.groups[row]['name']} queued behind {', '.join(held) or 'higher-priority rows'}")
+
+    def try_acquire(self, row: int, log_queued: bool = False) -> bool:
+        """Leases row's resources if it may start now; never blocks."""
+        with self._cond:
+            if row not in _grantable(self._waiting, self.resources, self._busy):
+                if log_queued:
+                    self._log_queued_locked(row)
+                return False
+            self._grant_locked(row)
+        logger.info(f"Row {self.groups[row]['name']} leased {len(self.resources[row])} resource(s), starting")
+        return True
+
+    def acquire(self, row: int):
+        """Blocks until row holds every resource it needs."""
+        if self.try_acquire(row, log_queued=True):
+            return
+        with self._cond:
+            while row not in _grantable(self._waiting, self.resources, self._busy):
+                self._cond.wait()
+            self._grant_locked(row)
+        logger.info(f"Row {self.groups[row]['name']} leased {len(self.resources[row])} resource(s), starting")
+
+    def release(self, row: int, elapsed_s: float = None):
+        with self._cond:
+            self._busy -= self.resources[row]
+            for r in self.resources[row]:
+                self._holders.pop(r, None)
+            if elapsed_s is not None:
+                self.observed[history_key(self.groups[row])] = elapsed_s
+            self._cond.notify_all()
+        logger.info(f"Row {self.groups[row]['name']} released its resources")
+        for fn in self._listeners:
+            fn()
+
+    @contextmanager
+    def lease(self, row: int):
+        self.acquire(row)
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.release(row, time.time() - start)
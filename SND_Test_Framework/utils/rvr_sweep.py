@@ -0,0 +1,196 @@
+import json
+import logging
+import math
+import os
+import threading
+
+logger = logging.getLogger("utils.rvr_sweep")
+
+SWEEP_FILE = "rvr_sweep.json"
+LINEAR = "linear"
+ADAPTIVE = "adaptive"
+DEFAULT_COARSE_FACTOR = 4    # coarse step = this many fine steps unless rvr_coarse_step_dB is set
+DEFAULT_CHANGE_PCT = 15      # a measured gap changing more than this is refined
+DEFAULT_FLOOR_MBPS = 1.0     # below this the link counts as gone
+DEFAULT_GONE_POINTS = 2      # consecutive gone points (for every DUT) that end the sweep
+
+
+def throughput_mbps(report: list) -> float:
+    """Aggregate received throughput of one point's run_flows() report; failed flows count as 0."""
+    total = 0.0
+    for _, rc, summary in report:
+        if rc != 0 or summary is None or summary.error:
+            continue
+        for bps in (summary.received_bps, summary.reverse_received_bps):
+            if bps is not None and not math.isnan(bps):
+                total += bps
+    return total / 1e6
+
+
+class AdaptivePlanner:
+    """
+    Chooses RvR points on the fine grid start + k * fine_db from what has
+    been measured so far ({dut: {attn_db: Mbps}}):
+      1. a gap between two measured neighbours wider than one fine step, where
+         any DUT's throughput changed by more than change_pct, is bisected
+         (lowest gap first), so steep drops end up at full resolution; gaps
+         below floor_mbps at both ends are dead zone and never refined;
+      2. otherwise, once every DUT has been below floor_mbps for the last
+         gone_points measured points, the sweep stops;
+      3. otherwise the sweep moves on by one coarse step (capped at stop_db).
+    """
+
+    def __init__(self, start_db: float, stop_db: float, fine_db: float, coarse_db: float = None,
+                 change_pct: float = DEFAULT_CHANGE_PCT, floor_mbps: float = DEFAULT_FLOOR_MBPS,
+                 gone_points: int = DEFAULT_GONE_POINTS):
+        self.start_db = start_db
+        self.fine_db = fine_db
+        self.last_k = max(0, int((stop_db - start_db) / fine_db + 1e-9))
+        coarse_db = coarse_db or fine_db * DEFAULT_COARSE_FACTOR
+        self.coarse_k = max(1, int(round(coarse_db / fine_db)))
+        self.change = change_pct / 100.0
+        self.floor_mbps = floor_mbps
+        self.gone_points = max(1, gone_points)
+
+    def db(self, k: int) -> float:
+        return round(self.start_db + k * self.fine_db, 4)
+
+    def _k(self, attn_db: float) -> int:
+        return int(round((attn_db - self.start_db) / self.fine_db))
+
+    def next_point(self, results: dict) -> tuple:
+        """Returns (attn_db, reason), or (None, reason) once the sweep is complete."""
+        curves = {dut: {self._k(a): v for a, v in pts.items()} for dut, pts in results.items()}
+        measured = sorted(set().union(*[c.keys() for c in curves.values()])) if curves else []
+        if not measured:
+            return self.db(0), "start"
+
+        for lo, hi in zip(measured, measured[1:]):
+            if hi - lo <= 1:
+                continue
+            for dut, curve in curves.items():
+                a, b = curve.get(lo), curve.get(hi)
+                if a is None or b is None or max(a, b) < self.floor_mbps:
+                    continue
+                delta = abs(a - b) / max(a, b, 1e-9)
+                if delta > self.change:
+                    return (self.db((lo + hi) // 2),
+                            f"refine {self.db(lo):g}-{self.db(hi):g} dB: {dut} changed {delta * 100:.0f}%")
+
+        tail = measured[-self.gone_points:]
+        if len(tail) == self.gone_points and all(
+            curve.get(k, 0.0) < self.floor_mbps for curve in curves.values() for k in tail
+        ):
+            return None, f"stop: link gone (< {self.floor_mbps:g} Mbps) from {self.db(tail[0]):g} dB for every DUT"
+
+        if measured[-1] >= self.last_k:
+            return None, "stop: reached stop_attn"
+        k = min(measured[-1] + self.coarse_k, self.last_k)
+        return self.db(k), "coarse step: stable"
+
+
+class GroupSweep:
+    """
+    The sweep of one Test_Config row, shared by its DUTs (which all sit on
+    one attenuator and step together). Every DUT reports its throughput per
+    point; point(i) is decided once, by the first DUT to ask after the
+    barrier, from all reports of the points before it.
+    """
+
+    def __init__(self, key: str, parties: int, linear_points: list, planner: AdaptivePlanner = None):
+        self.key = key
+        self.parties = parties
+        self.linear_points = linear_points
+        self.planner = planner
+        self.mode = ADAPTIVE if planner else LINEAR
+        self.decisions = []
+        self.results = {}
+        self._finished = set()
+        self._lock = threading.Lock()
+
+    def point(self, index: int) -> tuple:
+        """(attn_db, reason) of the index-th point, or (None, reason) when the sweep is over."""
+        with self._lock:
+            while len(self.decisions) <= index:
+                if self.decisions and self.decisions[-1]["attn_db"] is None:
+                    break
+                n = len(self.decisions)
+                if self.planner:
+                    attn, reason = self.planner.next_point(self.results)
+                else:
+                    attn, reason = (self.linear_points[n], LINEAR) if n < len(self.linear_points) else (None, "stop: end of range")
+                self.decisions.append({"index": n, "attn_db": attn, "reason": reason})
+                if attn is not None and self.planner:
+                    logger.info(f"[{self.key}] RvR point {n}: {attn:g} dB ({reason})")
+            d = self.decisions[min(index, len(self.decisions) - 1)]
+            return d["attn_db"], d["reason"]
+
+    def report(self, dut: str, attn_db: float, mbps: float):
+        with self._lock:
+            self.results.setdefault(dut, {})[attn_db] = round(mbps, 3)
+
+    def finish(self, dut: str, output_dir: str = None):
+        """Writes this DUT's sweep record to output_dir and drops the sweep after the row's last DUT."""
+        with self._lock:
+            record = {
+                "mode": self.mode,
+                "points": [d for d in self.decisions if d["attn_db"] is not None],
+                "end": self.decisions[-1]["reason"] if self.decisions else None,
+                "linear_points": len(self.linear_points),
+                "throughput_mbps": {str(a): v for a, v in sorted(self.results.get(dut, {}).items())},
+            }
+            self._finished.add(dut)
+            last = len(self._finished) >= self.parties
+        if output_dir:
+            with open(os.path.join(output_dir, SWEEP_FILE), "w") as f:
+                json.dump(record, f, indent=2)
+        if last:
+            with _lock:
+                if _sweeps.get(self.key) is self:
+                    del _sweeps[self.key]
+            if self.planner:
+                logger.info(f"[{self.key}] Adaptive RvR measured {len(record['points'])} point(s) "
+                            f"instead of {len(self.linear_points)}; {record['end']}")
+        return record
+
+
+_sweeps = {}
+_lock = threading.Lock()
+
+
+def _setting(test_params: dict, global_flags: dict, name: str, default):
+    """Row value, else Execution-sheet value, else default (blank and NaN cells count as unset)."""
+    for source in (test_params, global_flags):
+        value = source.get(name)
+        if value is not None and str(value).strip() != "" and not (isinstance(value, float) and math.isnan(value)):
+            return value
+    return default
+
+
+def get_sweep(test_params: dict, global_flags: dict, parties: int) -> GroupSweep:
+    """
+    Returns the sweep of the row test_params belongs to, creating it on
+    first use. rvr_sweep (row or Execution sheet) selects linear (default)
+    or adaptive; rvr_coarse_step_dB, rvr_change_pct, rvr_floor_mbps and
+    rvr_gone_points tune the adaptive planner.
+    """
+    key = f"{test_params.get('Test_Type')}[{test_params.get('dut')}]"
+    with _lock:
+        sweep = _sweeps.get(key)
+        if sweep is not None:
+            return sweep
+        start = int(test_params.get("start_attn_1", 0))
+        stop = int(test_params.get("stop_attn_1", 0))
+        step = int(test_params.get("attn_step_dB", 1))
+        linear_points = list(range(start, stop + 1, step))
+        planner = None
+        if str(_setting(test_params, global_flags, "rvr_sweep", LINEAR)).strip().lower() == ADAPTIVE and step > 0:
+            planner = AdaptivePlanner(
+                start, stop, step,
+                coarse_db=float(_setting(test_params, global_flags, "rvr_coarse_step_dB", 0)) or None,
+                change_pct=float(_setting(test_params, global_flags, "rvr_change_pct", DEFAULT_CHANGE_PCT)),
+                floor_mbps=float(_setting(test_params, global_flags, "rvr_floor_mbps", DEFAULT_FLOOR_MBPS)),
+                gone_points=int(_setting(test_params, global_flags, "rvr_gone_points", DEFAULT_GONE_POINTS))
+            )
+        sweep = _sweeps[key] = GroupSweep(key, parties, linear_points, planner)
+        return sweep
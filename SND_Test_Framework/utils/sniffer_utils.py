@@ -1,17 +1,29 @@
+import itertools
 import logging
+import os
+import re
 import time
-from .common_utils import ssh_execute, get_timestamp
+from .common_utils import ssh_execute, get_timestamp, shell_wait
+from .capture_transfer import pull_capture
 
 logger = logging.getLogger("utils.sniffer_utils")
 
-def start_sniffer(host: str, user: str, interface: str, freq_info: dict, output_folder: str):
+_capture_seq = itertools.count(1)
+
+def start_sniffer(host: str, user: str, interface: str, freq_info: dict, output_folder: str,
+                  rotate_args: str = "", tag: str = ""):
     """
     Starts a sniffer on the remote sniffer device.
+    rotate_args are passed to sniffer_tool to write rotating segments
+    (ring-buffer mode); the returned path is then the segment prefix.
+    The remote path carries tag (e.g. the DUT), the controller PID and a
+    counter, so DUTs sharing a sniffer never write, stop or pull each other's capture.
     """
     timestamp = time.strftime("%Y%m%d_%H%M%S")
-    remote_pcap = f"/tmp/sniffer_{timestamp}.pcap"
+    tag = re.sub(r"[^A-Za-z0-9_-]", "_", tag)
+    remote_pcap = f"/tmp/sniffer_{timestamp}_{tag + '_' if tag else ''}{os.getpid()}_{next(_capture_seq)}.pcap"
     channel_param = freq_info.get("Ch_parameter", "")
-    start_cmd = f"nohup sniffer_tool --iface {interface} {channel_param} -o {remote_pcap} > /dev/null 2>&1 &"
+    start_cmd = f"nohup sniffer_tool --iface {interface} {channel_param} {rotate_args} -o {remote_pcap} > /dev/null 2>&1 &"
     rc, out, err = ssh_execute(host, user, start_cmd, output_folder)
     if rc == 0:
         logger.info(f"Sniffer started on {host}:{interface}, saving {remote_pcap}")
@@ -20,13 +32,25 @@ def start_sniffer(host: str, user: str, interface: str, freq_info: dict, output_
         logger.error(f"Failed to start sniffer on {host}: {err}")
         return None
 
-def stop_sniffer(host: str, user: str, remote_pcap: str):
+def stop_sniffer(host: str, user: str, remote_pcap: str, output_folder: str = None, codec: str = "gzip",
+                 collector=None):
     """
-    Stops the sniffer by signaling sniffer_tool processes.
+    Stops the sniffer_tool writing remote_pcap, leaving other captures on the
+    same sniffer running. If output_folder is given, the capture is then
+    streamed into it (compressed in transit, verified, and deleted remotely).
+    In ring-buffer mode pass the capture's SegmentCollector instead.
+    Returns the transfer stats (a list for a collector), or None.
     """
-    stop_cmd = "pkill -SIGINT -f sniffer_tool"
-    rc, out, err = ssh_execute(host, user, stop_cmd, local_log_dir="logs")
+    # [s] keeps the pattern from matching the remote shell running this command
+    pattern = f"[s]niffer_tool.*{remote_pcap}"
+    stop_cmd = f"pkill -INT -f '{pattern}'; " + shell_wait(f"! pgrep -f '{pattern}' > /dev/null", timeout_s=10)
+    rc, out, err = ssh_execute(host, user, stop_cmd, output_folder)
     if rc == 0:
         logger.info(f"Sniffer stopped on {host}")
     else:
         logger.error(f"Failed to stop sniffer on {host}: {err}")
+    if collector is not None:
+        return collector.finish()
+    if output_folder and remote_pcap:
+        return pull_capture(host, user, remote_pcap, output_folder, codec=codec)
+    return None
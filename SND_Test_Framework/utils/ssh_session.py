@@ -0,0 +1,216 @@
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger("utils.ssh_session")
+
+# Where the OpenSSH control sockets live. %C is expanded by ssh to a hash of
+# (local host, remote host, port, user), which keeps the path short enough for
+# a unix socket no matter how long the host name is.
+CONTROL_DIR = os.path.join(tempfile.gettempdir(), "snd_ssh")
+IDLE_TIMEOUT_S = 300
+CONNECT_TIMEOUT_S = 15
+
+
+class SSHSession:
+    """
+    One persistent, multiplexed OpenSSH master connection to user@host.
+    Every command run through options() reuses the master's TCP connection
+    and authentication instead of doing a fresh handshake.
+    """
+
+    def __init__(self, host: str, user: str, control_dir: str, persist_s: int):
+        self.host = host
+        self.user = user
+        self.persist_s = persist_s
+        self.control_path = os.path.join(control_dir, "%C")
+        self.last_used = 0.0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def target(self) -> str:
+        return f"{self.user}@{self.host}"
+
+    def options(self) -> list:
+        """ssh/scp -o options that attach a client to this master."""
+        return ["-o", "ControlMaster=no", "-o", f"ControlPath={self.control_path}"]
+
+    def is_alive(self) -> bool:
+        """Asks the local master process whether it is still running."""
+        cmd = ["ssh", "-O", "check", "-o", f"ControlPath={self.control_path}", self.target]
+        try:
+            return subprocess.run(cmd, capture_output=True, timeout=5).returncode == 0
+        except Exception:
+            return False
+
+    def open(self) -> bool:
+        """
+        Starts the master connection in the background (-f) without a remote
+        command (-N). ControlPersist makes ssh itself drop the master after
+        persist_s idle seconds, even if the framework dies without cleanup.
+        """
+        cmd = [
+            "ssh", "-M", "-N", "-f",
+            "-o", "ControlMaster=yes",
+            "-o", f"ControlPath={self.control_path}",
+            "-o", f"ControlPersist={self.persist_s}",
+            "-o", f"ConnectTimeout={CONNECT_TIMEOUT_S}",
+            self.target,
+        ]
+        try:
+            ret = subprocess.run(cmd, capture_output=True, text=True, timeout=CONNECT_TIMEOUT_S + 5)
+        except Exception as e:
+            logger.error(f"[{self.host}] Failed to open SSH master: {e}")
+            return False
+        if ret.returncode != 0:
+            logger.error(f"[{self.host}] Failed to open SSH master: {ret.stderr.strip()}")
+            return False
+        self.opened_at = time.time()
+        logger.info(f"[{self.host}] SSH master connection opened for {self.user}")
+        return True
+
+    def close(self):
+        """Tells the master to exit; running multiplexed commands are torn down."""
+        cmd = ["ssh", "-O", "exit", "-o", f"ControlPath={self.control_path}", self.target]
+        try:
+            subprocess.run(cmd, capture_output=True, timeout=5)
+            logger.info(f"[{self.host}] SSH master connection closed")
+        except Exception as e:
+            logger.error(f"[{self.host}] Failed to close SSH master: {e}")
+
+
+class SSHSessionPool:
+    """
+    Keeps one SSHSession per (host, user) and hands out the ssh/scp options
+    needed to multiplex over it. Masters idle for idle_timeout_s are dropped
+    by ssh itself (ControlPersist), never by the pool, so a long-running
+    command is never cut off. Also counts handshakes and per-command latency
+    so the savings can be reported.
+    """
+
+    def __init__(self, idle_timeout_s: int = IDLE_TIMEOUT_S, control_dir: str = CONTROL_DIR, enabled: bool = True):
+        self.idle_timeout_s = idle_timeout_s
+        self.control_dir = control_dir
+        self.enabled = enabled
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _host_stats(self, host: str) -> dict:
+        return self._stats.setdefault(host, {"handshakes": 0, "commands": 0, "total_s": 0.0, "max_s": 0.0})
+
+    def acquire(self, host: str, user: str):
+        """
+        Returns the SSHSession for user@host, opening the master on first
+        use. Returns None when multiplexing is disabled or the master cannot
+        be opened, in which case callers fall back to a plain ssh handshake.
+        The master is only re-checked once it may have expired (idle for
+        idle_timeout_s) or after revalidate(); a dead control socket costs
+        nothing more in between, as ssh then connects directly.
+        """
+        if not self.enabled:
+            with self._lock:
+                self._host_stats(host)["handshakes"] += 1
+            return None
+
+        with self._lock:
+            session = self._sessions.get((host, user))
+            if session is None:
+                os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+                session = SSHSession(host, user, self.control_dir, self.idle_timeout_s)
+                self._sessions[(host, user)] = session
+
+        # Per-session lock: concurrent first calls to one host open a single master
+        with session.lock:
+            expired = time.time() - session.last_used > self.idle_timeout_s
+            if not session.opened_at or (expired and not session.is_alive()):
+                ok = session.open()
+                with self._lock:
+                    self._host_stats(host)["handshakes"] += 1
+                if not ok:
+                    return None
+            session.last_used = time.time()
+        return session
+
+    def ssh_args(self, host: str, user: str) -> list:
+        """Returns the ssh argv prefix (up to and including user@host)."""
+        session = self.acquire(host, user)
+        opts = session.options() if session else []
+        return ["ssh", *opts, f"{user}@{host}"]
+
+    def scp_args(self, host: str, user: str) -> list:
+        """Returns the scp argv prefix; append source and destination."""
+        session = self.acquire(host, user)
+        opts = session.options() if session else []
+        return ["scp", *opts]
+
+    def record(self, host: str, elapsed_s: float):
+        """Records the wall time of one remote command against host."""
+        now = time.time()
+        with self._lock:
+            s = self._host_stats(host)
+            s["commands"] += 1
+            s["total_s"] += elapsed_s
+            s["max_s"] = max(s["max_s"], elapsed_s)
+            # A command that just finished kept the master busy until now
+            for (h, _), session in self._sessions.items():
+                if h == host:
+                    session.last_used = max(session.last_used, now)
+
+    def revalidate(self, host: str, user: str):
+        """
+        Called after ssh exited 255 (its own failure): if the master is gone,
+        the next acquire() opens a new one.
+        """
+        with self._lock:
+            session = self._sessions.get((host, user))
+        if session is None or not session.opened_at:
+            return
+        with session.lock:
+            if not session.is_alive():
+                logger.warning(f"[{host}] SSH master connection lost, reopening on next command")
+                session.opened_at = 0.0
+
+    def close_all(self):
+        """Closes every open master connection."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            if session.opened_at:
+                session.close()
+
+    def stats(self) -> dict:
+        """
+        Returns {"handshakes", "commands", "mean_latency_s", "max_latency_s", "hosts": {host: {...}}}.
+        """
+        with self._lock:
+            hosts = {h: dict(s) for h, s in self._stats.items()}
+        commands = sum(s["commands"] for s in hosts.values())
+        total_s = sum(s["total_s"] for s in hosts.values())
+        return {
+            "handshakes": sum(s["handshakes"] for s in hosts.values()),
+            "commands": commands,
+            "mean_latency_s": total_s / commands if commands else 0.0,
+            "max_latency_s": max((s["max_s"] for s in hosts.values()), default=0.0),
+            "hosts": hosts,
+        }
+
+
+_pool = SSHSessionPool()
+
+
+def get_pool() -> SSHSessionPool:
+    """Returns the process-wide session pool."""
+    return _pool
+
+
+def configure(enabled: bool = True, idle_timeout_s: int = IDLE_TIMEOUT_S):
+    """Applies Execution_Config settings to the process-wide pool."""
+    _pool.enabled = enabled
+    _pool.idle_timeout_s = idle_timeout_s
+    logger.info(f"SSH multiplexing {'enabled' if enabled else 'disabled'} (idle timeout {idle_timeout_s}s)")
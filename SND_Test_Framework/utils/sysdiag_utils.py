@@ -1,5 +1,5 @@
 import logging
-from .common_utils import ssh_execute, get_timestamp
+from .common_utils import ssh_execute, scp_pull, get_timestamp
 
 logger = logging.getLogger("utils.sysdiag_utils")
 
@@ -19,16 +19,20 @@ def run_logarchive(host: str, user: str, output_dir: str):
     rc, out, err = ssh_execute(host, user, tar_cmd, output_dir)
     if rc == 0:
         try:
-            subprocess.call(f"scp {user}@{host}:{remote_archive} {output_dir}/{host.replace('.', '_')}_logs.tar.gz", shell=True)
+            scp_pull(host, user, remote_archive, f"{output_dir}/{host.replace('.', '_')}_logs.tar.gz")
             logger.info(f"Archived logs from {host} to {output_dir}/{host.replace('.', '_')}_logs.tar.gz")
         except Exception as e:
             logger.error(f"SCP failed: {e}", exc_info=True)
     else:
         logger.error(f"Failed to create remote archive on {host}: {err}")
 
-def erase_logs(host: str, user: str):
+def erase_logs(host: str, user: str, batch=None):
     """
     Removes all logs on the DUT.
+    If a RemoteBatch is given, the step is queued on it instead of run.
     """
     cmd = "sudo rm -rf /var/log/*"
-    return ssh_execute(host, user, cmd, local_log_dir="logs")
+    if batch is not None:
+        batch.add("erase_logs", cmd)
+        return
+    return ssh_execute(host, user, cmd)
@@ -2,18 +2,21 @@ import logging
 import subprocess
 import time
 import os
-from .common_utils import ssh_execute, get_timestamp
+from .common_utils import ssh_execute, get_timestamp, shell_wait
+from .capture_transfer import pull_capture
 
 logger = logging.getLogger("utils.tcpdump_utils")
 
-def start_tcpdump(host: str, user: str, interface: str, output_dir: str):
+def start_tcpdump(host: str, user: str, interface: str, output_dir: str, rotate_args: str = ""):
     """
     Starts tcpdump on the DUT via SSH.
+    rotate_args (see capture_rotation.ring_args) turns on ring-buffer mode,
+    in which case the returned path is the prefix of the rotated segments.
     Returns the remote pcap file path.
     """
     timestamp = time.strftime("%Y%m%d_%H%M%S")
     remote_pcap = f"/tmp/tcpdump_{timestamp}.pcap"
-    cmd = f"nohup tcpdump -i {interface} -w {remote_pcap} > /dev/null 2>&1 &"
+    cmd = f"nohup tcpdump -i {interface} {rotate_args} -w {remote_pcap} > /dev/null 2>&1 &"
     rc, out, err = ssh_execute(host, user, cmd, output_dir)
     if rc == 0:
         logger.info(f"tcpdump started on {host}:{interface}, saving {remote_pcap}")
@@ -22,13 +25,25 @@ def start_tcpdump(host: str, user: str, interface: str, output_dir: str):
         logger.error(f"Failed to start tcpdump on {host}: {err}")
         return None
 
-def stop_tcpdump(host: str, user: str, remote_pcap: str):
+def stop_tcpdump(host: str, user: str, remote_pcap: str, output_dir: str = None, codec: str = "gzip",
+                 collector=None):
     """
-    Stops tcpdump on the DUT.
+    Stops the tcpdump writing remote_pcap and waits for it to flush and exit.
+    If output_dir is given, the capture is then streamed into it (compressed
+    in transit, verified, and deleted from the DUT). In ring-buffer mode pass
+    the capture's SegmentCollector instead, which pulls the remaining segments.
+    Returns the transfer stats (a list for a collector), or None.
     """
-    cmd = "pkill -SIGINT -f tcpdump"
-    rc, out, err = ssh_execute(host, user, cmd, local_log_dir="logs")
+    # [t] keeps the pattern from matching the remote shell running this command
+    pattern = f"[t]cpdump.*{remote_pcap}"
+    cmd = f"pkill -INT -f '{pattern}'; " + shell_wait(f"! pgrep -f '{pattern}' > /dev/null", timeout_s=10)
+    rc, out, err = ssh_execute(host, user, cmd, output_dir)
     if rc == 0:
         logger.info(f"tcpdump stopped on {host}")
     else:
         logger.error(f"Failed to stop tcpdump on {host}: {err}")
+    if collector is not None:
+        return collector.finish()
+    if output_dir and remote_pcap:
+        return pull_capture(host, user, remote_pcap, output_dir, codec=codec)
+    return None
@@ -0,0 +1,307 @@
+import glob
+import heapq
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import time
+from datetime import datetime
+
+from .command_journal import JOURNAL_SUFFIX, flush_all, read_journal
+from .common_utils import ssh_execute
+
+logger = logging.getLogger("utils.timeline")
+
+CLOCK_FILE = "clock_offset.json"
+TIMELINE_FILE = "timeline.jsonl"
+REORDER_WINDOW_S = 5.0
+
+# Clock domains: controller timestamps need no correction, DUT/sniffer ones
+# are shifted by their estimated offset (remote clock - controller clock)
+CONTROLLER, DUT, SNIFFER = "controller", "dut", "sniffer"
+
+_EXEC_HEADER = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:,\d+)? \[(\w+)\] ([\w.]+): (.*)$")
+
+
+def _local_ts(text: str) -> float:
+    fmt = "%Y-%m-%d %H:%M:%S.%f" if "." in text else "%Y-%m-%d %H:%M:%S"
+    return datetime.strptime(text, fmt).timestamp()
+
+
+def _event(ts: float, source: str, kind: str, msg: str, **fields) -> dict:
+    return {"ts": ts, "source": source, "kind": kind, "msg": msg, **fields}
+
+
+# ---- clock offset -----------------------------------------------------------------
+
+def estimate_clock_offset(host: str, user: str, samples: int = 5, log_dir: str = None) -> dict:
+    """
+    Estimates host clock - controller clock NTP style: the remote time is
+    assumed to be read halfway through the round trip, and the sample with
+    the shortest round trip wins. Uses sub-second time via perl where the
+    host has it, `date +%s` otherwise.
+    """
+    cmd = "perl -MTime::HiRes=time -e 'printf(\"%.6f\\n\", time)' 2>/dev/null || date +%s"
+    best = None
+    for _ in range(samples):
+        t0 = time.time()
+        rc, out, err = ssh_execute(host, user, cmd, log_dir)
+        t1 = time.time()
+        try:
+            remote = float(out.strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            continue
+        sample = {"offset_s": remote - (t0 + t1) / 2, "rtt_s": t1 - t0, "resolution_s": 1.0 if "." not in out else 1e-6}
+        if best is None or sample["rtt_s"] < best["rtt_s"]:
+            best = sample
+    if best is None:
+        logger.warning(f"[{host}] Could not read the remote clock, assuming no offset")
+        return {"offset_s": 0.0, "rtt_s": None, "resolution_s": None, "measured_at": time.time()}
+    best["measured_at"] = time.time()
+    logger.info(f"[{host}] Clock offset {best['offset_s']:+.3f}s (rtt {best['rtt_s'] * 1000:.1f} ms)")
+    return best
+
+
+def save_clock_offsets(dut_root: str, offsets: dict):
+    """Writes {domain: offset info} to dut_root/clock_offset.json."""
+    with open(os.path.join(dut_root, CLOCK_FILE), "w") as f:
+        json.dump(offsets, f, indent=2)
+
+
+def load_clock_offsets(dut_root: str) -> dict:
+    """Returns {domain: offset_s}; missing domains are treated as in sync."""
+    path = os.path.join(dut_root, CLOCK_FILE)
+    offsets = {CONTROLLER: 0.0}
+    if os.path.exists(path):
+        with open(path) as f:
+            for domain, info in json.load(f).items():
+                offsets[domain] = float(info.get("offset_s") or 0.0)
+    return offsets
+
+
+# ---- sources: each yields events in (roughly) time order ---------------------------
+
+def ssh_log_events(path: str):
+    """Commands from a host's command journal, stamped with their start time."""
+    for entry in read_journal(path):
+        yield _event(entry["start"], "ssh", "command", entry["cmd"], target=f"{entry['user']}@{entry['host']}",
+                     rc=entry["rc"], duration_s=round(entry["end"] - entry["start"], 3),
+                     output=entry["stdout"] + entry["stderr"])
+
+
+def exec_log_events(path: str, dut: str):
+    """Lines of testExecOutput.log mentioning dut (tracebacks stay with their record)."""
+    pending = None
+    with open(path, errors="replace") as f:
+        for line in f:
+            m = _EXEC_HEADER.match(line.rstrip("\n"))
+            if m:
+                if pending and dut in pending["msg"]:
+                    yield pending
+                pending = _event(_local_ts(m.group(1)), "framework", m.group(2).lower(), m.group(4),
+                                 logger=m.group(3))
+            elif pending is not None:
+                pending["msg"] += "\n" + line.rstrip("\n")
+    if pending and dut in pending["msg"]:
+        yield pending
+
+
+def phase_events(path: str):
+    """Start and end of every recorded test phase."""
+    from .phase_markers import load_phases
+    events = []
+    for p in load_phases(path):
+        attrs = {k: v for k, v in p.items() if k not in ("name", "start_ts", "end_ts")}
+        events.append(_event(p["start_ts"], "phase", "start", p["name"], **attrs))
+        events.append(_event(p["end_ts"], "phase", "end", p["name"], **attrs))
+    return iter(sorted(events, key=lambda e: e["ts"]))
+
+
+def wlan_status_events(path: str):
+    """One event per timestamped `airport -I` block."""
+    from .wlan_status import TS_MARKER, parse_block
+    ts, block = None, []
+    with open(path, errors="replace") as f:
+        for line in f:
+            if line.startswith(TS_MARKER) or not line.strip():
+                if ts is not None and block:
+                    s = parse_block(block, ts)
+                    yield _event(ts, "wlan_status", "sample", f"rssi {s['rssi']:.0f} dBm, tx {s['tx_rate']:.0f} Mbps",
+                                 **{k: v for k, v in s.items() if k != "ts"})
+                block = []
+                if line.startswith(TS_MARKER):
+                    try:
+                        ts = float(line.split()[1])
+                    except (IndexError, ValueError):
+                        ts = None
+            else:
+                block.append(line)
+    if ts is not None and block:
+        s = parse_block(block, ts)
+        yield _event(ts, "wlan_status", "sample", f"rssi {s['rssi']:.0f} dBm, tx {s['tx_rate']:.0f} Mbps",
+                     **{k: v for k, v in s.items() if k != "ts"})
+
+
+def iperf_events(dut_root: str):
+    """iperf3 run summaries and per-interval throughput from the DUT's result store."""
+    from .iperf_results import INTERVALS_FILE, SUMMARY_FILE, load_columns
+    summary_path = os.path.join(dut_root, SUMMARY_FILE)
+    if not os.path.exists(summary_path):
+        return iter(())
+    summary = load_columns(summary_path)
+    runs = {}
+    events = []
+    for i in range(len(summary["run_id"])):
+        start = float(summary["start_ts"][i])
+        runs[int(summary["run_id"][i])] = start
+        events.append(_event(start, "iperf", "run", (
+            f"{summary['direction'][i]} to {summary['remote'][i]}: sent {summary['sent_bps'][i] / 1e6:.1f} Mbps, "
+            f"received {summary['received_bps'][i] / 1e6:.1f} Mbps"
+        ), run_id=int(summary["run_id"][i]), error=str(summary["error"][i])))
+    intervals_path = os.path.join(dut_root, INTERVALS_FILE)
+    if os.path.exists(intervals_path):
+        iv = load_columns(intervals_path)
+        for i in range(len(iv["run_id"])):
+            start = runs.get(int(iv["run_id"][i]))
+            if start is None or start != start:
+                continue
+            events.append(_event(start + float(iv["end_s"][i]), "iperf", "interval",
+                                 f"{iv['stream'][i]} {iv['bps'][i] / 1e6:.1f} Mbps", run_id=int(iv["run_id"][i]),
+                                 bps=float(iv["bps"][i]), retransmits=int(iv["retransmits"][i])))
+    return iter(sorted(events, key=lambda e: e["ts"]))
+
+
+def pcap_events(path: str):
+    """Captured bytes per second of a pcap, read from its sparse time index."""
+    from .pcap_index import load_index
+    index = load_index(path)
+    ts, off = index["ts"], index["offset"]
+    name = os.path.basename(path)
+    for i in range(len(ts)):
+        end = int(off[i + 1]) if i + 1 < len(off) else os.path.getsize(path)
+        yield _event(float(ts[i]), "pcap", "second", f"{name}: {end - int(off[i])} bytes", capture=name,
+                     bytes=end - int(off[i]))
+
+
+def firmware_events(path: str):
+    """
+    Entries of a .logarchive, streamed through `log show --style ndjson`.
+    Needs the macOS `log` tool on the controller; skipped otherwise.
+    """
+    if not shutil.which("log"):
+        logger.warning(f"'log' tool not available, skipping {path}")
+        return
+    proc = subprocess.Popen(["log", "show", "--archive", path, "--style", "ndjson"],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        for line in proc.stdout:
+            try:
+                entry = json.loads(line)
+                ts = datetime.strptime(entry["timestamp"], "%Y-%m-%d %H:%M:%S.%f%z").timestamp()
+            except (ValueError, KeyError):
+                continue
+            yield _event(ts, "firmware", entry.get("messageType", "log").lower(), entry.get("eventMessage", ""),
+                         process=entry.get("processImagePath", "").rsplit("/", 1)[-1],
+                         subsystem=entry.get("subsystem", ""))
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+# ---- merge ---------------------------------------------------------------------------
+
+def _normalized(events, offset_s: float, window_s: float = REORDER_WINDOW_S):
+    """
+    Shifts events onto the controller clock and repairs small disorder with a
+    heap holding at most window_s of events, so each source stays streamed.
+    """
+    heap = []
+    seq = 0
+    for e in events:
+        e["ts"] -= offset_s
+        heapq.heappush(heap, (e["ts"], seq, e))
+        seq += 1
+        while heap and heap[0][0] < e["ts"] - window_s:
+            yield heapq.heappop(heap)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+def sources(dut_root: str, dut: str, exec_log: str = "testExecOutput.log") -> list:
+    """Lists (name, clock domain, event iterator) for everything recorded for one DUT run."""
+    found = []
+    for path in sorted(glob.glob(os.path.join(dut_root, "**", f"*{JOURNAL_SUFFIX}*"), recursive=True)):
+        found.append((os.path.relpath(path, dut_root), CONTROLLER, ssh_log_events(path)))
+    if exec_log and os.path.exists(exec_log):
+        found.append((os.path.basename(exec_log), CONTROLLER, exec_log_events(exec_log, dut)))
+    phases = os.path.join(dut_root, "phases.jsonl")
+    if os.path.exists(phases):
+        found.append(("phases.jsonl", CONTROLLER, phase_events(phases)))
+    for path in glob.glob(os.path.join(dut_root, "**", "wlan_status.txt"), recursive=True):
+        found.append((os.path.relpath(path, dut_root), DUT, wlan_status_events(path)))
+    found.append(("iperf", CONTROLLER, iperf_events(dut_root)))
+    for sub, domain in (("tcpdump", DUT), ("sniffer", SNIFFER)):
+        for path in sorted(glob.glob(os.path.join(dut_root, sub, "*.pcap*"))):
+            if not path.endswith(".npz"):
+                found.append((os.path.relpath(path, dut_root), domain, pcap_events(path)))
+    # Firmware logarchives pulled into common/ (sysdiag snapshots overlap them and are left out)
+    for path in sorted(glob.glob(os.path.join(dut_root, "common", "*.logarchive"))):
+        found.append((os.path.relpath(path, dut_root), DUT, firmware_events(path)))
+    return found
+
+
+def merged_events(dut_root: str, dut: str, exec_log: str = "testExecOutput.log", offsets: dict = None):
+    """
+    One time-ordered event stream for a DUT run, merged k-way with a heap
+    across all sources. Only one pending event per source (plus each source's
+    small reorder window) is held in memory, however large the logs are.
+    """
+    offsets = offsets if offsets is not None else load_clock_offsets(dut_root)
+    flush_all()
+    streams = []
+    for name, domain, events in sources(dut_root, dut, exec_log):
+        offset = offsets.get(domain, 0.0)
+        streams.append(_normalized(({**e, "file": name, "clock": domain} for e in events), offset))
+    return heapq.merge(*streams, key=lambda e: e["ts"])
+
+
+def query(events, since: float = None, until: float = None, sources=None, kinds=None, contains: str = None,
+          pattern: str = None):
+    """Filters an event stream by time range, source, kind and message text or regex."""
+    regex = re.compile(pattern) if pattern else None
+    for e in events:
+        if since is not None and e["ts"] < since:
+            continue
+        if until is not None and e["ts"] > until:
+            break
+        if sources and e["source"] not in sources:
+            continue
+        if kinds and e["kind"] not in kinds:
+            continue
+        if contains and contains not in e["msg"]:
+            continue
+        if regex and not regex.search(e["msg"]):
+            continue
+        yield e
+
+
+def phase_window(dut_root: str, name: str, margin_s: float = 2.0, **match):
+    """(since, until) of the first recorded phase called name matching attrs, padded by margin_s."""
+    from .phase_markers import load_phases
+    for p in load_phases(os.path.join(dut_root, "phases.jsonl")):
+        if p["name"] == name and all(p.get(k) == v for k, v in match.items()):
+            return p["start_ts"] - margin_s, p["end_ts"] + margin_s
+    return None, None
+
+
+def write_timeline(dut_root: str, dut: str, exec_log: str = "testExecOutput.log", path: str = None) -> int:
+    """Streams the merged timeline to dut_root/timeline.jsonl; returns the event count."""
+    path = path or os.path.join(dut_root, TIMELINE_FILE)
+    count = 0
+    with open(path, "w") as f:
+        for e in merged_events(dut_root, dut, exec_log):
+            f.write(json.dumps(e, default=str) + "\n")
+            count += 1
+    return count
@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+logger = logging.getLogger("utils.tracing")
+
+TRACE_FILE = "trace.json"
+SUMMARY_FILE = "trace_summary.json"
+
+_enabled = False
+_spans = []          # (name, cat, dut, tid, start_ns, dur_ns, args); list.append is thread-safe
+_threads = {}        # tid -> thread name
+_tracks = {}         # synthetic track name -> negative tid, for add_span()
+_context = threading.local()
+_origin_ns = time.perf_counter_ns()
+_origin_wall = time.time()
+_NOOP = nullcontext()
+
+
+def enable(on: bool = True):
+    """Turns span recording on (spans are no-ops until then) and starts a fresh trace."""
+    global _enabled, _origin_ns, _origin_wall
+    _enabled = on
+    if on:
+        _spans.clear()
+        _origin_ns = time.perf_counter_ns()
+        _origin_wall = time.time()
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def bind_dut(dut: str):
+    """Attributes spans opened by the calling thread to dut (None to unbind)."""
+    _context.dut = dut
+
+
+class _Span:
+    __slots__ = ("name", "cat", "dut", "args", "start")
+
+    def __init__(self, name, cat, dut, args):
+        self.name = name
+        self.cat = cat
+        self.dut = dut
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        tid = threading.get_ident()
+        if tid not in _threads:
+            _threads[tid] = threading.current_thread().name
+        if exc_type is not None:
+            self.args = dict(self.args or {}, error=exc_type.__name__)
+        _spans.append((self.name, self.cat, self.dut, tid, self.start - _origin_ns, end - self.start, self.args))
+        return False
+
+
+def span(name: str, cat: str = "step", dut: str = None, **args):
+    """
+    Context manager timing one step. The DUT defaults to the one bound to
+    the thread (or the host arg of remote commands). Costs one attribute
+    check while tracing is off.
+    """
+    if not _enabled:
+        return _NOOP
+    dut = dut or getattr(_context, "dut", None) or args.get("host")
+    return _Span(name, cat, dut, args or None)
+
+
+def add_span(name: str, cat: str, dut: str, start_epoch_s: float, seconds: float, track: str = None, **args):
+    """Records work timed elsewhere (e.g. an archive built in a worker process) on its own track."""
+    if not _enabled:
+        return
+    track = track or cat
+    tid = _tracks.setdefault(track, -1 - len(_tracks))
+    _threads[tid] = track
+    start_ns = int((start_epoch_s - _origin_wall) * 1e9)
+    _spans.append((name, cat, dut, tid, start_ns, int(seconds * 1e9), args or None))
+
+
+class _TracedBarrier:
+    """Barrier proxy recording each wait, i.e. how long this DUT waited for the rest of its group."""
+
+    def __init__(self, barrier):
+        self._barrier = barrier
+        self._waits = 0
+
+    def wait(self, timeout=None):
+        self._waits += 1
+        with span("barrier_wait", "barrier", n=self._waits):
+            return self._barrier.wait(timeout)
+
+    def __getattr__(self, name):
+        return getattr(self._barrier, name)
+
+
+def traced_barrier(barrier):
+    return _TracedBarrier(barrier) if _enabled else barrier
+
+
+def export_chrome(path: str) -> str:
+    """
+    Writes the recorded spans as Chrome trace JSON (load in chrome://tracing
+    or ui.perfetto.dev). Each DUT is shown as a process with one track per
+    thread, so a DUT's ssh calls, collectors and test steps line up.
+    """
+    spans = list(_spans)
+    pids = {}
+    tracks = set()
+    events = []
+    for name, cat, dut, tid, start_ns, dur_ns, args in spans:
+        pid = pids.setdefault(dut, len(pids))
+        tracks.add((pid, tid))
+        ev = {"name": name, "cat": cat, "ph": "X", "ts": start_ns / 1000, "dur": dur_ns / 1000, "pid": pid, "tid": tid}
+        if args:
+            ev["args"] = args
+        events.append(ev)
+    for dut, pid in pids.items():
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": dut or "controller"}})
+    for pid, tid in tracks:
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                       "args": {"name": _threads.get(tid, str(tid))}})
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                   "otherData": {"start_epoch_s": _origin_wall}}, f, default=str)
+    return path
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summary() -> dict:
+    """
+    Per-step duration percentiles over the run, each DUT's total time per
+    step (nested steps overlap their parents, e.g. ssh inside a test step)
+    and each DUT's barrier waits, longest first.
+    """
+    by_step = {}
+    by_dut = {}
+    barriers = {}
+    for name, cat, dut, _, _, dur_ns, _ in list(_spans):
+        dur = dur_ns / 1e9
+        by_step.setdefault(f"{cat}:{name}", []).append(dur)
+        per_dut = by_dut.setdefault(dut or "controller", {})
+        per_dut[f"{cat}:{name}"] = per_dut.get(f"{cat}:{name}", 0.0) + dur
+        if cat == "barrier":
+            b = barriers.setdefault(dut or "controller", {"waits": 0, "total_s": 0.0, "max_s": 0.0})
+            b["waits"] += 1
+            b["total_s"] += dur
+            b["max_s"] = max(b["max_s"], dur)
+    steps = {}
+    for key, durations in sorted(by_step.items()):
+        durations.sort()
+        steps[key] = {
+            "count": len(durations),
+            "total_s": round(sum(durations), 4),
+            "p50_s": round(_percentile(durations, 0.50), 4),
+            "p90_s": round(_percentile(durations, 0.90), 4),
+            "p99_s": round(_percentile(durations, 0.99), 4),
+            "max_s": round(durations[-1], 4),
+        }
+    return {
+        "steps": steps,
+        "duts": {d: {k: round(v, 3) for k, v in sorted(t.items(), key=lambda kv: -kv[1])} for d, t in by_dut.items()},
+        "barrier_wait": dict(sorted(
+            ((d, {k: round(v, 3) if isinstance(v, float) else v for k, v in b.items()}) for d, b in barriers.items()),
+            key=lambda kv: -kv[1]["total_s"]
+        )),
+    }
+
+
+def write_reports(output_dir: str) -> dict:
+    """Exports trace.json and trace_summary.json to output_dir and logs the slowest steps."""
+    os.makedirs(output_dir, exist_ok=True)
+    export_chrome(os.path.join(output_dir, TRACE_FILE))
+    report = summary()
+    with open(os.path.join(output_dir, SUMMARY_FILE), "w") as f:
+        json.dump(report, f, indent=2)
+    slowest = sorted(report["steps"].items(), key=lambda kv: -kv[1]["total_s"])[:10]
+    for key, s in slowest:
+        logger.info(f"Trace {key}: {s['count']}x, total {s['total_s']:.1f}s, p50 {s['p50_s']:.2f}s, "
+                    f"p99 {s['p99_s']:.2f}s, max {s['max_s']:.2f}s")
+    for dut, b in list(report["barrier_wait"].items())[:5]:
+        logger.info(f"Trace barrier wait [{dut}]: {b['total_s']:.1f}s over {b['waits']} wait(s), max {b['max_s']:.1f}s")
+    logger.info(f"Trace written to {output_dir}/{TRACE_FILE} ({len(_spans)} spans)")
+    return report
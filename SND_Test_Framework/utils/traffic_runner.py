@@ -0,0 +1,101 @@
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+
+from .common_utils import start_iperf_client
+from .phase_markers import get_recorder
+
+logger = logging.getLogger("utils.traffic_runner")
+
+
+def _timed_client(*args, **kwargs) -> tuple:
+    """start_iperf_client() plus the controller time the client was launched."""
+    started = time.time()
+    return (started, *start_iperf_client(*args, **kwargs))
+
+
+@dataclass
+class Flow:
+    client: str          # host running the iperf3 client
+    server: str          # address the client connects to
+    port: int
+    remote: str          # the non-DUT end, used to tag results
+    bidir: bool = False
+
+
+def server_leases(dut: str, remote_list: list, direction: str, port: int) -> list:
+    """
+    iperf3 server ports a DUT's flows listen on, as "iperf:<host>:<port>":
+    the remotes' port for DL/BIDIR, one DUT-side port per remote for UL.
+    """
+    if str(direction).strip().upper() == "UL":
+        return [f"iperf:{dut}:{port + i}" for i in range(len(remote_list))]
+    return [f"iperf:{remote}:{port}" for remote in remote_list]
+
+
+def run_flows(
+    dut: str,
+    flows: list,
+    user: str,
+    duration: int,
+    log_dir: str = None,
+    results=None,
+    direction: str = "",
+    attn_db=None,
+    udp: bool = False,
+    bandwidth=None,
+    parallel: int = 1,
+    ring=None,
+    stall_s: int = 0
+) -> list:
+    """
+    Starts every iperf3 client for a DUT at once and waits for all of them,
+    so N remotes give one aggregate `duration` second load instead of N
+    back-to-back runs. Each flow's output is recorded in results (an
+    IperfResultStore) if given, and the store is saved once all have finished;
+    with a ring (streaming), intervals go into the store as they arrive.
+    Returns [(flow, rc, IperfSummary or None)] in flow order.
+    """
+    if not flows:
+        return []
+
+    marker = get_recorder(dut).phase(
+        "iperf", direction=direction, attn_db=attn_db, flows=len(flows), protocol="udp" if udp else "tcp"
+    )
+    run_ids = [results.new_run() if results else None for _ in flows]
+    with marker, ThreadPoolExecutor(max_workers=len(flows), thread_name_prefix=f"iperf-{dut}") as pool:
+        futures = [
+            pool.submit(
+                _timed_client, f.client, user, f.server, f.port, duration, log_dir,
+                udp=udp, bidir=f.bidir, bandwidth=bandwidth, parallel=parallel,
+                ring=ring, stall_s=stall_s, flow_id=i,
+                on_interval=partial(results.add_interval, run_id, remote=f.remote, direction=direction,
+                                    attn_db=attn_db) if results else None
+            )
+            for i, (f, run_id) in enumerate(zip(flows, run_ids))
+        ]
+        outcomes = [fut.result() for fut in futures]
+
+    report = []
+    total_sent = total_received = 0.0
+    for f, run_id, (started, rc, out, err) in zip(flows, run_ids, outcomes):
+        summary = results.add_run(
+            out, f.remote, direction, attn_db=attn_db, start_ts=started, run_id=run_id
+        ) if results else None
+        if rc != 0:
+            logger.error(f"[{dut}] iperf3 flow {f.client} -> {f.server}:{f.port} exited {rc}: {err}")
+        if summary and not summary.error:
+            total_sent += 0.0 if math.isnan(summary.sent_bps) else summary.sent_bps
+            total_received += 0.0 if math.isnan(summary.received_bps) else summary.received_bps
+        report.append((f, rc, summary))
+
+    if results:
+        results.save()
+        logger.info(
+            f"[{dut}] {len(flows)} concurrent {direction} flow(s): aggregate sent "
+            f"{total_sent / 1e6:.1f} Mbps, received {total_received / 1e6:.1f} Mbps"
+        )
+    return report
@@ -1,23 +1,24 @@
 
-import subprocess
 import logging
-from .common_utils import ssh_execute, get_timestamp
+from .common_utils import ssh_execute, scp_pull, get_timestamp
 
 logger = logging.getLogger("utils.wlan_firmware_utils")
 
-def clean_firmware_logs(dut, user):
-    logger.info(f"Cleaning Atlas logs on {dut}")
+def clean_firmware_logs(dut, user, batch=None):
     cmd = "rm -rf /var/internal/Logs/Atlas/*"
-    return ssh_execute(dut, user, cmd, local_log_dir="logs")
+    if batch is not None:
+        batch.add("clean_firmware_logs", cmd)
+        return
+    logger.info(f"Cleaning Atlas logs on {dut}")
+    return ssh_execute(dut, user, cmd)
 
 def start_firmware_log(dut, user):
     logger.info(f"Starting Atlas logging on {dut}")
     cmd = "log collect --start --output /var/internal/Logs/Atlas/test_log_start.logarchive"
-    return ssh_execute(dut, user, cmd, local_log_dir="logs")
+    return ssh_execute(dut, user, cmd)
 
 def stop_and_pull_firmware_log(dut, user, local_log_dir):
     logger.info(f"Stopping and fetching Atlas logs from {dut}")
     stop_cmd = "log collect --stop --output /var/internal/Logs/Atlas/test_log_stop.logarchive"
     ssh_execute(dut, user, stop_cmd, local_log_dir)
-    scp_cmd = f"scp {user}@{dut}:/var/internal/Logs/Atlas/*.logarchive {local_log_dir}/"
-    subprocess.call(scp_cmd, shell=True)
+    scp_pull(dut, user, "/var/internal/Logs/Atlas/*.logarchive", f"{local_log_dir}/")
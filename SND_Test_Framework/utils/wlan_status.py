@@ -0,0 +1,301 @@
+import json
+import logging
+import math
+import subprocess
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .common_utils import command_slot
+from .ssh_session import get_pool
+
+logger = logging.getLogger("utils.wlan_status")
+
+TS_MARKER = "@@TS"
+DEFAULT_MAX_SAMPLES = 100000
+DEFAULT_PERIOD_S = 0.92
+
+# Averaged when samples are downsampled
+NUMERIC = ("rssi", "noise", "tx_rate", "max_rate")
+# Last value kept when samples are downsampled
+CATEGORICAL = ("channel", "bandwidth", "mcs", "nss", "bssid")
+COLUMNS = ("ts",) + NUMERIC + CATEGORICAL
+
+_FIELDS = {
+    "agrCtlRSSI": "rssi", "agrCtlNoise": "noise", "lastTxRate": "tx_rate",
+    "maxRate": "max_rate", "MCS": "mcs", "NSS": "nss",
+}
+
+
+def _bssid_to_int(text: str) -> float:
+    parts = text.strip().split(":")
+    if len(parts) != 6:
+        return math.nan
+    try:
+        return float(int("".join(p.zfill(2) for p in parts), 16))
+    except ValueError:
+        return math.nan
+
+
+def bssid_str(value: float) -> str:
+    if math.isnan(value):
+        return ""
+    v = int(value)
+    return ":".join(f"{(v >> s) & 0xFF:02x}" for s in range(40, -1, -8))
+
+
+def parse_block(lines: list, ts: float) -> dict:
+    """Parses one `airport -I` block into a typed sample (missing fields are NaN)."""
+    sample = {c: math.nan for c in COLUMNS}
+    sample["ts"] = ts
+    for line in lines:
+        key, sep, value = line.partition(":")
+        if not sep:
+            continue
+        key, value = key.strip(), value.strip()
+        if key in _FIELDS:
+            try:
+                sample[_FIELDS[key]] = float(value)
+            except ValueError:
+                pass
+        elif key == "BSSID":
+            sample["bssid"] = _bssid_to_int(value)
+        elif key == "channel":
+            ch, _, width = value.partition(",")
+            try:
+                sample["channel"] = float(ch)
+                sample["bandwidth"] = float(width) if width else 20.0
+            except ValueError:
+                pass
+    return sample
+
+
+class WlanStatusStore:
+    """
+    Array-backed columns of wlan_status samples.
+
+    Memory is bounded by max_samples: when the store fills up, neighbouring
+    samples are merged pairwise (numeric columns averaged, categorical ones
+    keep the later value) and new samples are merged `stride` at a time from
+    then on, so a multi-hour run keeps full coverage at a coarser resolution.
+    """
+
+    def __init__(self, max_samples: int = DEFAULT_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.cols = {c: array("d") for c in COLUMNS}
+        self.stride = 1
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.cols["ts"])
+
+    @staticmethod
+    def _merge(samples: list) -> dict:
+        merged = {c: samples[-1][c] for c in ("ts",) + CATEGORICAL}
+        for c in NUMERIC:
+            values = [s[c] for s in samples if not math.isnan(s[c])]
+            merged[c] = sum(values) / len(values) if values else math.nan
+        return merged
+
+    def _compact(self):
+        for c, col in self.cols.items():
+            if c in NUMERIC:
+                merged = [
+                    (col[i] + col[i + 1]) / 2 if not (math.isnan(col[i]) or math.isnan(col[i + 1]))
+                    else (col[i + 1] if math.isnan(col[i]) else col[i])
+                    for i in range(0, len(col) - 1, 2)
+                ]
+            else:
+                merged = [col[i + 1] for i in range(0, len(col) - 1, 2)]
+            if len(col) % 2:
+                merged.append(col[-1])
+            self.cols[c] = array("d", merged)
+        self.stride *= 2
+
+    def append(self, sample: dict):
+        with self._lock:
+            self._pending.append(sample)
+            if len(self._pending) < self.stride:
+                return
+            row = self._merge(self._pending) if self.stride > 1 else sample
+            self._pending = []
+            for c in COLUMNS:
+                self.cols[c].append(row[c])
+            if len(self) >= self.max_samples:
+                self._compact()
+
+    def window(self, start_ts: float, end_ts: float) -> dict:
+        """Returns {column: list} for samples with start_ts <= ts <= end_ts."""
+        with self._lock:
+            ts = self.cols["ts"]
+            lo, hi = bisect_left(ts, start_ts), bisect_right(ts, end_ts)
+            return {c: list(self.cols[c][lo:hi]) for c in COLUMNS}
+
+    def window_stats(self, start_ts: float, end_ts: float) -> dict:
+        """RSSI/noise/rate summary for one time window (e.g. an RvR step or idle hold)."""
+        w = self.window(start_ts, end_ts)
+        stats = {"samples": len(w["ts"])}
+        for c in ("rssi", "noise", "tx_rate"):
+            values = sorted(v for v in w[c] if not math.isnan(v))
+            stats[f"{c}_mean"] = sum(values) / len(values) if values else math.nan
+            stats[f"{c}_median"] = values[len(values) // 2] if values else math.nan
+            stats[f"{c}_min"] = values[0] if values else math.nan
+            stats[f"{c}_max"] = values[-1] if values else math.nan
+        mcs = [v for v in w["mcs"] if not math.isnan(v)]
+        stats["mcs_mode"] = max(set(mcs), key=mcs.count) if mcs else math.nan
+        bssids = {bssid_str(v) for v in w["bssid"] if not math.isnan(v)}
+        stats["bssids"] = sorted(bssids)
+        return stats
+
+    def save(self, path: str):
+        """Writes the columns as a compressed .npz (bssid kept as a 48-bit integer)."""
+        import numpy as np
+        with self._lock:
+            np.savez_compressed(path, stride=self.stride, **{c: np.frombuffer(col, dtype=np.float64)
+                                                              for c, col in self.cols.items()})
+        return path
+
+
+class StatusParser:
+    """
+    Incremental parser for the wlan_status.txt stream. Text can be fed in
+    arbitrary chunks; complete blocks are parsed and pushed into the store
+    and only the unfinished tail is kept. Blocks are timestamped by the
+    "@@TS <epoch>" line the collection loop writes before each `airport -I`
+    run; blocks without one are placed period_s after the previous block.
+    """
+
+    def __init__(self, store: WlanStatusStore, period_s: float = DEFAULT_PERIOD_S, start_ts: float = None):
+        self.store = store
+        self.period_s = period_s
+        self._tail = ""
+        self._block = []
+        self._block_ts = None
+        self._last_ts = start_ts
+        self.samples = 0
+
+    def _emit(self):
+        if any(":" in line for line in self._block):
+            ts = self._block_ts
+            if ts is None:
+                ts = time.time() if self._last_ts is None else self._last_ts + self.period_s
+            self.store.append(parse_block(self._block, ts))
+            self._last_ts = ts
+            self.samples += 1
+        self._block = []
+        self._block_ts = None
+
+    def feed(self, text: str):
+        lines = (self._tail + text).split("\n")
+        self._tail = lines.pop()
+        for line in lines:
+            if line.startswith(TS_MARKER):
+                if self._block:
+                    self._emit()
+                try:
+                    self._block_ts = float(line.split()[1])
+                except (IndexError, ValueError):
+                    self._block_ts = None
+            elif not line.strip():
+                self._emit()
+            else:
+                self._block.append(line)
+
+    def close(self):
+        if self._tail:
+            self._block.append(self._tail)
+            self._tail = ""
+        self._emit()
+
+
+def parse_file(path: str, store: WlanStatusStore = None, chunk_size: int = 1 << 20) -> WlanStatusStore:
+    """Parses a local wlan_status.txt chunk by chunk, never holding the whole file in memory."""
+    store = store if store is not None else WlanStatusStore()
+    parser = StatusParser(store)
+    with open(path, errors="replace") as f:
+        for chunk in iter(lambda: f.read(chunk_size), ""):
+            parser.feed(chunk)
+    parser.close()
+    return store
+
+
+class WlanStatusFollower:
+    """
+    Follows the remote wlan_status.txt while the collection loop runs: every
+    poll_s it fetches only the bytes added since the last poll, appends them
+    to the local copy and feeds them to the parser.
+    """
+
+    def __init__(self, dut: str, user: str, remote_path: str, local_path: str,
+                 store: WlanStatusStore = None, poll_s: float = 10):
+        self.dut = dut
+        self.user = user
+        self.remote_path = remote_path
+        self.local_path = local_path
+        self.store = store if store is not None else WlanStatusStore()
+        self.parser = StatusParser(self.store)
+        self.poll_s = poll_s
+        self.offset = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self) -> int:
+        """Fetches and parses the new part of the remote file; returns the bytes read."""
+        pool = get_pool()
+        start = time.time()
+        with command_slot(self.dut):
+            result = subprocess.run(
+                pool.ssh_args(self.dut, self.user) + [f"tail -c +{self.offset + 1} '{self.remote_path}' 2>/dev/null"],
+                capture_output=True
+            )
+        pool.record(self.dut, time.time() - start)
+        if result.returncode == 255:
+            pool.revalidate(self.dut, self.user)
+        data = result.stdout
+        if result.returncode != 0 or not data:
+            return 0
+        with open(self.local_path, "ab") as f:
+            f.write(data)
+        self.offset += len(data)
+        self.parser.feed(data.decode(errors="replace"))
+        return len(data)
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_s):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"[{self.dut}] wlan_status poll failed: {e}", exc_info=True)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name=f"wlan-status-{self.dut}", daemon=True)
+        self._thread.start()
+        return self
+
+    def finish(self) -> WlanStatusStore:
+        """Stops polling, reads what is left and flushes the last block."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.poll()
+        self.parser.close()
+        logger.info(f"[{self.dut}] Parsed {self.parser.samples} wlan_status samples ({len(self.store)} stored)")
+        return self.store
+
+
+def phase_stats(store: WlanStatusStore, phases: list, output_path: str = None) -> list:
+    """
+    Summarizes the store over each recorded phase (see phase_markers), e.g.
+    RSSI and rate per RvR attenuation step. Optionally writes them as JSON.
+    """
+    rows = []
+    for phase in phases:
+        row = {k: v for k, v in phase.items()}
+        row.update(store.window_stats(phase["start_ts"], phase["end_ts"]))
+        rows.append(row)
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(rows, f, indent=2, default=str)
+    return rows
@@ -1,35 +1,95 @@
 import logging
+import shlex
 import subprocess
 import time
 
-from .common_utils import ssh_execute, get_timestamp
+from .common_utils import ssh_execute, scp_pull, get_timestamp, shell_wait, command_slot
+from .ssh_session import get_pool
 
 logger = logging.getLogger("utils.wlan_utils")
 
-def wifi_off(dut: str, user: str = "root", for_debug: bool = False):
+AIRPORT = "/System/Library/PrivateFrameworks/Apple80211.framework/Versions/Current/Resources/airport"
+
+def power_check_cmd(on: bool = True) -> str:
+    """Shell test that succeeds when the Wi-Fi power state matches `on`."""
+    check = f'{AIRPORT} -I | grep -q "AirPort: Off"'
+    return f"! {check}" if on else check
+
+def ssid_check_cmd(ssid: str = "") -> str:
+    """Shell test that succeeds when associated to ssid, or when not associated at all if ssid is empty."""
+    if ssid:
+        # Fixed-string, whole-line match on the trimmed value: SSIDs may hold spaces, quotes or regex characters
+        return f"{AIRPORT} -I | sed -n 's/^ *SSID: //p' | grep -Fxq -- {shlex.quote(ssid)}"
+    return f'! {AIRPORT} -I | grep -Eq "^ *SSID: ."'
+
+def cond_wifi_power(dut: str, user: str = "root", on: bool = True):
+    """Condition for wait_until: Wi-Fi power on the DUT matches `on`."""
+    return lambda: ssh_execute(dut, user, power_check_cmd(on))[0] == 0
+
+def cond_associated(dut: str, user: str = "root", ssid: str = ""):
+    """Condition for wait_until: the DUT is associated to ssid (or to nothing, if ssid is empty)."""
+    return lambda: ssh_execute(dut, user, ssid_check_cmd(ssid))[0] == 0
+
+def wifi_off(dut: str, user: str = "root", for_debug: bool = False, batch=None):
     """
-    Turns Wi-Fi off on the DUT.
+    Turns Wi-Fi off on the DUT and returns once the radio reports off.
+    If a RemoteBatch is given, the step is queued on it instead of run.
     """
+    cmd = f"mobilewifitool manager power 0 && {shell_wait(power_check_cmd(False))}"
+    if batch is not None:
+        batch.add("wifi_off", cmd)
+        return
     logger.info(f"[{dut}] Turning Wi-Fi OFF")
-    cmd = "mobilewifitool manager power 0"
     rc, out, err = ssh_execute(dut, user, cmd)
     if rc != 0:
         logger.error(f"[{dut}] Wi-Fi OFF failed: {err}")
     else:
         logger.info(f"[{dut}] Wi-Fi is now OFF")
 
-def wifi_on(dut: str, user: str = "root", for_debug: bool = False):
+def wifi_on(dut: str, user: str = "root", for_debug: bool = False, batch=None):
     """
-    Turns Wi-Fi on on the DUT.
+    Turns Wi-Fi on on the DUT and returns once the radio reports on.
+    If a RemoteBatch is given, the step is queued on it instead of run.
     """
+    cmd = f"mobilewifitool manager power 1 && {shell_wait(power_check_cmd(True))}"
+    if batch is not None:
+        batch.add("wifi_on", cmd)
+        return
     logger.info(f"[{dut}] Turning Wi-Fi ON")
-    cmd = "mobilewifitool manager power 1"
     rc, out, err = ssh_execute(dut, user, cmd)
     if rc != 0:
         logger.error(f"[{dut}] Wi-Fi ON failed: {err}")
     else:
         logger.info(f"[{dut}] Wi-Fi is now ON")
 
+def clear_saved_networks(dut: str, user: str = "root", for_debug: bool = False, batch=None):
+    """
+    Removes every saved network profile from the DUT.
+    If a RemoteBatch is given, the step is queued on it instead of run.
+    """
+    cmd = "wifiutil remove_all_known_networks"
+    if batch is not None:
+        batch.add("clear_saved_networks", cmd)
+        return
+    if for_debug:
+        print(f"[DEBUG] clear_saved_networks cmd on {dut}: {cmd}")
+    return ssh_execute(dut, user, cmd)
+
+
+def cleanup_scan_cache(dut: str, user: str = "root", for_debug: bool = False, batch=None):
+    """
+    Flushes the DUT's cached scan results so the next scan starts clean.
+    If a RemoteBatch is given, the step is queued on it instead of run.
+    """
+    cmd = "wifiutil clear_scan_cache"
+    if batch is not None:
+        batch.add("cleanup_scan_cache", cmd)
+        return
+    if for_debug:
+        print(f"[DEBUG] cleanup_scan_cache cmd on {dut}: {cmd}")
+    return ssh_execute(dut, user, cmd)
+
+
 def suppress_scan(dut: str, user: str = "root", for_debug: bool = False):
     """
     Tells the DUT to suppress any active scans:
@@ -38,57 +98,60 @@ def suppress_scan(dut: str, user: str = "root", for_debug: bool = False):
     cmd = "apple80211 -dbg=scansuppress=1"
     if for_debug:
         print(f"[DEBUG] suppress_scan cmd on {dut}: {cmd}")
-    return ssh_execute(dut, user, cmd, local_log_dir="logs")
+    return ssh_execute(dut, user, cmd)
 
 
 def initiate_scan(dut: str, user: str = "root", for_debug: bool = False):
     """
     Instructs the DUT to perform an on-demand Wi-Fi scan via `wifiutil`.
-    Sleeps 1 second afterward to let results populate.
+    Returns when `wifiutil scan` completes.
     """
-    cmd = "wifiutil scan; sleep 1"
+    cmd = "wifiutil scan"
     if for_debug:
         print(f"[DEBUG] initiate_scan cmd on {dut}: {cmd}")
-    return ssh_execute(dut, user, cmd, local_log_dir="logs")
+    return ssh_execute(dut, user, cmd)
 
 
 def initiate_connect(
     dut: str,
-    user: str = "root",
+    user: str,
     dut_wifi_interface: str,
     ap_wifi_ssid: str = "",
     ap_wifi_pwd: str = "",
-    for_debug: bool = False
+    for_debug: bool = False,
+    wait_s: float = 15
 ):
     """
     Uses 'mobilewifitool -- join' on macOS to connect the DUT to the specified SSID.
     If ap_wifi_pwd == "", it does an open join; otherwise, it passes the password.
-    Sleeps 1 second after attempting to join.
+    Returns once the DUT reports the SSID, or non-zero after wait_s seconds.
     """
     if ap_wifi_pwd.strip() == "":
-        cmd = f"mobilewifitool -- join -i {dut_wifi_interface} --ssid {ap_wifi_ssid}; sleep 1"
+        cmd = f"mobilewifitool -- join -i {dut_wifi_interface} --ssid {ap_wifi_ssid}"
     else:
         cmd = (
             f"mobilewifitool -- join -i {dut_wifi_interface} "
-            f"--ssid {ap_wifi_ssid} --password {ap_wifi_pwd}; sleep 1"
+            f"--ssid {ap_wifi_ssid} --password {ap_wifi_pwd}"
         )
+    cmd += f" && {shell_wait(ssid_check_cmd(ap_wifi_ssid), wait_s)}"
     if for_debug:
         print(f"[DEBUG] initiate_connect cmd on {dut}: {cmd}")
-    return ssh_execute(dut, user, cmd, local_log_dir="logs")
+    return ssh_execute(dut, user, cmd)
 
 
 def initiate_assoc_connect(
     dut: str,
-    user: str = "root",
+    user: str,
     ap_wifi_ssid: str,
     ap_wifi_sec: str,
     ap_wifi_pwd: str = "",
-    for_debug: bool = False
+    for_debug: bool = False,
+    wait_s: float = 15
 ):
     """
     Uses 'wifiutil assoc' on macOS to connect the DUT to the specified SSID,
     supporting both open/OWE and secured (WPA2/WPA3) networks.
-    Sleeps 5 seconds afterward to allow association to complete.
+    Returns once the DUT reports the SSID, or non-zero after wait_s seconds.
     """
     if ap_wifi_sec.lower() in ("open", "owe", "owe-transition"):
         cmd = f"wifiutil assoc -ssid {ap_wifi_ssid} -remember"
@@ -97,20 +160,21 @@ def initiate_assoc_connect(
             f"wifiutil assoc -ssid {ap_wifi_ssid} "
             f"-security {ap_wifi_sec} -password {ap_wifi_pwd} -remember"
         )
+    cmd += f" && {shell_wait(ssid_check_cmd(ap_wifi_ssid), wait_s)}"
     if for_debug:
         print(f"[DEBUG] initiate_assoc_connect cmd on {dut}: {cmd}")
-    return ssh_execute(dut, user, cmd, local_log_dir="logs")
+    return ssh_execute(dut, user, cmd)
 
 
 def initiate_forgetNw(dut: str, user: str = "root", for_debug: bool = False):
     """
     Uses 'wifiutil remove_all_known_networks' to clear every stored SSID
-    from the DUT’s memory. Sleeps 1 second afterward.
+    from the DUT’s memory. Returns once the DUT is no longer associated.
     """
-    cmd = "wifiutil remove_all_known_networks; sleep 1"
+    cmd = f"wifiutil remove_all_known_networks && {shell_wait(ssid_check_cmd(''), 5)}"
     if for_debug:
         print(f"[DEBUG] initiate_forgetNw cmd on {dut}: {cmd}")
-    return ssh_execute(dut, user, cmd, local_log_dir="logs")
+    return ssh_execute(dut, user, cmd)
 
 
 def scan(dut: str, user: str = "root", interface: str = "wlan0"):
@@ -118,12 +182,12 @@ def scan(dut: str, user: str = "root", interface: str = "wlan0"):
     Alternate Linux-based scan.
     """
     cmd = f"sudo iw {interface} scan > /dev/null 2>&1"
-    return ssh_execute(dut, user, cmd, local_log_dir="logs")
+    return ssh_execute(dut, user, cmd)
 
 
 def associate(
     dut: str,
-    user: str = "root",
+    user: str,
     ssid: str,
     password: str,
     interface: str = "wlan0"
@@ -132,12 +196,12 @@ def associate(
     Linux-based association via nmcli.
     """
     cmd = f"nmcli dev wifi connect '{ssid}' password '{password}' ifname {interface}"
-    return ssh_execute(dut, user, cmd, local_log_dir="logs")
+    return ssh_execute(dut, user, cmd)
 
 
 def roam_profile(
     dut: str,
-    user: str = "root",
+    user: str,
     ssid_from: str,
     pwd_from: str,
     ssid_to: str,
@@ -147,10 +211,10 @@ def roam_profile(
     """
     Example roaming logic: disassociate then associate.
     """
-    ssh_execute(dut, user, f"nmcli con down id '{ssid_from}'", local_log_dir="logs")
+    ssh_execute(dut, user, f"nmcli con down id '{ssid_from}'")
     time.sleep(1)
     cmd = f"nmcli dev wifi connect '{ssid_to}' password '{pwd_to}' ifname {interface}"
-    return ssh_execute(dut, user, cmd, local_log_dir="logs")
+    return ssh_execute(dut, user, cmd)
 
 
 def get_country_code(dut: str, user: str = "root", interface: str = "wlan0") -> str:
@@ -158,7 +222,7 @@ def get_country_code(dut: str, user: str = "root", interface: str = "wlan0") ->
     Returns current regulatory domain.
     """
     cmd = "iw reg get | grep country | awk '{print $2}'"
-    rc, out, err = ssh_execute(dut, user, cmd, local_log_dir="logs")
+    rc, out, err = ssh_execute(dut, user, cmd)
     if rc == 0:
         return out.strip()
     else:
@@ -171,7 +235,7 @@ def get_mlo_status(dut: str, user: str = "root", interface: str = "wlan0") -> st
     Returns MLO-related status via apple80211.
     """
     cmd = "apple80211 -cca -ssid -rssi --noise -channel -bssid -dbg='mlo_status'"
-    rc, out, err = ssh_execute(dut, user, cmd, local_log_dir="logs")
+    rc, out, err = ssh_execute(dut, user, cmd)
     if rc == 0:
         return out.strip()
     else:
@@ -181,13 +245,15 @@ def get_mlo_status(dut: str, user: str = "root", interface: str = "wlan0") -> st
 
 def start_wlan_status_loop(
     dut: str,
-    user: str = "root",
+    user: str,
     iteration_log_path: str,
     duration_s: int = 30,
     for_debug: bool = False
 ) -> int:
     """
     Starts a background SSH loop on the DUT that collects wlan_status and returns the remote PID.
+    Each `airport -I` block is preceded by an "@@TS <epoch>" line so the
+    samples can be timestamped by utils.wlan_status.
     """
 
     loop_count = duration_s + 2
@@ -195,19 +261,20 @@ def start_wlan_status_loop(
     # This is the full remote shell command to run via SSH
     remote_cmd = (
         f'for i in {{0..{loop_count}}}; '
-        f'do /System/Library/PrivateFrameworks/Apple80211.framework/Versions/Current/Resources/airport '
+        f'do echo "@@TS $(date +%s)"; /System/Library/PrivateFrameworks/Apple80211.framework/Versions/Current/Resources/airport '
         f'-I; echo; sleep 0.92; done > {iteration_log_path}/wlan_status.txt & echo $!'
     )
 
-    # Construct SSH command
-    ssh_cmd = f"ssh {user}@{dut} '{remote_cmd}'"
+    # Construct SSH command over the pooled session
+    ssh_cmd = get_pool().ssh_args(dut, user) + [remote_cmd]
 
     if for_debug:
-        print(f"[DEBUG] start_wlan_status_loop on {dut}: {ssh_cmd}")
+        print(f"[DEBUG] start_wlan_status_loop on {dut}: {remote_cmd}")
 
     try:
-        proc = subprocess.Popen(ssh_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, universal_newlines=True)
-        out, err = proc.communicate(timeout=10)
+        with command_slot(dut):
+            proc = subprocess.Popen(ssh_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+            out, err = proc.communicate(timeout=10)
 
         if proc.returncode == 0:
             pid = int(out.strip().splitlines()[-1])
@@ -221,19 +288,19 @@ def start_wlan_status_loop(
         return 0
 
 
-def stop_wlan_status_loop(dut: str, user: str = "root", pid: int):
+def stop_wlan_status_loop(dut: str, user: str, pid: int):
     """
     Stops background wlan_status loop.
     """
     if not pid:
         return
     cmd = f"kill {pid}"
-    ssh_execute(dut, user, cmd, local_log_dir="logs")
+    ssh_execute(dut, user, cmd)
 
 
 def start_background_command(
     dut: str,
-    user: str = "root",
+    user: str,
     cmd: str,
     remote_output_path: str,
     for_debug: bool = False
@@ -242,11 +309,12 @@ def start_background_command(
     Launches any command in background on DUT.
     """
     bg_cmd = f"{cmd} > {remote_output_path} 2>&1 & echo $!"
-    ssh_cmd = f"ssh {user}@{dut} '{bg_cmd}'"
+    ssh_cmd = get_pool().ssh_args(dut, user) + [bg_cmd]
     if for_debug:
-        print(f"[DEBUG] start_background_command on {dut}: {ssh_cmd}")
-    proc = subprocess.Popen(ssh_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, universal_newlines=True)
-    out, err = proc.communicate(timeout=10)
+        print(f"[DEBUG] start_background_command on {dut}: {bg_cmd}")
+    with command_slot(dut):
+        proc = subprocess.Popen(ssh_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        out, err = proc.communicate(timeout=10)
     if proc.returncode == 0:
         pid = int(out.strip().splitlines()[-1])
         return pid
@@ -257,7 +325,7 @@ def start_background_command(
 
 def fetch_background_output(
     dut: str,
-    user: str = "root",
+    user: str,
     remote_output_path: str,
     local_output_path: str,
     for_debug: bool = False
@@ -265,8 +333,7 @@ def fetch_background_output(
     """
     Retrieves output of background command via SCP.
     """
-    scp_cmd = f"scp {user}@{dut}:{remote_output_path} {local_output_path}"
     if for_debug:
-        print(f"[DEBUG] fetch_background_output on {dut}: {scp_cmd}")
-    ret = subprocess.call(scp_cmd, shell=True)
+        print(f"[DEBUG] fetch_background_output on {dut}: {remote_output_path} -> {local_output_path}")
+    ret = scp_pull(dut, user, remote_output_path, local_output_path)
     return ret == 0